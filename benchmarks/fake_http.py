@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A local stand-in for the web servers that host GIFs, used by the tests and benchmarks.
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Set, Text  # pylint: disable=unused-import
+
+
+class FakeGifServer:
+    """
+    A local HTTP server that serves a tiny GIF at every path, except for the paths in ``dead``
+    (which are missing) and ``failing`` (which get server errors). Paths starting with
+    ``/nohead/`` don't allow HEAD requests, and every GIF has an ETag so that conditional requests
+    are answered with "304 Not Modified".
+    """
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.server.fake.record("connections")
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, status: int, etag: Text = "") -> None:
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_HEAD(self):  # pylint: disable=invalid-name
+            fake = self.server.fake
+            fake.record("HEAD")
+            if fake.latency:
+                time.sleep(fake.latency)
+            if self.path.startswith("/nohead/"):
+                return self._respond(405)
+            return self._gif()
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            self.server.fake.record("GET")
+            return self._gif(partial="Range" in self.headers)
+
+        def _gif(self, partial: bool = False) -> None:
+            if self.path in self.server.fake.dead:
+                return self._respond(404)
+            if self.path in self.server.fake.failing:
+                return self._respond(503)
+            etag = '"{}"'.format(hashlib.md5(self.path.encode("utf-8")).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                self.server.fake.record("not_modified")
+                return self._respond(304, etag)
+            return self._respond(206 if partial else 200, etag)
+
+    def __init__(self, latency: float = 0.) -> None:
+        """
+        :param latency: A delay added to every HEAD request, in seconds
+        """
+        self.latency = latency
+        self.dead = set()  # type: Set[Text]
+        self.failing = set()  # type: Set[Text]
+        self.counts = Counter()  # type: Counter
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, path: Text) -> Text:
+        """ Gets the URL of a path on the server """
+        host, port = self._server.server_address
+        return "http://{}:{}{}".format(host, port, path)
+
+    def record(self, event: Text) -> None:
+        """ Counts a connection or request """
+        with self._lock:
+            self.counts[event] += 1
+
+    def start(self) -> "FakeGifServer":
+        """ Starts serving on a background thread """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """ Stops the server """
+        self._server.shutdown()
+        self._server.server_close()
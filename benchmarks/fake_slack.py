@@ -0,0 +1,227 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Local stand-ins for the Slack services, used by the tests and benchmarks.
+
+``FakeSlackServer`` is a minimal RTM websocket server that pushes events to connected clients, and
+``FakeSlackClient`` is a ``SlackClient`` that connects to it rather than to Slack, while recording
+(rather than sending) any Web API calls.
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Text  # pylint: disable=unused-import
+
+from slackclient import SlackClient
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+DEFAULT_MEMBERS = [
+    {"name": "test_bot_name", "id": "test_bot_id"},
+    {"name": "test_owner_name", "id": "test_owner_id"}
+]
+
+
+def encode_text_frame(text: Text) -> bytes:
+    """ Encodes an unmasked (server to client) websocket text frame """
+    payload = text.encode("utf-8")
+    if len(payload) < 126:
+        header = bytes((0x81, len(payload)))
+    elif len(payload) < 2 ** 16:
+        header = bytes((0x81, 126)) + len(payload).to_bytes(2, "big")
+    else:
+        header = bytes((0x81, 127)) + len(payload).to_bytes(8, "big")
+    return header + payload
+
+
+class FakeSlackServer:
+    """ A local websocket server that imitates the Slack RTM API """
+
+    class _Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            request = b""
+            while b"\r\n\r\n" not in request:
+                chunk = self.request.recv(4096)
+                if not chunk:
+                    return
+                request += chunk
+
+            headers = {}
+            for line in request.decode("latin-1").split("\r\n")[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+            accept = base64.b64encode(hashlib.sha1(
+                (headers["sec-websocket-key"] + WEBSOCKET_GUID).encode("ascii")).digest())
+            self.request.sendall(b"HTTP/1.1 101 Switching Protocols\r\n"
+                                 b"Upgrade: websocket\r\n"
+                                 b"Connection: Upgrade\r\n"
+                                 b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+            self.server.fake.register(self.request)
+            # Discard anything the client sends until it disconnects
+            try:
+                while self.request.recv(4096):
+                    pass
+            except OSError:
+                pass
+            finally:
+                self.server.fake.unregister(self.request)
+
+    def __init__(self) -> None:
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._connections = []  # type: List[socket.socket]
+        self._lock = threading.Condition()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> Text:
+        """ The websocket URL that clients should connect to """
+        host, port = self._server.server_address
+        return "ws://{}:{}/".format(host, port)
+
+    def start(self) -> "FakeSlackServer":
+        """ Starts serving on a background thread """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """ Disconnects all clients and stops the server """
+        self.disconnect_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def register(self, connection: socket.socket) -> None:
+        """ Records a newly connected client """
+        with self._lock:
+            self._connections.append(connection)
+            self._lock.notify_all()
+
+    def unregister(self, connection: socket.socket) -> None:
+        """ Forgets about a disconnected client """
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def wait_for_clients(self, count: int = 1, timeout: float = 5.) -> bool:
+        """ Waits until at least ``count`` clients are connected """
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self._connections) >= count, timeout)
+
+    def send_event(self, event: Dict[Text, Any]) -> None:
+        """ Pushes an RTM event to every connected client """
+        frame = encode_text_frame(json.dumps(event))
+        with self._lock:
+            for connection in self._connections:
+                connection.sendall(frame)
+
+    def disconnect_all(self) -> None:
+        """ Drops every connected client """
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._connections = []
+
+
+class FakeSlackClient(SlackClient):
+    """
+    A ``SlackClient`` that connects its RTM websocket to a ``FakeSlackServer``, and records Web API
+    calls rather than sending them to Slack
+    """
+
+    def __init__(self, token: Text, server: Optional[FakeSlackServer] = None,
+                 members: Optional[List[Dict[Text, Text]]] = None, api_latency: float = 0.,
+                 api_handler: Optional[Callable[..., Optional[Dict]]] = None) -> None:
+        """
+        :param token: The (unused) Slack token
+        :param server: The fake server to connect to when ``rtm_connect`` is called
+        :param members: The workspace members returned by ``users.list``
+        :param api_latency: A delay added to every Web API call, in seconds
+        :param api_handler: A function called with every Web API call, which can return a custom
+                            response
+        """
+        super().__init__(token)
+        self.fake_server = server
+        self.members = members if members is not None else DEFAULT_MEMBERS
+        self.api_latency = api_latency
+        self.api_handler = api_handler
+        self.calls = []  # type: List[Any]
+        self.call_times = []  # type: List[float]
+        self._calls_lock = threading.Lock()
+
+    def rtm_connect(self) -> bool:
+        if self.fake_server is None:
+            return False
+        try:
+            self.server.connect_slack_websocket(self.fake_server.url)
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    def rtm_read(self) -> List[Dict]:
+        # Reading from the real (SSL) websocket returns nothing when there is no data available,
+        # whereas the plain socket used here raises instead
+        try:
+            return super().rtm_read()
+        except BlockingIOError:
+            return []
+
+    def api_call(self, method: Text, timeout: Optional[float] = None, **kwargs) -> Dict:
+        if self.api_latency:
+            time.sleep(self.api_latency)
+        with self._calls_lock:
+            self.calls.append((method, kwargs))
+            self.call_times.append(time.perf_counter())
+
+        if self.api_handler is not None:
+            response = self.api_handler(method, **kwargs)
+            if response is not None:
+                return response
+        if method == "users.list":
+            return {"ok": True, "members": self.members}
+        return {"ok": True}
+
+    def calls_to(self, method: Text) -> List[Dict]:
+        """ Gets the arguments of all recorded calls to a Web API method """
+        with self._calls_lock:
+            return [kwargs for call_method, kwargs in self.calls if call_method == method]
+
+    def wait_for_calls(self, method: Text, count: int, timeout: float = 5.) -> bool:
+        """ Waits until at least ``count`` calls have been made to a Web API method """
+        deadline = time.monotonic() + timeout
+        while len(self.calls_to(method)) < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
@@ -0,0 +1,57 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures how many GIF URLs the ``LinkChecker`` can check per second against a local stand-in for
+the GIF hosts, for a few levels of concurrency.
+
+Usage: ``python -m benchmarks.link_check [num_urls] [latency_ms]``
+"""
+
+import sys
+
+from benchmarks.fake_http import FakeGifServer
+from gif_bot.links import LinkChecker, LinkHealth
+
+CONCURRENCIES = (1, 8, 32, 128)
+
+
+def _main() -> None:
+    num_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) / 1000. if len(sys.argv) > 2 else 5 / 1000.
+
+    server = FakeGifServer(latency=latency).start()
+    try:
+        urls = [server.url("/{}.gif".format(i)) for i in range(num_urls)]
+        print("{} URLs, {:.0f} ms per check".format(num_urls, latency * 1000.))
+        print("{:>12} {:>12} {:>12}".format("concurrency", "URLs/s", "connections"))
+        for concurrency in CONCURRENCIES:
+            server.counts.clear()
+            report = LinkChecker(LinkHealth(), concurrency=concurrency).check(urls)
+            print("{:>12} {:>12.0f} {:>12}".format(concurrency, report.urls_per_second,
+                                                   server.counts["connections"]))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures how long the message handlers spend logging, with several threads logging at once, for
+each of the ways the bot's log can be written: synchronously or in the background, as text or
+JSON, and with or without sampling INFO records.
+
+Usage: ``python -m benchmarks.log_latency [records_per_thread] [threads]``
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List  # pylint: disable=unused-import
+
+from gif_bot.gif_bot import GifBot
+from gif_bot.logs import correlation
+
+MODES = {
+    # Mode name: (background, structured, sample_rate)
+    "sync": (False, False, 1.),
+    "sync+json": (False, True, 1.),
+    "background": (True, False, 1.),
+    "background+json": (True, True, 1.),
+    "background+json@10%": (True, True, 0.1),
+}
+
+
+def measure(mode: str, records_per_thread: int, num_threads: int) -> Dict[str, float]:
+    """
+    Logs the records that handling a trigger does, from several threads at once
+    :param mode: One of the keys of ``MODES``
+    :param records_per_thread: The number of triggers each thread logs
+    :param num_threads: The number of threads logging at once
+    :return: The p50, p99 and max time taken by each call to the logger, the number of records
+             logged per second, and how long it then took for every record to be written
+    """
+    background, structured, sample_rate = MODES[mode]
+    latencies = []  # type: List[float]
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_loc = os.path.join(directory, "bot.log")
+        log = GifBot._init_log(log_loc, background, structured, sample_rate)
+
+        def _log_triggers(thread: int) -> None:
+            thread_latencies = []
+            for i in range(records_per_thread):
+                with correlation("C{}:{}".format(thread, i)):
+                    start = time.perf_counter()
+                    log.info("Retrieving gif of type %s", "all")
+                    log.info("Adding reaction [%s] to message [ts:%s]", "heart", i)
+                    thread_latencies.append((time.perf_counter() - start) / 2)
+            latencies.extend(thread_latencies)
+
+        threads = [threading.Thread(target=_log_triggers, args=(thread,))
+                   for thread in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        handler = next(handler for handler in log.handlers
+                       if getattr(handler, "log_key", (None,))[0] == log_loc)
+        start = time.perf_counter()
+        handler.flush()
+        drain = time.perf_counter() - start
+        log.removeHandler(handler)
+        handler.close()
+
+    latencies.sort()
+    return {"p50_us": latencies[len(latencies) // 2] * 1e6,
+            "p99_us": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1e6,
+            "max_us": latencies[-1] * 1e6,
+            "records_per_s": len(latencies) * 2 / elapsed,
+            "drain_ms": drain * 1000.}
+
+
+def _main() -> None:
+    records_per_thread = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    num_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    print("{} threads, {} triggers each".format(num_threads, records_per_thread))
+    print("{:>20} {:>10} {:>10} {:>10} {:>12} {:>10}".format(
+        "mode", "p50 us", "p99 us", "max us", "records/s", "drain ms"))
+    for mode in MODES:
+        stats = measure(mode, records_per_thread, num_threads)
+        print("{:>20} {:>10.1f} {:>10.1f} {:>10.0f} {:>12.0f} {:>10.0f}".format(
+            mode, stats["p50_us"], stats["p99_us"], stats["max_us"], stats["records_per_s"],
+            stats["drain_ms"]))
+
+
+if __name__ == "__main__":
+    _main()
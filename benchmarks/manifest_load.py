@@ -0,0 +1,88 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Compares loading a manifest file by reading all of its text up front (as the bot originally did)
+against streaming it into the ``GifStore`` one line at a time.
+
+Usage: ``python -m benchmarks.manifest_load [num_lines]``
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict  # pylint: disable=unused-import
+
+from benchmarks.synthetic import generate_manifest_lines
+from gif_bot.gif_store import GifStore
+
+
+def load_text(filename: str) -> GifStore:
+    """ Reads the whole manifest, and then parses it """
+    with open(filename) as manifest_file:
+        return GifStore(manifest_data=manifest_file.read(), compact=True)
+
+
+def load_stream(filename: str) -> GifStore:
+    """ Streams the manifest into the store """
+    with open(filename, newline="") as manifest_file:
+        return GifStore(manifest_data=manifest_file, compact=True)
+
+
+def measure(loader, filename: str) -> Dict[str, float]:
+    """ Measures the time taken and memory used by a loader """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = loader(filename)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return {"seconds": elapsed, "retained": retained, "peak": peak}
+
+
+def _main() -> None:
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "manifest.csv")
+        with open(filename, "w") as manifest_file:
+            for line in generate_manifest_lines(num_lines):
+                manifest_file.write(line + "\n")
+        print("Manifest: {} lines, {:.1f} MiB".format(num_lines,
+                                                      os.path.getsize(filename) / 2 ** 20))
+
+        print("{:>8} {:>10} {:>14} {:>10} {:>16}".format("loader", "seconds", "retained MiB",
+                                                         "peak MiB", "overhead MiB"))
+        for name, loader in (("text", load_text), ("stream", load_stream)):
+            result = measure(loader, filename)
+            print("{:>8} {:>10.2f} {:>14.1f} {:>10.1f} {:>16.1f}".format(
+                name, result["seconds"], result["retained"] / 2 ** 20, result["peak"] / 2 ** 20,
+                (result["peak"] - result["retained"]) / 2 ** 20))
+
+
+if __name__ == "__main__":
+    _main()
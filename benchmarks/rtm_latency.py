@@ -0,0 +1,118 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Measures the latency between a trigger message arriving over the RTM websocket and the bot's
+reaction, for both the polling ``GifBot.run`` loop and the event-driven ``AsyncRunner``.
+
+Usage: ``python -m benchmarks.rtm_latency [num_messages]``
+"""
+
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from os import path
+from typing import Callable, Dict, List, Tuple  # pylint: disable=unused-import
+from unittest.mock import patch
+
+from benchmarks.fake_slack import FakeSlackClient, FakeSlackServer
+from benchmarks.synthetic import generate_manifest_lines, write_bot_config
+from gif_bot.async_runner import AsyncRunner
+from gif_bot.gif_bot import GifBot
+
+API_LATENCY = 0.02
+MESSAGE_INTERVAL = 0.01
+NUM_CHANNELS = 8
+
+
+MODES = {
+    # Mode name: (use AsyncRunner, number of API dispatcher workers)
+    "polling": (False, 0),
+    "async": (True, 0),
+    "async+api": (True, 4),
+}
+
+
+def make_bot(directory: str, client: FakeSlackClient, api_workers: int = 0) -> GifBot:
+    """ Creates a bot that talks to the provided fake client """
+    config_loc = write_bot_config(directory, generate_manifest_lines(1000), triggers=["help"],
+                                  api_workers=str(api_workers))
+    with patch("gif_bot.gif_bot.SlackClient", lambda _: client):
+        return GifBot(config_loc, path.join(directory, "bot.log"))
+
+
+def measure(mode: str, num_messages: int) -> Tuple[List[float], float]:
+    """
+    Sends trigger messages to a bot through a fake RTM server
+    :param mode: One of the keys of ``MODES``
+    :param num_messages: The number of messages to send
+    :return: The latency of each message, and the total time taken to handle every message
+    """
+    server = FakeSlackServer().start()
+    client = FakeSlackClient("UNUSED", server, api_latency=API_LATENCY)
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_async, api_workers = MODES[mode]
+        bot = make_bot(directory, client, api_workers)
+        runner = AsyncRunner(bot) if use_async else bot
+        thread = threading.Thread(target=runner.run, daemon=True)
+        thread.start()
+        server.wait_for_clients()
+
+        sent = {}  # type: Dict[str, float]
+        start = time.perf_counter()
+        for i in range(num_messages):
+            sent[str(i)] = time.perf_counter()
+            server.send_event({"type": "message", "user": "someone", "text": "help me",
+                               "channel": "C{}".format(i % NUM_CHANNELS), "ts": str(i)})
+            time.sleep(MESSAGE_INTERVAL)
+        client.wait_for_calls("reactions.add", num_messages, timeout=60.)
+        total = time.perf_counter() - start
+
+        runner.stop()
+        server.stop()
+        thread.join()
+
+    latencies = [when - sent[kwargs["timestamp"]]
+                 for (method, kwargs), when in zip(client.calls, client.call_times)
+                 if method == "reactions.add"]
+    return latencies, total
+
+
+def _main() -> None:
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print("{:>10} {:>10} {:>10} {:>10} {:>12}".format("mode", "p50 ms", "p99 ms", "max ms",
+                                                     "msgs/s"))
+    for mode in MODES:
+        latencies, total = measure(mode, num_messages)
+        latencies.sort()
+        print("{:>10} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.1f}".format(
+            mode, statistics.median(latencies) * 1000,
+            latencies[int(0.99 * (len(latencies) - 1))] * 1000, latencies[-1] * 1000,
+            len(latencies) / total))
+
+
+if __name__ == "__main__":
+    _main()
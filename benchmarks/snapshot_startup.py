@@ -0,0 +1,113 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Compares starting up from a CSV manifest against starting up from a memory-mapped snapshot of it.
+Each start-up runs in a fresh process, so that the peak memory use (RSS) of each can be compared.
+
+Usage: ``python -m benchmarks.snapshot_startup [num_lines]``
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict  # pylint: disable=unused-import
+
+from benchmarks.synthetic import generate_manifest_lines
+from gif_bot.gif_store import GifStore
+from gif_bot.snapshot import Fingerprint, SnapshotStore, write_snapshot
+
+QUERIES = 1000
+
+
+def _child(mode: str, filename: str) -> None:
+    """ Starts up from a manifest or snapshot, runs some queries, and reports the cost as JSON """
+    start = time.perf_counter()
+    if mode == "csv":
+        with open(filename, newline="") as manifest_file:
+            store = GifStore(manifest_data=manifest_file, compact=True)
+    else:
+        store = SnapshotStore(filename)
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(QUERIES):
+        store.get_gif("tag{}".format(i % 100))
+    query = (time.perf_counter() - start) / QUERIES
+
+    print(json.dumps({"startup": startup, "query": query, "max_rss": peak_rss()}))
+
+
+def peak_rss() -> int:
+    """ Gets the peak resident memory of this process, in KiB """
+    # ru_maxrss survives exec on Linux, so would include the parent's memory; prefer VmHWM
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode: str, filename: str) -> Dict[str, float]:
+    """ Measures starting up in a separate process """
+    output = subprocess.check_output([sys.executable, "-m", "benchmarks.snapshot_startup",
+                                      "--child", mode, filename])
+    return json.loads(output.decode("utf-8"))
+
+
+def _main() -> None:
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        _child(sys.argv[2], sys.argv[3])
+        return
+
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        manifest_loc = os.path.join(directory, "manifest.csv")
+        snapshot_loc = os.path.join(directory, "manifest.snap")
+        with open(manifest_loc, "w") as manifest_file:
+            for line in generate_manifest_lines(num_lines):
+                manifest_file.write(line + "\n")
+        with open(manifest_loc, newline="") as manifest_file:
+            start = time.perf_counter()
+            write_snapshot(GifStore(manifest_data=manifest_file, compact=True), snapshot_loc,
+                           Fingerprint(0, 0, 0))
+        print("Manifest: {} lines, {:.1f} MiB; snapshot: {:.1f} MiB, built in {:.2f}s".format(
+            num_lines, os.path.getsize(manifest_loc) / 2 ** 20,
+            os.path.getsize(snapshot_loc) / 2 ** 20, time.perf_counter() - start))
+
+        print("{:>9} {:>12} {:>12} {:>12}".format("source", "startup s", "query us", "max RSS MiB"))
+        for mode, filename in (("csv", manifest_loc), ("snapshot", snapshot_loc)):
+            result = measure(mode, filename)
+            print("{:>9} {:>12.3f} {:>12.1f} {:>12.1f}".format(
+                mode, result["startup"], result["query"] * 1e6, result["max_rss"] / 2 ** 10))
+
+
+if __name__ == "__main__":
+    _main()
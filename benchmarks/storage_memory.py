@@ -0,0 +1,67 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Compares the memory used by the object-per-GIF and compact ``GifStore`` storage backends.
+
+Usage: ``python -m benchmarks.storage_memory [count ...]``
+"""
+
+import gc
+import sys
+import tracemalloc
+from typing import Tuple
+
+from benchmarks.synthetic import generate_manifest
+from gif_bot.gif_store import GifStore
+
+
+def measure(manifest_data: str, compact: bool) -> Tuple[int, int]:
+    """
+    Builds a store from the provided manifest
+    :return: The memory retained by the store and the peak memory used while building it, in bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    store = GifStore(manifest_data=manifest_data, compact=compact)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return retained, peak
+
+
+def _main() -> None:
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print("{:>10} {:>8} {:>14} {:>14} {:>12}".format("gifs", "mode", "retained MiB",
+                                                     "peak MiB", "bytes/gif"))
+    for count in counts:
+        manifest_data = generate_manifest(count)
+        for compact in (False, True):
+            retained, peak = measure(manifest_data, compact)
+            print("{:>10} {:>8} {:>14.1f} {:>14.1f} {:>12.0f}".format(
+                count, "compact" if compact else "object", retained / 2 ** 20, peak / 2 ** 20,
+                retained / count))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,222 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measures the throughput, latency and memory use of the GIF store and of the message dispatch path
+(``GifBot.handle``) for synthetic manifests of increasing size, with tags drawn from a Zipfian
+distribution. Each manifest size is measured in a fresh process that talks to an in-process fake
+``SlackClient``, and the results can be saved as JSON and compared with those of another commit.
+
+Usage: ``python -m benchmarks.suite [--sizes 1000,100000] [--messages N] [--replay events.jsonl]
+[--setting key=value ...] [--output results.json] [--compare baseline.json]``
+
+A replayed stream is a file of RTM events, one JSON object per line, which are handled in place of
+the synthetic messages.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Text  # pylint: disable=unused-import
+from unittest.mock import patch
+
+from benchmarks.fake_slack import FakeSlackClient
+from benchmarks.snapshot_startup import peak_rss
+from benchmarks.synthetic import generate_manifest_lines, generate_messages, write_bot_config
+from benchmarks.synthetic import zipf_weights
+from gif_bot.gif_bot import GifBot
+
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+NUM_TAGS = 1000
+ZIPF_EXPONENT = 1.1
+STORE_OPERATIONS = 10000
+SEED = 0
+
+# API calls are made on the handling thread so that they are included in the dispatch latency, and
+# rate limited calls are dropped rather than waited for, so that Slack's limits aren't measured
+BOT_SETTINGS = {"api_workers": "0", "rate_limit_policy": "drop"}
+
+
+def summarise(latencies: List[float], total: float) -> Dict[Text, float]:
+    """
+    Summarises the latencies of a set of operations
+    :param latencies: The time taken by each operation, in seconds
+    :param total: The total time taken by the operations, in seconds
+    """
+    latencies = sorted(latencies)
+    return {"ops_per_s": len(latencies) / total if total else 0.,
+            "p50_us": latencies[len(latencies) // 2] * 1e6,
+            "p99_us": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1e6}
+
+
+def time_calls(function: Callable, arguments: List[Any]) -> Dict[Text, float]:
+    """ Times calling a function with each of a list of arguments """
+    latencies = []
+    clock = time.perf_counter
+    start = clock()
+    for argument in arguments:
+        call_start = clock()
+        function(argument)
+        latencies.append(clock() - call_start)
+    return summarise(latencies, clock() - start)
+
+
+def _child(size: int, num_messages: int, replay: Optional[Text],
+           settings: Dict[Text, Text]) -> None:
+    """ Measures a bot with a manifest of the given size, and reports the results as JSON """
+    results = {}  # type: Dict[Text, Any]
+    with tempfile.TemporaryDirectory() as directory:
+        config_loc = write_bot_config(directory,
+                                      generate_manifest_lines(size, num_tags=NUM_TAGS, seed=SEED,
+                                                              zipf=ZIPF_EXPONENT),
+                                      triggers=["help"], **dict(BOT_SETTINGS, **settings))
+        client = FakeSlackClient("UNUSED")
+        start = time.perf_counter()
+        with patch("gif_bot.gif_bot.SlackClient", lambda _: client):
+            bot = GifBot(config_loc, os.path.join(directory, "bot.log"))
+        results["load_s"] = time.perf_counter() - start
+        results["loaded_rss_kib"] = peak_rss()
+
+        rng = random.Random(SEED)
+        tags = ["tag{}".format(i) for i in range(NUM_TAGS)]
+        cum_weights = zipf_weights(NUM_TAGS, ZIPF_EXPONENT)
+        requests = rng.choices(tags, cum_weights=cum_weights, k=STORE_OPERATIONS)
+        pairs = ["+".join(rng.choices(tags, cum_weights=cum_weights, k=2))
+                 for _ in range(STORE_OPERATIONS)]
+        store = bot.store
+        results["get_gif"] = time_calls(store.get_gif, requests)
+        results["get_gif_and"] = time_calls(store.get_gif, pairs)
+        results["get_gif_all"] = time_calls(store.get_gif, ["all"] * STORE_OPERATIONS)
+        results["get_count"] = time_calls(store.get_count, requests)
+        results["get_info"] = time_calls(lambda _: store.get_info(max_tags=10), range(100))
+
+        if replay is not None:
+            with open(replay) as replay_file:
+                messages = [json.loads(line) for line in replay_file if line.strip()]
+        else:
+            messages = list(generate_messages(num_messages, num_tags=NUM_TAGS, seed=SEED,
+                                              zipf=ZIPF_EXPONENT))
+        # Each message is handled on its own, as they would arrive from the RTM API
+        results["dispatch"] = time_calls(lambda message: bot.handle([message]), messages)
+        results["api_calls"] = len(client.calls)
+        results["peak_rss_kib"] = peak_rss()
+        bot.stop()
+    print(json.dumps(results))
+
+
+def measure(size: int, num_messages: int, replay: Optional[Text],
+            settings: Dict[Text, Text]) -> Dict[Text, Any]:
+    """ Measures a bot with a manifest of the given size in a separate process """
+    command = [sys.executable, "-m", "benchmarks.suite", "--child", str(size),
+               "--messages", str(num_messages)]
+    if replay is not None:
+        command += ["--replay", replay]
+    for key, value in settings.items():
+        command += ["--setting", "{}={}".format(key, value)]
+    return json.loads(subprocess.check_output(command).decode("utf-8").splitlines()[-1])
+
+
+def describe_commit() -> Text:
+    """ Gets the commit being measured, so that saved results can be told apart """
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(run: Dict[Text, Any], baseline: Optional[Dict[Text, Any]] = None) -> None:
+    """ Prints a table of results, with the change from a baseline run if one is given """
+    header = "{:>9} {:>12} {:>12} {:>10} {:>10}".format("size", "operation", "ops/s", "p50 us",
+                                                         "p99 us")
+    if baseline is not None:
+        header += " {:>9} {:>9}".format("ops/s x", "p99 x")
+    print(header)
+    for size, results in run["results"].items():
+        base = baseline["results"].get(size) if baseline is not None else None
+        for operation, stats in results.items():
+            if not isinstance(stats, dict):
+                continue
+            line = "{:>9} {:>12} {:>12.0f} {:>10.1f} {:>10.1f}".format(
+                size, operation, stats["ops_per_s"], stats["p50_us"], stats["p99_us"])
+            if base is not None and operation in base:
+                line += " {:>9.2f} {:>9.2f}".format(
+                    stats["ops_per_s"] / base[operation]["ops_per_s"],
+                    stats["p99_us"] / base[operation]["p99_us"])
+            print(line)
+        print("{:>9} loaded in {:.2f}s, {:.1f} MiB after loading, {:.1f} MiB peak".format(
+            size, results["load_s"], results["loaded_rss_kib"] / 2 ** 10,
+            results["peak_rss_kib"] / 2 ** 10))
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated manifest sizes (e.g. 1e3,1e7)")
+    parser.add_argument("--messages", type=int, default=10000,
+                        help="The number of synthetic messages to handle")
+    parser.add_argument("--replay", help="A file of RTM events to handle, one JSON object per line")
+    parser.add_argument("--setting", action="append", default=[],
+                        help="An extra bot config setting, as key=value")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results with those saved in this file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _main() -> None:
+    args = _parse_args()
+    settings = dict(setting.split("=", 1) for setting in args.setting)
+    if args.child is not None:
+        _child(args.child, args.messages, args.replay, settings)
+        return
+
+    run = {"commit": describe_commit(), "python": platform.python_version(),
+           "parameters": {"messages": args.messages, "replay": args.replay, "settings": settings,
+                          "num_tags": NUM_TAGS, "zipf": ZIPF_EXPONENT,
+                          "store_operations": STORE_OPERATIONS, "seed": SEED},
+           "results": {}}  # type: Dict[Text, Any]
+    for size in (int(float(size)) for size in args.sizes.split(",")):
+        run["results"][str(size)] = measure(size, args.messages, args.replay, settings)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print("Commit {} compared with {}".format(run["commit"], baseline["commit"]))
+        if baseline["parameters"] != run["parameters"]:
+            print("Warning: the baseline was measured with different parameters")
+    print_results(run, baseline)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(run, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    _main()
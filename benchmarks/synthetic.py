@@ -0,0 +1,151 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Synthetic data generators for the benchmarks
+"""
+
+import itertools
+import os
+import random
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Text
+
+CONFIG_TEMPLATE = '''bot_name = test_bot_name
+bot_owner = test_owner_name
+manifest_loc = {manifest_loc}
+slack_token = UNUSED
+greetings = """
+    Here you go, {{}}!
+"""
+nouns = """
+    friend
+"""
+adjectives = """
+    wonderful
+"""
+triggers = """
+    {triggers}
+"""
+reactions = """
+    heart
+"""
+'''
+
+
+def zipf_weights(count: int, exponent: float) -> List[float]:
+    """
+    Gets the cumulative weights of a Zipfian distribution, for use with ``random.choices``
+    :param count: The number of ranks
+    :param exponent: The exponent of the distribution (0 gives a uniform distribution)
+    """
+    return list(itertools.accumulate(1. / rank ** exponent for rank in range(1, count + 1)))
+
+
+def generate_manifest_lines(count: int, num_tags: int = 1000, tags_per_gif: int = 3,
+                            seed: int = 0, zipf: float = 0.) -> Iterator[Text]:
+    """
+    Generates lines of a synthetic manifest file
+    :param count: The number of GIFs in the manifest
+    :param num_tags: The number of distinct tags to draw from
+    :param tags_per_gif: The number of tags given to each GIF
+    :param seed: The random seed, so that runs are reproducible
+    :param zipf: The exponent of the Zipfian distribution that tags are drawn from, so that "tag0"
+                 is the most common tag, or 0 to draw them uniformly
+    """
+    rng = random.Random(seed)
+    tags = ["tag{}".format(i) for i in range(num_tags)]
+    cum_weights = zipf_weights(num_tags, zipf) if zipf else None
+    for i in range(count):
+        if cum_weights is None:
+            gif_tags = rng.sample(tags, tags_per_gif)
+        else:
+            gif_tags = []
+            while len(gif_tags) < tags_per_gif:
+                tag = rng.choices(tags, cum_weights=cum_weights)[0]
+                if tag not in gif_tags:
+                    gif_tags.append(tag)
+        yield "https://media.example.com/{}/{:x}.gif,{}".format(
+            i % 97, rng.getrandbits(64), ",".join(gif_tags))
+
+
+def generate_manifest(count: int, **kwargs) -> Text:
+    """ Generates the text of a synthetic manifest file (see ``generate_manifest_lines``) """
+    return "\n".join(generate_manifest_lines(count, **kwargs))
+
+
+def write_bot_config(directory: Text, manifest_lines: Iterable[Text],
+                     triggers: Iterable[Text] = ("help",), **extra_settings: Text) -> Text:
+    """
+    Writes a bot config file, and the manifest file that it refers to
+    :param directory: The directory to write the files into
+    :param manifest_lines: The lines of the manifest file
+    :param triggers: The bot's trigger words
+    :param extra_settings: Any additional config settings
+    :return: The path of the config file
+    """
+    manifest_loc = os.path.join(directory, "manifest.csv")
+    with open(manifest_loc, "w") as manifest_file:
+        for line in manifest_lines:
+            manifest_file.write(line + "\n")
+
+    config_loc = os.path.join(directory, "bot.config")
+    with open(config_loc, "w") as config_file:
+        config_file.write(CONFIG_TEMPLATE.format(manifest_loc=manifest_loc,
+                                                 triggers="\n    ".join(triggers)))
+        for key, value in extra_settings.items():
+            config_file.write("{} = {}\n".format(key, value))
+    return config_loc
+
+
+def generate_messages(count: int, num_tags: int = 1000, num_channels: int = 20, seed: int = 0,
+                      zipf: float = 1., bot_name: Text = "test_bot_name",
+                      mix: Sequence[float] = (0.7, 0.1, 0.15, 0.05)) -> Iterator[Dict[Text, Any]]:
+    """
+    Generates a stream of synthetic RTM message events for a bot created with ``write_bot_config``
+    :param count: The number of messages
+    :param num_tags: The number of distinct tags that requests are drawn from
+    :param num_channels: The number of channels that messages are posted in
+    :param seed: The random seed, so that runs are reproducible
+    :param zipf: The exponent of the Zipfian distribution that requested tags are drawn from
+    :param bot_name: The name of the bot, used to mention it
+    :param mix: The fractions of messages that are chatter, triggers ("help"), requests for a tag
+                and requests for a combination of tags
+    """
+    rng = random.Random(seed)
+    tags = ["tag{}".format(i) for i in range(num_tags)]
+    cum_weights = zipf_weights(num_tags, zipf)
+    kinds = list(itertools.accumulate(mix))
+    for i in range(count):
+        kind = rng.random() * kinds[-1]
+        if kind < kinds[0]:
+            text = "just some chatter number {}".format(i)
+        elif kind < kinds[1]:
+            text = "can someone help me out?"
+        elif kind < kinds[2]:
+            text = "@{} request {}".format(bot_name, rng.choices(tags, cum_weights=cum_weights)[0])
+        else:
+            pair = rng.choices(tags, cum_weights=cum_weights, k=2)
+            text = "@{} request {}".format(bot_name, "+".join(pair))
+        yield {"type": "message", "user": "U{:04d}".format(rng.randrange(500)),
+               "channel": "C{:04d}".format(rng.randrange(num_channels)), "text": text,
+               "ts": "{}.{:06d}".format(1500000000 + i, i % 1000000)}
@@ -0,0 +1,77 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Compares ``TriggerMatcher`` against the original loop of per-trigger substring searches.
+
+Usage: ``python -m benchmarks.trigger_matching [num_triggers ...]``
+"""
+
+import random
+import sys
+import timeit
+from typing import List, Text
+
+from gif_bot.matcher import TriggerMatcher
+
+NUM_MESSAGES = 1000
+
+
+def loop_is_trigger(triggers: List[Text], message: Text) -> bool:
+    """ The original implementation of ``GifBot.is_trigger`` """
+    for trigger in triggers:
+        if trigger.lower() in message.lower():
+            return True
+    return False
+
+
+def make_words(count: int, rng: random.Random) -> List[Text]:
+    """ Generates random lower-case words """
+    return ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+            for _ in range(count)]
+
+
+def _main() -> None:
+    rng = random.Random(0)
+    vocabulary = make_words(5000, rng)
+    messages = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 40)))
+                for _ in range(NUM_MESSAGES)]
+
+    print("{:>10} {:>14} {:>14} {:>10}".format("triggers", "loop us/msg", "matcher us/msg",
+                                               "speedup"))
+    for num_triggers in [int(arg) for arg in sys.argv[1:]] or [3, 30, 300, 3000]:
+        triggers = make_words(num_triggers, rng)
+        matcher = TriggerMatcher(triggers)
+        assert all(matcher.matches(m) == loop_is_trigger(triggers, m) for m in messages)
+
+        loop_time = min(timeit.repeat(lambda: [loop_is_trigger(triggers, m) for m in messages],
+                                      number=1, repeat=3))
+        matcher_time = min(timeit.repeat(lambda: [matcher.matches(m) for m in messages],
+                                         number=1, repeat=3))
+        print("{:>10} {:>14.2f} {:>14.2f} {:>9.1f}x".format(
+            num_triggers, loop_time / NUM_MESSAGES * 1e6, matcher_time / NUM_MESSAGES * 1e6,
+            loop_time / matcher_time))
+
+
+if __name__ == "__main__":
+    _main()
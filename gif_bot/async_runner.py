@@ -0,0 +1,171 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``AsyncRunner`` class, an event-driven alternative to ``GifBot.run``
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Set  # pylint: disable=unused-import
+
+from gif_bot.gif_bot import ERR_DELAY, MAX_DELAY, GifBot
+
+# The number of messages that can be handled (and so Slack Web API calls made) at the same time
+DEFAULT_WORKERS = 8
+
+
+class AsyncRunner:
+    """
+    Runs a ``GifBot`` on an asyncio event loop. Rather than polling the RTM websocket, the runner
+    waits for its socket to become readable and dispatches each message as soon as it arrives.
+    Messages are handled on a pool of worker threads, so that the (blocking) Slack Web API calls
+    for different messages are made concurrently. Messages from the same channel are handled one
+    at a time, in the order they arrived, so that the bot's replies in a channel stay in order.
+    """
+
+    def __init__(self, bot: GifBot, max_workers: int = DEFAULT_WORKERS) -> None:
+        self.bot = bot
+        self.max_workers = max_workers
+        self.stopped = False
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._readable = None  # type: Optional[asyncio.Event]
+        self._executor = None  # type: Optional[ThreadPoolExecutor]
+        self._tasks = set()  # type: Set[asyncio.Future]
+        # The messages waiting for an earlier message from the same channel to be handled, by
+        # channel. A channel is only present while one of its messages is being handled.
+        self._channels = {}  # type: Dict[Any, Deque[Dict[str, Any]]]
+
+    def run(self) -> None:
+        """
+        Runs the bot until it is stopped. As with ``GifBot.run``, if there's an error connecting to
+        the Slack service then we pause before attempting to connect again.
+        """
+        asyncio.run(self.run_async())
+
+    def stop(self) -> None:
+        """ Stops the runner. This can safely be called from any thread. """
+        self.stopped = True
+        if self._loop is not None and self._readable is not None:
+            self._loop.call_soon_threadsafe(self._readable.set)
+
+    async def run_async(self) -> None:
+        """ Coroutine version of ``run`` """
+        self._loop = asyncio.get_running_loop()
+        self._readable = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="gif_bot")
+        delay = ERR_DELAY
+
+        try:
+            while not self.stopped:
+                try:
+                    connected = await self._loop.run_in_executor(self._executor,
+                                                                 self.bot.client.rtm_connect)
+                    if connected:
+                        self.bot.log.info("Bot connected to Slack RTM API")
+                        await self._read_events()
+                    else:
+                        self.bot.log.error("Bot is unable to connect to the Slack service")
+                except Exception as err:  # pylint: disable=broad-except
+                    self.bot.log.error("Unknown exception encountered.")
+                    self.bot.log.error(repr(err))
+
+                if self.stopped:
+                    break
+
+                # If we cannot connect or we get disconnected, wait for a while before retrying
+                if delay < MAX_DELAY:
+                    self.bot.log.info("Trying again in %s seconds", delay)
+                    await asyncio.sleep(delay)
+                    delay *= 1.1
+                else:
+                    self.bot.log.error("Maximum number of exceptions caught. Exiting...")
+                    return
+        finally:
+            while self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+            self.bot.dispatcher.flush()
+
+    async def _read_events(self) -> None:
+        """ Reads and dispatches RTM events whenever the websocket has data available """
+        socket_fd = self.bot.client.server.websocket.sock.fileno()
+        self._loop.add_reader(socket_fd, self._readable.set)
+        try:
+            while not self.stopped:
+                # Read everything that's available before waiting again, as some of it may
+                # already be buffered by the websocket or SSL layers
+                for message_obj in self._read_available():
+                    self.dispatch(message_obj)
+                await self._readable.wait()
+                self._readable.clear()
+        finally:
+            self._loop.remove_reader(socket_fd)
+
+    def _read_available(self) -> List[Dict[str, Any]]:
+        """ Reads all of the RTM events that can be read without blocking """
+        events = []  # type: List[Dict[str, Any]]
+        while True:
+            try:
+                new_events = self.bot.client.rtm_read()
+            except BlockingIOError:
+                return events
+            if not new_events:
+                return events
+            events.extend(new_events)
+
+    def dispatch(self, message_obj: Dict[str, Any]) -> None:
+        """
+        Starts handling an RTM event on the worker pool
+        :param message_obj: An individual message read from the RTM API
+        """
+        if message_obj.get("type") != "message":
+            return
+        channel = message_obj.get("channel")
+        waiting = self._channels.get(channel)
+        if waiting is not None:
+            waiting.append(message_obj)
+            return
+        self._channels[channel] = deque()
+        self._start(channel, message_obj)
+
+    def _start(self, channel: Any, message_obj: Dict[str, Any]) -> None:
+        """ Handles a message on the worker pool, and then the next message from its channel """
+        task = self._loop.run_in_executor(self._executor, self.bot.handle_message, message_obj)
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._task_done(done, channel))
+
+    def _task_done(self, task: asyncio.Future, channel: Any) -> None:
+        # Callbacks run on the event loop, so the channel queues are only touched from one thread
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.bot.log.error("Exception encountered while handling a message.")
+            self.bot.log.error(repr(task.exception()))
+
+        waiting = self._channels[channel]
+        if waiting:
+            self._start(channel, waiting.popleft())
+        else:
+            del self._channels[channel]
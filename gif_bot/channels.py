@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Implementation of the ``ChannelSettings`` class, which holds the triggers, reactions and tag
+filters used in a channel. Every channel's settings are compiled once when the bot is configured,
+so that handling a message only has to look its channel up.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Text  # pylint: disable=unused-import
+
+from gif_bot.matcher import TriggerMatcher
+from gif_bot.query import compile_query, quote_tag
+from gif_bot.utils import get_config_list
+
+
+class TagFilter:
+    """
+    Restricts the GIFs that queries match to those with at least one of a set of allowed tags (if
+    there are any), and none of a set of blocked tags
+    """
+
+    def __init__(self, allowed: Iterable[Text] = (), blocked: Iterable[Text] = ()) -> None:
+        """
+        :param allowed: The tags that GIFs must have at least one of, or nothing to allow any
+        :param blocked: The tags that GIFs mustn't have
+        :raises QueryError: If any of the tags can't be used in a query
+        """
+        self.allowed = sorted(set(allowed))
+        self.blocked = sorted(set(blocked))
+        # Tags containing operators (e.g. ``thumbs-up``) are quoted
+        allowed_tags = [quote_tag(tag) for tag in self.allowed]
+        blocked_tags = [quote_tag(tag) for tag in self.blocked]
+
+        # Filters are applied by extending the text of each query, so that filtered queries share
+        # the store's caches of plans and counts, and nothing needs rebuilding when it reloads
+        self.suffix = ("+(" + "|".join(allowed_tags) + ")" if allowed_tags else "") + \
+            "".join("-" + tag for tag in blocked_tags)
+
+    def __bool__(self) -> bool:
+        return bool(self.suffix)
+
+    def query(self, query: Text) -> Text:
+        """
+        Restricts a query to the GIFs allowed by the filter
+        :param query: The text of the query
+        :return: The text of the filtered query
+        :raises QueryError: If the query is malformed
+        """
+        # Checking the query on its own first stops unbalanced brackets escaping the filter
+        compile_query(query)
+        return "(" + query + ")" + self.suffix
+
+
+class ChannelSettings:  # pylint: disable=too-few-public-methods
+    """ The compiled settings used to respond to messages in a channel """
+    __slots__ = ("matcher", "reactions", "tag_filter")
+
+    def __init__(self, matcher: TriggerMatcher, reactions: List[Text],
+                 tag_filter: Optional[TagFilter] = None) -> None:
+        """
+        :param matcher: Spots the channel's trigger words
+        :param reactions: The reactions added to messages that GIFs are posted for
+        :param tag_filter: Restricts the GIFs that can be posted, or None to allow any
+        """
+        self.matcher = matcher
+        self.reactions = reactions
+        self.tag_filter = tag_filter if tag_filter else None
+
+    def query(self, query: Text) -> Text:
+        """
+        Restricts a query to the GIFs that can be posted in the channel
+        :raises QueryError: If the query is malformed
+        """
+        return self.tag_filter.query(query) if self.tag_filter is not None else query
+
+
+def compile_channels(sections: Any, defaults: ChannelSettings) -> Dict[Text, ChannelSettings]:
+    """
+    Compiles the per-channel overrides from the config file. Channels can override ``triggers``
+    and ``reactions``, and restrict the GIFs posted with ``allowed_tags`` and ``blocked_tags``,
+    with anything not overridden taken from the defaults.
+    :param sections: The config sections for each channel, keyed by channel ID
+    :param defaults: The settings used in every other channel
+    :return: The settings for each channel with overrides, keyed by channel ID
+    :raises QueryError: If any of the tag filters are malformed
+    """
+    # Channels with the same triggers share a matcher
+    matchers = {frozenset(defaults.matcher.triggers): defaults.matcher}
+    channels = {}  # type: Dict[Text, ChannelSettings]
+    for channel, section in sections.items():
+        matcher = defaults.matcher
+        if "triggers" in section:
+            triggers = frozenset(trigger.lower()
+                                 for trigger in get_config_list(section, "triggers"))
+            matcher = matchers.get(triggers)
+            if matcher is None:
+                matcher = matchers[triggers] = TriggerMatcher(
+                    triggers, word_boundary=defaults.matcher.word_boundary)
+
+        reactions = get_config_list(section, "reactions") if "reactions" in section \
+            else defaults.reactions
+        tag_filter = TagFilter(
+            get_config_list(section, "allowed_tags") if "allowed_tags" in section else (),
+            get_config_list(section, "blocked_tags") if "blocked_tags" in section else ())
+
+        channels[channel] = ChannelSettings(matcher, reactions, tag_filter or defaults.tag_filter)
+    return channels
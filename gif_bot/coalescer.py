@@ -0,0 +1,119 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Implementation of the ``TriggerCoalescer`` class, which collapses bursts of trigger messages in a
+channel into a single GIF.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Text, Tuple  # pylint: disable=unused-import
+
+# The number of channels whose bursts are remembered, with the least recently active forgotten
+MAX_CHANNELS = 10000
+# How long a trigger waits to find out whether its burst's GIF was posted, in seconds
+POST_TIMEOUT = 10.
+
+
+class TriggerCoalescer:
+    """
+    Remembers when each channel was last sent a GIF in response to a trigger, so that any further
+    triggers in the channel within a window of time are only reacted to, rather than each being
+    answered with another GIF.
+    """
+
+    class Burst:  # pylint: disable=too-few-public-methods
+        """ A run of triggers in a channel that are answered by a single GIF """
+        __slots__ = ("started", "success", "_done")
+
+        def __init__(self, started: float) -> None:
+            self.started = started
+            # Whether the GIF was posted, which is None until it is known
+            self.success = None  # type: Optional[bool]
+            self._done = threading.Event()
+
+        def wait(self, timeout: float = POST_TIMEOUT) -> bool:
+            """
+            Waits until it is known whether the burst's GIF was posted
+            :param timeout: How long to wait, in seconds
+            :return: Whether the GIF was posted, or False if that still isn't known
+            """
+            self._done.wait(timeout)
+            return bool(self.success)
+
+    def __init__(self, window: float, max_channels: int = MAX_CHANNELS,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param window: How long after a GIF is posted in a channel that triggers are coalesced
+                       into it, in seconds
+        :param max_channels: The number of channels to remember, with the least recently active
+                             forgotten
+        :param clock: The clock used to time the window
+        """
+        self.window = window
+        self.max_channels = max_channels
+        self.clock = clock
+        self.coalesced = 0
+        self._bursts = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def join(self, channel: Text) -> Tuple["TriggerCoalescer.Burst", bool]:
+        """
+        Records a trigger in a channel
+        :param channel: The channel ID where the trigger came from
+        :return: The burst that the trigger is part of, and whether the trigger started it (in
+                 which case it should be answered with a GIF, and the burst passed to ``posted``
+                 even if posting fails)
+        """
+        now = self.clock()
+        with self._lock:
+            burst = self._bursts.get(channel)
+            if burst is not None and now - burst.started < self.window:
+                self._bursts.move_to_end(channel)
+                self.coalesced += 1
+                return burst, False
+
+            burst = self._bursts[channel] = self.Burst(now)
+            self._bursts.move_to_end(channel)
+            if len(self._bursts) > self.max_channels:
+                self._bursts.popitem(last=False)
+            return burst, True
+
+    @staticmethod
+    def posted(burst: "TriggerCoalescer.Burst", success: bool) -> None:
+        """
+        Records whether the GIF for a burst was posted. This is the burst returned to the trigger
+        that started it, as a later burst may have started in the channel by the time it's known.
+        :param burst: The burst whose GIF was posted
+        :param success: Whether a GIF was found and posted
+        """
+        burst.success = success
+        burst._done.set()  # pylint: disable=protected-access
+
+    def __len__(self) -> int:
+        return len(self._bursts)
+
+    def metrics(self) -> Dict[Text, int]:
+        """ Gets the number of channels remembered, and of triggers coalesced so far """
+        return {"channels": len(self._bursts), "coalesced": self.coalesced}
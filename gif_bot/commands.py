@@ -0,0 +1,189 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Implementation of the ``CommandRegistry`` class, which maps the first word of a command message to
+the function that handles it.
+"""
+
+import re
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Text, Tuple
+
+TOKEN_PATTERN = re.compile(r"\S+")
+FIRST_WORD_PATTERN = re.compile(r"[^ ]*")
+
+
+def first_word(text: Text) -> Text:
+    """ Gets the text before the first space, without splitting the rest of the text """
+    return FIRST_WORD_PATTERN.match(text).group()
+
+
+class Tokens:
+    """
+    The words of a message, which are only split from the text as they are needed, so that a
+    command that only looks at the first few words doesn't pay to split a long message.
+    """
+
+    __slots__ = ("_matches", "_tokens", "_lower")
+
+    def __init__(self, text: Text, lower: bool = False) -> None:
+        """
+        :param text: The text of the message
+        :param lower: Whether the words should be converted to lower case
+        """
+        self._matches = TOKEN_PATTERN.finditer(text)  # type: Optional[Iterator]
+        self._tokens = []  # type: List[Text]
+        self._lower = lower
+
+    def _split(self, count: Optional[int]) -> None:
+        """ Splits words from the text until there are ``count`` of them (or all of them) """
+        while self._matches is not None and (count is None or len(self._tokens) < count):
+            match = next(self._matches, None)
+            if match is None:
+                self._matches = None
+                break
+            token = match.group()
+            self._tokens.append(token.lower() if self._lower else token)
+
+    def get(self, index: int) -> Optional[Text]:
+        """ Gets a word, or None if the message has fewer words """
+        self._split(index + 1)
+        return self._tokens[index] if index < len(self._tokens) else None
+
+    def slice(self, start: int, stop: Optional[int] = None) -> List[Text]:
+        """ Gets the words from ``start`` up to (but not including) ``stop``, or to the end """
+        self._split(stop)
+        return self._tokens[start:stop]
+
+
+class Invocation(NamedTuple):
+    """ The details of a command given to the bot """
+    channel: Text
+    time_stamp: Text
+    args: List[Text]
+    admin: bool
+
+
+class Command(NamedTuple):
+    """ A command that the bot understands """
+    verb: Text
+    handler: Callable[[Invocation], None]
+    usage: Text
+    description: Text
+    min_args: int
+    max_args: Optional[int]
+    strict: bool
+    admin: bool
+    examples: Sequence[Tuple[Text, Text]]
+
+
+class CommandRegistry:
+    """
+    Maps the verbs that start commands to their handlers. Finding a command is a single dictionary
+    lookup however many commands there are, and only the words that the command takes as arguments
+    are split from the message.
+    """
+
+    def __init__(self) -> None:
+        self.commands = {}  # type: Dict[Text, Command]
+        self._help = {}  # type: Dict[bool, Text]
+
+    def register(self, verb: Text, handler: Callable[[Invocation], None], usage: Text = "",
+                 description: Text = "", min_args: int = 0, max_args: Optional[int] = 0,
+                 strict: bool = False, admin: bool = False,
+                 examples: Sequence[Tuple[Text, Text]] = ()) -> None:
+        """
+        Adds a command to the registry
+        :param verb: The word that starts the command
+        :param handler: Called with an ``Invocation`` whenever the command is given
+        :param usage: An example of the command, shown in the help text (defaults to the verb)
+        :param description: A description of the command, shown in the help text
+        :param min_args: The fewest arguments that the command needs
+        :param max_args: The most arguments passed to the command, or None for all of them
+        :param strict: Whether the command is rejected when given more than ``max_args`` arguments,
+                       rather than ignoring the extra words
+        :param admin: Whether only the bot owner can give the command
+        :param examples: Additional (usage, description) pairs shown in the help text
+        """
+        if verb in self.commands:
+            raise ValueError("The command '{}' has already been registered".format(verb))
+        self.commands[verb] = Command(verb, handler, usage or verb, description, min_args,
+                                      max_args, strict, admin, tuple(examples))
+        self._help.clear()
+
+    def find(self, tokens: Tokens, start: int = 0,
+             admin: bool = False) -> Optional[Tuple[Command, List[Text]]]:
+        """
+        Finds the command given in a message
+        :param tokens: The words of the message
+        :param start: The index of the word that should be the command's verb
+        :param admin: Whether the message came from the bot owner
+        :return: The command and its arguments, or None if the message isn't a valid command
+        """
+        command = self.commands.get(tokens.get(start))
+        if command is None or (command.admin and not admin):
+            return None
+
+        if command.max_args is None:
+            args = tokens.slice(start + 1)
+        else:
+            # Split one word more than is needed, to tell whether there are too many arguments
+            args = tokens.slice(start + 1, start + command.max_args + 2)
+            if len(args) > command.max_args:
+                if command.strict:
+                    return None
+                args = args[:command.max_args]
+        if len(args) < command.min_args:
+            return None
+        return command, args
+
+    def dispatch(self, tokens: Tokens, channel: Text, time_stamp: Text, start: int = 0,
+                 admin: bool = False) -> bool:
+        """
+        Handles the command given in a message
+        :param tokens: The words of the message
+        :param channel: The channel ID where the message came from
+        :param time_stamp: The timestamp of the message
+        :param start: The index of the word that should be the command's verb
+        :param admin: Whether the message came from the bot owner
+        :return: Whether the message was a valid command
+        """
+        found = self.find(tokens, start, admin)
+        if found is None:
+            return False
+        command, args = found
+        command.handler(Invocation(channel, time_stamp, args, admin))
+        return True
+
+    def help_text(self, admin: bool = False) -> Text:
+        """ Lists the commands available to the owner or to other users, one per line """
+        if admin not in self._help:
+            lines = []
+            for command in self.commands.values():
+                if command.admin and not admin:
+                    continue
+                for usage, description in ((command.usage, command.description),) + \
+                        tuple(command.examples):
+                    lines.append("  `{}`".format(usage) +
+                                 (" : {}".format(description) if description else ""))
+            self._help[admin] = "\n".join(lines)
+        return self._help[admin]
@@ -0,0 +1,365 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+An offline pipeline that finds copies of the same GIF under different URLs, and merges each set of
+copies into a single entry of the manifest carrying all of their tags.
+
+GIFs are read from local files: URLs that are local paths (or ``file://`` URLs) are read directly,
+and other URLs are read from a cache directory, where each GIF is saved under ``cache_name(url)``.
+A perceptual hash of each GIF is computed across a pool of processes, and GIFs whose hashes differ
+by only a few bits are treated as copies.
+
+Usage: ``python3 -m gif_bot.dedupe manifest.csv [--cache-dir gifs] [--output deduped.csv]
+[--journal manifest.journal] [--threshold 6] [--workers N] [--dry-run]``
+
+This needs the optional ``numpy`` and ``Pillow`` packages.
+"""
+
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Sequence, Text, Tuple
+from urllib.parse import unquote, urlparse
+
+import numpy
+from PIL import Image
+
+from gif_bot.gif_store import GifStore
+from gif_bot.journal import Journal
+
+# GIFs are shrunk to this size (in pixels) before their low frequencies are hashed
+HASH_SIZE = 32
+LOW_FREQUENCIES = 8
+# The number of frames sampled from each animated GIF
+MAX_FRAMES = 4
+# GIFs whose hashes differ by at most this many bits are treated as copies
+DEFAULT_THRESHOLD = 6
+# The number of GIFs each worker process hashes at a time
+CHUNK_SIZE = 256
+# The range of widths of the blocks that hashes are split into when looking for near matches
+MIN_BLOCK_BITS = 8
+MAX_BLOCK_BITS = 22
+# The most candidate pairs of hashes that are compared at a time, to bound memory use
+MAX_CANDIDATES = 1 << 20
+
+
+def cache_name(url: Text) -> Text:
+    """ Gets the name that a GIF is saved under in the cache directory """
+    return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".gif"
+
+
+def locate_gif(url: Text, cache_dir: Optional[Text] = None) -> Optional[Text]:
+    """
+    Finds the local copy of a GIF
+    :param url: The URL of the GIF
+    :param cache_dir: The directory of cached GIFs, if any
+    :return: The path of the local copy, or None if there isn't one
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        path = unquote(parsed.path)
+    elif not parsed.scheme:
+        path = url
+    elif cache_dir is not None:
+        path = os.path.join(cache_dir, cache_name(url))
+    else:
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def _dct_matrix(size: int) -> numpy.ndarray:
+    """ Builds the (orthonormal) matrix of the type-II discrete cosine transform """
+    k = numpy.arange(size)[:, None]
+    n = numpy.arange(size)[None, :]
+    matrix = numpy.cos(numpy.pi * (2 * n + 1) * k / (2 * size)) * numpy.sqrt(2. / size)
+    matrix[0] /= numpy.sqrt(2.)
+    return matrix
+
+
+DCT = _dct_matrix(HASH_SIZE)[:LOW_FREQUENCIES]
+
+
+def read_frames(path: Text) -> Optional[numpy.ndarray]:
+    """
+    Decodes a few evenly spaced frames of a GIF, as greyscale images shrunk to ``HASH_SIZE``
+    :return: An array of shape (frames, HASH_SIZE, HASH_SIZE), or None if the GIF can't be read
+    """
+    try:
+        with Image.open(path) as image:
+            num_frames = getattr(image, "n_frames", 1)
+            frames = []
+            for index in sorted({i * num_frames // MAX_FRAMES for i in range(MAX_FRAMES)}):
+                image.seek(index)
+                frame = image.convert("L").resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR)
+                frames.append(numpy.asarray(frame, dtype=numpy.float32))
+    except (OSError, ValueError, EOFError):
+        return None
+    return numpy.stack(frames)
+
+
+def hash_frames(frames: numpy.ndarray) -> numpy.ndarray:
+    """
+    Computes the perceptual hashes of a batch of GIFs. The low frequencies of each frame's discrete
+    cosine transform are averaged across the frames, and each bit of the hash is whether one of
+    them is above their median.
+    :param frames: An array of shape (gifs, frames, HASH_SIZE, HASH_SIZE)
+    :return: The 64-bit hash of each GIF
+    """
+    low = (DCT @ frames @ DCT.T).mean(axis=1).reshape(len(frames), -1)
+    # The first (DC) coefficient is just the average brightness, so it is left out of the median
+    bits = low > numpy.median(low[:, 1:], axis=1)[:, None]
+    return numpy.packbits(bits, axis=1).view(">u8").ravel().astype(numpy.uint64)
+
+
+def hash_files(paths: Sequence[Optional[Text]]) -> List[Optional[int]]:
+    """
+    Computes the perceptual hashes of a batch of GIF files
+    :return: The hash of each GIF, or None for any that are missing or can't be decoded
+    """
+    frames = [read_frames(path) if path is not None else None for path in paths]
+    decoded = [i for i, gif_frames in enumerate(frames) if gif_frames is not None]
+    hashes = [None] * len(paths)  # type: List[Optional[int]]
+    # GIFs with the same number of sampled frames are hashed together
+    by_count = {}  # type: Dict[int, List[int]]
+    for i in decoded:
+        by_count.setdefault(len(frames[i]), []).append(i)
+    for indices in by_count.values():
+        for i, gif_hash in zip(indices, hash_frames(numpy.stack([frames[i] for i in indices]))):
+            hashes[i] = int(gif_hash)
+    return hashes
+
+
+def hash_gifs(paths: Sequence[Optional[Text]],
+              workers: Optional[int] = None) -> List[Optional[int]]:
+    """
+    Computes the perceptual hashes of GIF files across a pool of processes
+    :param paths: The path of each GIF file, or None if there isn't one
+    :param workers: The number of processes (by default, one per CPU)
+    :return: The hash of each GIF, or None for any that are missing or can't be decoded
+    """
+    chunks = [paths[start:start + CHUNK_SIZE] for start in range(0, len(paths), CHUNK_SIZE)]
+    hashes = []  # type: List[Optional[int]]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_hashes in executor.map(hash_files, chunks):
+            hashes.extend(chunk_hashes)
+    return hashes
+
+
+def _popcount(values: numpy.ndarray) -> numpy.ndarray:
+    """ Counts the set bits of each element of an array of 64-bit integers """
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(values)
+    table = numpy.array([bin(i).count("1") for i in range(256)], dtype=numpy.uint8)
+    return table[values.view(numpy.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def _block_layout(num_hashes: int, threshold: int) -> Tuple[int, int]:
+    """
+    Chooses how to split the hashes into blocks for the multi-index lookup
+    :return: The number of blocks, and the most bits that copies must differ by in at least one
+             of the blocks
+    """
+    # Blocks about as wide as log2(num_hashes) bits keep each bucket small, without making the
+    # table of buckets (or the number of nearby keys probed in each block) too large
+    width = min(max(int(numpy.ceil(numpy.log2(max(num_hashes, 2)))), MIN_BLOCK_BITS),
+                MAX_BLOCK_BITS)
+    num_blocks = min(-(-64 // width), threshold + 1)
+    # If copies differ by at most threshold bits, then by the pigeonhole principle they differ by
+    # at most threshold // num_blocks bits in at least one block
+    return num_blocks, threshold // num_blocks
+
+
+def _near_pairs(values: numpy.ndarray, threshold: int) -> Iterator[Tuple[int, int]]:
+    """
+    Finds the pairs of (distinct) hashes that differ by at most ``threshold`` bits
+    :param values: The hashes, without repeats
+    :return: The indices of each pair
+    """
+    num_blocks, radius = _block_layout(len(values), threshold)
+    for block in range(num_blocks):
+        start, end = block * 64 // num_blocks, (block + 1) * 64 // num_blocks
+        width = end - start
+        keys = ((values >> numpy.uint64(start)) &
+                numpy.uint64((1 << width) - 1)).astype(numpy.int64)
+        # A dense table of the buckets, which hold the indices of the hashes sharing each key
+        order = numpy.argsort(keys, kind="stable")
+        counts = numpy.bincount(keys, minlength=1 << width)
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+        masks = [sum(1 << bit for bit in bits) for distance in range(radius + 1)
+                 for bits in combinations(range(width), distance)]
+        for mask in masks:
+            probes = keys ^ mask
+            queries = numpy.flatnonzero(counts[probes])
+            sizes = counts[probes[queries]]
+            # The candidates are expanded a slice of queries at a time, to bound memory use
+            ends = numpy.cumsum(sizes)
+            first = 0
+            while first < len(queries):
+                last = max(int(numpy.searchsorted(ends, ends[first] - sizes[first] +
+                                                  MAX_CANDIDATES, side="right")), first + 1)
+                query, size = queries[first:last], sizes[first:last]
+                rows = numpy.repeat(query, size)
+                starts = numpy.repeat(offsets[probes[query]] - (numpy.cumsum(size) - size), size)
+                columns = order[starts + numpy.arange(len(rows))]
+                close = (rows < columns) & \
+                    (_popcount(values[rows] ^ values[columns]) <= threshold)
+                yield from zip(rows[close].tolist(), columns[close].tolist())
+                first = last
+
+
+def find_duplicates(hashes: Sequence[Optional[int]],
+                    threshold: int = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """
+    Groups GIFs whose hashes differ by at most ``threshold`` bits, using a multi-index hash lookup.
+    The hashes are split into blocks of bits, and any two hashes that are close enough must also be
+    close in at least one whole block, so only the GIFs found near each other in one of the blocks
+    are compared.
+    :param hashes: The hash of each GIF, or None for GIFs that couldn't be hashed
+    :param threshold: The most bits that copies' hashes can differ by
+    :return: The indices of each group of copies (with more than one member), in ascending order.
+             Every GIF in a group is within the threshold of the first, which is the one kept.
+    """
+    if not 0 <= threshold < 64:
+        raise ValueError("The threshold must be between 0 and 63 bits")
+    indices = numpy.array([i for i, gif_hash in enumerate(hashes) if gif_hash is not None],
+                          dtype=numpy.int64)
+    if not len(indices):
+        return []
+    # Identical hashes are grouped straight away, so only distinct hashes need to be compared
+    values, inverse = numpy.unique(numpy.array([hashes[i] for i in indices], dtype=numpy.uint64),
+                                   return_inverse=True)
+    parents = list(range(len(values)))
+
+    def find(node: int) -> int:
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    if threshold > 0:
+        for first, second in _near_pairs(values, threshold):
+            first, second = find(first), find(second)
+            if first != second:
+                parents[max(first, second)] = min(first, second)
+
+    groups = {}  # type: Dict[int, List[int]]
+    for index, value in zip(indices.tolist(), inverse.ravel().tolist()):
+        groups.setdefault(find(value), []).append(index)
+    return sorted(copies for group in groups.values() if len(group) > 1
+                  for copies in _split_group(group, hashes, threshold))
+
+
+def _split_group(group: List[int], hashes: Sequence[Optional[int]],
+                 threshold: int) -> Iterator[List[int]]:
+    """
+    Splits a group of GIFs linked by a chain of near matches (where the ends of the chain can be
+    much further apart than the threshold) into groups whose GIFs all match the one that is kept
+    :param group: The indices of the GIFs, in ascending order
+    :return: The indices of each group of copies (with more than one member)
+    """
+    while len(group) > 1:
+        kept = hashes[group[0]]
+        copies, rest = [group[0]], []
+        for index in group[1:]:
+            if bin(kept ^ hashes[index]).count("1") <= threshold:
+                copies.append(index)
+            else:
+                rest.append(index)
+        if len(copies) > 1:
+            yield copies
+        group = rest
+
+
+def dedupe(store: GifStore, cache_dir: Optional[Text] = None,
+           threshold: int = DEFAULT_THRESHOLD, workers: Optional[int] = None) -> List[List[Text]]:
+    """
+    Finds copies of the same GIF in a store, and merges each set of copies into the first of them
+    :param store: The store of GIFs
+    :param cache_dir: The directory of cached GIFs, if any
+    :param threshold: The most bits that copies' hashes can differ by
+    :param workers: The number of processes used to hash the GIFs
+    :return: The URLs of each set of copies, starting with the one that was kept
+    """
+    urls = [element.url for element in store.elements]
+    hashes = hash_gifs([locate_gif(url, cache_dir) for url in urls], workers)
+    duplicates = [[urls[i] for i in group] for group in find_duplicates(hashes, threshold)]
+    for group in duplicates:
+        store.merge_gifs(group[0], group[1:])
+    return duplicates
+
+
+def _default_journal(manifest_loc: Text) -> Text:
+    """ Gets where the sample config keeps the journal of a manifest (e.g. ``manifest.journal``) """
+    return os.path.splitext(manifest_loc)[0] + ".journal"
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser(description="Merges copies of the same GIF in a manifest")
+    parser.add_argument("manifest", help="The manifest file")
+    parser.add_argument("--cache-dir", help="The directory of cached GIFs")
+    parser.add_argument("--output", help="Where to write the merged manifest (by default, over "
+                                         "the original)")
+    parser.add_argument("--journal", help="The bot's journal of changes to the manifest, which is "
+                                          "replayed before merging and then compacted into it")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help="The most bits that copies' hashes can differ by")
+    parser.add_argument("--workers", type=int, help="The number of processes to hash GIFs with")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the copies")
+    args = parser.parse_args()
+    overwrite = not args.dry_run and \
+        (args.output is None or os.path.abspath(args.output) == os.path.abspath(args.manifest))
+    if args.journal is not None and not args.dry_run and not overwrite:
+        parser.error("--journal can only be used when writing over the manifest, as the journal "
+                     "is emptied")
+    if args.journal is None and overwrite and os.path.exists(_default_journal(args.manifest)):
+        # Overwriting the manifest alone would lose the journal's changes, or have them replayed
+        # over the merged manifest
+        parser.error("{} has a journal, so use --journal {} (or --output)".format(
+            args.manifest, _default_journal(args.manifest)))
+
+    with open(args.manifest, newline="") as manifest_file:
+        store = GifStore(manifest_data=manifest_file, compact=True)
+    journal = Journal(args.journal, args.manifest) if args.journal is not None else None
+    if journal is not None:
+        journal.replay(store)
+    num_gifs = len(store.elements)
+    start = time.perf_counter()
+    duplicates = dedupe(store, args.cache_dir, args.threshold, args.workers)
+    seconds = time.perf_counter() - start
+
+    for group in duplicates:
+        print(" = ".join(group))
+    print("Found {} sets of copies ({} GIFs to remove) among {} GIFs in {:.1f}s".format(
+        len(duplicates), num_gifs - len(store.elements), num_gifs, seconds))
+    if journal is not None and not args.dry_run:
+        journal.compact(store)
+    elif not args.dry_run:
+        store.save_manifest(args.output or args.manifest)
+
+
+if __name__ == "__main__":
+    _main()
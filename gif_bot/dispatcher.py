@@ -0,0 +1,249 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``ApiDispatcher`` class, which sends Slack Web API calls from a pool of worker
+threads over pooled keep-alive HTTP connections.
+"""
+
+import json
+import threading
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue
+from typing import (Any, Callable, Deque, Dict, Hashable, Optional,  # pylint: disable=unused-import
+                    Text)
+
+import requests
+from requests.adapters import HTTPAdapter
+from slackclient._slackrequest import SlackRequest
+
+# Marker placed on a worker's queue to ask it to exit
+_STOP = object()
+
+
+class RateLimitedResponse:  # pylint: disable=too-few-public-methods
+    """
+    Stands in for a HTTP 429 response from Slack. ``SlackClient.api_call`` only passes on the body
+    of a response, so Slack's ``Retry-After`` header is copied into the body.
+    """
+    status_code = 429
+
+    def __init__(self, retry_after: Optional[Text]) -> None:
+        try:
+            seconds = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            seconds = None
+        self.text = json.dumps({"ok": False, "error": "ratelimited", "retry_after": seconds})
+
+    def json(self) -> Dict[Text, Any]:
+        """ Gets the body of the response """
+        return json.loads(self.text)
+
+
+class PooledSlackRequest(SlackRequest):
+    """
+    A drop-in replacement for the ``SlackRequest`` used by ``SlackClient``, which sends every
+    request through a shared ``requests.Session`` so that HTTPS connections to Slack are kept alive
+    and reused, rather than being opened for every call
+    """
+
+    def __init__(self, pool_size: int, proxies=None) -> None:
+        super().__init__(proxies=proxies)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    # pylint: disable=too-many-arguments
+    def do(self, token, request="?", post_data=None, domain="slack.com", timeout=None):
+        post_data = dict(post_data or {})
+        files = None
+        if request == "files.upload" and "file" in post_data:
+            files = {"file": post_data.pop("file")}
+
+        for key, value in post_data.items():
+            if not isinstance(value, str):
+                post_data[key] = json.dumps(value)
+        post_data["token"] = token
+
+        response = self.session.post("https://{0}/api/{1}".format(domain, request),
+                                     headers={"user-agent": self.get_user_agent()},
+                                     data=post_data,
+                                     files=files,
+                                     timeout=timeout,
+                                     proxies=self.proxies)
+        if response.status_code == 429:
+            return RateLimitedResponse(response.headers.get("Retry-After"))
+        return response
+
+
+def install_connection_pool(client: Any, pool_size: int) -> bool:
+    """
+    Swaps a ``SlackClient``'s request helper for a ``PooledSlackRequest``
+    :param client: The Slack client
+    :param pool_size: The maximum number of connections to keep open
+    :return: Whether the pool could be installed (it can't be for non-standard clients)
+    """
+    server = getattr(client, "server", None)
+    requester = getattr(server, "api_requester", None)
+    if not isinstance(requester, SlackRequest):
+        return False
+    if not isinstance(requester, PooledSlackRequest):
+        server.api_requester = PooledSlackRequest(pool_size, proxies=requester.proxies)
+    return True
+
+
+class ApiDispatcher:
+    """
+    Makes Slack Web API calls on a pool of worker threads. Each call has an ordering key (normally
+    its channel). Calls with the same key are made one at a time in the order that they were
+    submitted, while calls with different keys are made concurrently by whichever workers are free.
+
+    With no workers the dispatcher makes each call immediately on the calling thread.
+    """
+
+    def __init__(self, call: Callable[..., Any], workers: int = 0,
+                 on_error: Optional[Callable[[Text, BaseException], None]] = None) -> None:
+        """
+        :param call: The function used to make an API call, called as ``call(method, **kwargs)``
+        :param workers: The number of worker threads
+        :param on_error: A function called with the method name and exception whenever a call made
+                         by a worker fails
+        """
+        self._call = call
+        self._on_error = on_error
+        # Calls waiting to be made, grouped by their ordering key. A key is on the ready queue
+        # whenever it has waiting calls and no worker is currently making one of them.
+        self._pending = {}  # type: Dict[Hashable, Deque]
+        self._ready = Queue()  # type: Queue
+        self._lock = threading.Condition()
+        self.queue_depth = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._threads = [threading.Thread(target=self._work, daemon=True,
+                                          name="gif_bot_api_{}".format(i))
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def workers(self) -> int:
+        """ The number of worker threads """
+        return len(self._threads)
+
+    def submit(self, method: Text, key: Hashable, **kwargs) -> Future:
+        """
+        Queues up an API call
+        :param method: The Slack API method to call
+        :param key: The ordering key of the call
+        :param kwargs: The arguments of the call
+        :return: A future for the result of the call. If there are no workers the call has already
+                 been made, and any exception is raised immediately rather than via the future.
+        """
+        future = Future()  # type: Future
+
+        if not self._threads:
+            with self._lock:
+                self.submitted += 1
+            try:
+                future.set_result(self._call(method, **kwargs))
+            except Exception:
+                self._finished(failed=True)
+                raise
+            self._finished(failed=False)
+            return future
+
+        with self._lock:
+            self.submitted += 1
+            self.queue_depth += 1
+            self.max_depth = max(self.max_depth, self.queue_depth)
+            calls = self._pending.get(key)
+            if calls is None:
+                self._pending[key] = deque([(future, method, kwargs)])
+                self._ready.put(key)
+            else:
+                calls.append((future, method, kwargs))
+        return future
+
+    def _work(self) -> None:
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+
+            with self._lock:
+                future, method, kwargs = self._pending[key][0]
+            try:
+                future.set_result(self._call(method, **kwargs))
+                failed = False
+            except Exception as err:  # pylint: disable=broad-except
+                future.set_exception(err)
+                failed = True
+                if self._on_error is not None:
+                    self._on_error(method, err)
+
+            with self._lock:
+                calls = self._pending[key]
+                calls.popleft()
+                if calls:
+                    self._ready.put(key)
+                else:
+                    del self._pending[key]
+                self.queue_depth -= 1
+            self._finished(failed)
+
+    def _finished(self, failed: bool) -> None:
+        with self._lock:
+            self.completed += 1
+            if failed:
+                self.failed += 1
+            self._lock.notify_all()
+
+    def metrics(self) -> Dict[Text, int]:
+        """ Gets the queue depth and call counters of the dispatcher """
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_depth,
+                "queued_keys": len(self._pending),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def flush(self) -> None:
+        """ Waits until every queued call has been made """
+        with self._lock:
+            self._lock.wait_for(lambda: self.queue_depth == 0)
+
+    def close(self) -> None:
+        """ Makes any queued calls, then stops the workers """
+        self.flush()
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._ready.put(_STOP)
+        for thread in threads:
+            if thread is not threading.current_thread():
+                thread.join()
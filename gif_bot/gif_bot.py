@@ -25,18 +25,37 @@ Implementation of the main ``GifBot`` class
 """
 
 import random
-import re
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
 from logging import Logger, Formatter, INFO, getLogger
 from logging.handlers import RotatingFileHandler
-from sys import exc_info
 from time import sleep
-from typing import List, Text, Any, Tuple
+from typing import Iterator, List, Optional, Set, Text, Any, Tuple, Union
 
 from configobj import ConfigObj
 from slackclient import SlackClient
 
+from gif_bot.channels import ChannelSettings, compile_channels
+from gif_bot.coalescer import TriggerCoalescer
+from gif_bot.commands import CommandRegistry, Invocation, Tokens, first_word
+from gif_bot.dispatcher import ApiDispatcher, install_connection_pool
 from gif_bot.gif_store import GifStore
-from gif_bot.utils import get_config_list
+from gif_bot.journal import Journal
+from gif_bot.links import DEFAULT_CHECK_CONCURRENCY, DEFAULT_LINK_TTL, LinkChecker, LinkHealth
+from gif_bot.logs import BackgroundHandler, CorrelationFilter, InfoSampler, JsonFormatter, \
+    correlation
+from gif_bot.matcher import TriggerMatcher
+from gif_bot.metrics import Metrics, MetricsServer, instrument_api_call, instrument_bot
+from gif_bot.query import ALL, QueryError
+from gif_bot.rate_limit import POLICIES, RateLimiter
+from gif_bot.reloader import StoreReloader
+from gif_bot.selection import RecentlyPosted, WeightError
+from gif_bot.templates import GreetingTemplates, TemplateError
+from gif_bot.users import DEFAULT_TTL, UserDirectory, UserLookupError
+from gif_bot.snapshot import SnapshotStore, open_snapshot, source_fingerprint, write_snapshot
+from gif_bot.utils import get_config_bool, get_config_float, get_config_int, get_config_list
 
 LOG_FORMAT = "%(asctime)s %(levelname)s %(funcName)s(%(lineno)d) %(message)s"
 LOG_SIZE_MB = 2
@@ -61,40 +80,137 @@ class GifBot:
         pass
 
     def __init__(self, config_filename: Text, log_filename: Text) -> None:
-        self.log = self._init_log(log_filename)
+        config = ConfigObj(config_filename)
+        self.log = self._init_log(log_filename,
+                                  background=get_config_bool(config, "background_logging"),
+                                  structured=get_config_bool(config, "structured_logging"),
+                                  sample_rate=get_config_float(config, "log_sample_rate", 1.))
 
         # Attempt to read settings from the config file
         try:
-            config = ConfigObj(config_filename)
             self.bot_name = config["bot_name"]
             self.bot_id = None
             self.owner_name = config["bot_owner"]
             self.owner_id = None
             self.manifest_loc = config["manifest_loc"]
             self.api_token = config["slack_token"]
+            self.async_mode = get_config_bool(config, "async_mode")
+            self.api_workers = get_config_int(config, "api_workers")
+            # Without any API workers, waiting for a rate limit would hold up handling messages.
+            # The policy only applies to the GIFs posted for triggers, and never to replies.
+            self.rate_limit_policy = config.get("rate_limit_policy",
+                                                "wait" if self.api_workers > 0 else "drop")
+            self.compact_store = get_config_bool(config, "compact_store")
+            self.manifest_watch_interval = get_config_float(config, "manifest_watch_interval")
+            self.journal_loc = config.get("journal_loc")
+            self.snapshot_loc = config.get("snapshot_loc")
+            self.repeat_window = get_config_float(config, "repeat_window")
+            self.trigger_window = get_config_float(config, "trigger_window")
+            self.user_cache_loc = config.get("user_cache_loc")
+            self.user_cache_ttl = get_config_float(config, "user_cache_ttl", DEFAULT_TTL)
+            self.metrics_port = get_config_int(config, "metrics_port")
+            self.link_check_interval = get_config_float(config, "link_check_interval")
+            self.link_cache_loc = config.get("link_cache_loc")
+            self.link_cache_ttl = get_config_float(config, "link_cache_ttl", DEFAULT_LINK_TTL)
+            self.link_check_concurrency = get_config_int(config, "link_check_concurrency",
+                                                         DEFAULT_CHECK_CONCURRENCY)
 
             # Save messaging parameters, and put into lists if required.
             self.nouns = get_config_list(config, "nouns")
             self.greetings = get_config_list(config, "greetings")
+            self.greeting_templates = get_config_list(config, "greeting_templates") \
+                if "greeting_templates" in config else []
+            self.gif_blocks = get_config_bool(config, "gif_blocks")
             self.triggers = get_config_list(config, "triggers")
             self.reactions = get_config_list(config, "reactions")
-            self.reactions = get_config_list(config, "reactions")
             self.adjectives = get_config_list(config, "adjectives")
+
+            # Compile the triggers into a single matcher, and register the commands
+            self.trigger_matcher = TriggerMatcher(
+                self.triggers, word_boundary=get_config_bool(config, "trigger_word_boundary"))
+            self.mention = "@" + self.bot_name
+            self.commands = self._register_commands()
         except KeyError as err:
             self.log.error("The required key '%s' was not found in the config file (%s).",
                            err.args[0], log_filename)
             raise self.BotConfigError("Key not found: {key}".format(key=err.args[0]))
 
-        # Initialise the store of GIFs
+        if self.rate_limit_policy not in POLICIES:
+            raise self.BotConfigError("Unknown rate_limit_policy: {policy}"
+                                      .format(policy=self.rate_limit_policy))
+        if self.rate_limit_policy == "wait" and self.api_workers == 0:
+            raise self.BotConfigError("rate_limit_policy = wait needs api_workers to be set, so "
+                                      "that waiting for a rate limit doesn't hold up messages")
+
+        # Compile any per-channel overrides up front, so each message just looks its channel up
+        self.default_settings = ChannelSettings(self.trigger_matcher, self.reactions)
         try:
-            self.store = GifStore(adjectives=self.adjectives,
-                                  manifest_data=open(self.manifest_loc).read())
-        except Exception as _:
+            self.channel_settings = compile_channels(
+                config["channels"] if "channels" in config else {}, self.default_settings)
+        except QueryError as err:
+            self.log.error("Invalid channel settings: %s", err)
+            raise self.BotConfigError("Invalid channel settings: {}".format(err))
+
+        # Render every combination of greeting and noun up front, so each post just adds the URL
+        try:
+            self.templates = GreetingTemplates(self.greetings, self.nouns, self.greeting_templates,
+                                               blocks=self.gif_blocks)
+        except TemplateError as err:
+            self.log.error(str(err))
+            raise self.BotConfigError(str(err))
+
+        # Keep track of which GIFs' links are broken, so that they aren't posted
+        self.link_health = None
+        self.link_checker = None
+        if self.link_check_interval > 0:
+            self.link_health = LinkHealth(self.link_cache_loc, ttl=self.link_cache_ttl)
+            try:
+                self.link_checker = LinkChecker(self.link_health,
+                                                concurrency=self.link_check_concurrency,
+                                                log=self.log)
+            except RuntimeError as err:
+                raise self.BotConfigError(str(err))
+
+        # Initialise the store of GIFs, along with the journal of any changes made to it
+        self.journal = Journal(self.journal_loc, self.manifest_loc) if self.journal_loc else None
+        # Held while the store is being changed or replaced, so that commands handled on different
+        # threads can't copy a snapshot twice, or change a store as it is swapped out
+        self.store_lock = threading.RLock()
+        # Counts the threads reading each store, so that a replaced snapshot is only unmapped once
+        # nothing is still reading it
+        self._store_readers = Counter()  # type: Counter
+        self._store_readers_changed = threading.Condition()
+        try:
+            self.store = self.load_store()
+        except Exception as err:
+            self.log.error("Unable to load the manifest: %r", err)
             raise self.BotConfigError("Unable to load GIF manifest.")
+        self._prune_link_health()
+        self.reloader = StoreReloader(self.load_store, self._swap_reloaded, self.manifest_loc,
+                                      self.log, lock=self.store_lock, journal=self.journal)
+        if self.journal is not None:
+            self.journal.writing_manifest = self.reloader.writing_manifest
+        if self.manifest_watch_interval > 0:
+            self.reloader.watch(self.manifest_watch_interval)
+        self.recently_posted = RecentlyPosted(self.repeat_window) \
+            if self.repeat_window > 0 else None
+        self.trigger_coalescer = TriggerCoalescer(self.trigger_window) \
+            if self.trigger_window > 0 else None
 
         # Initialise the Slack client
         self.log.info("Initialising the Slack client...")
         self.client = SlackClient(self.api_token)
+        install_connection_pool(self.client, pool_size=max(self.api_workers, 1))
+        # Metrics are only recorded when they are enabled, so otherwise nothing is instrumented
+        self.metrics = Metrics() if self.metrics_port > 0 else None
+        api_call = self.client.api_call
+        if self.metrics is not None:
+            api_call = instrument_api_call(self.metrics, api_call)
+        self.rate_limiter = RateLimiter(policy=self.rate_limit_policy, log=self.log)
+        self.dispatcher = ApiDispatcher(self.rate_limiter.wrap(api_call),
+                                        workers=self.api_workers, on_error=self._log_api_error)
+        self.users = UserDirectory(api_call, cache_loc=self.user_cache_loc,
+                                   ttl=self.user_cache_ttl)
         self.log.info("Slack client initialised")
 
         # Get the bot and owner IDs
@@ -103,11 +219,49 @@ class GifBot:
         self.log.info("Bot initialised with [ID:{bot_id}] and [ownerID:{owner_id}]"
                       .format(bot_id=self.bot_id, owner_id=self.owner_id))
 
+        self.metrics_server = None
+        if self.metrics is not None:
+            instrument_bot(self.metrics, self)
+            try:
+                self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            except OSError as err:
+                # Stop the background threads that have already been started
+                self.stop()
+                raise self.BotConfigError("Unable to serve metrics on port {}: {}"
+                                          .format(self.metrics_port, err))
+            self.log.info("Serving metrics at http://127.0.0.1:%s/metrics",
+                          self.metrics_server.port)
+
+        if self.link_checker is not None:
+            self.link_checker.watch(self._store_urls, self.link_check_interval)
+
+        self.stopped = False
+
     @staticmethod
-    def _init_log(log_filename: Text) -> Logger:
-        """ Initialise a logger """
+    def _init_log(log_filename: Text, background: bool = False, structured: bool = False,
+                  sample_rate: float = 1.) -> Logger:
+        """
+        Initialise a logger. Only one handler is ever added for each log file, so initialising
+        the same log again (e.g. when another bot is created) doesn't duplicate its records.
+        :param log_filename: The file to log to
+        :param background: Whether records are written by a background thread
+        :param structured: Whether records are written as JSON, tagged with correlation IDs
+        :param sample_rate: The fraction of INFO records to write
+        """
+        log = getLogger('root')
+        log.setLevel(INFO)
+
+        key = (log_filename, background, structured, sample_rate)
+        for handler in list(log.handlers):
+            handler_key = getattr(handler, "log_key", None)
+            if handler_key == key:
+                return log
+            if handler_key is not None and handler_key[0] == log_filename:
+                log.removeHandler(handler)
+                handler.close()
+
         # Initialise the logger
-        log_formatter = Formatter(LOG_FORMAT)
+        log_formatter = JsonFormatter() if structured else Formatter(LOG_FORMAT)
 
         log_handler = RotatingFileHandler(log_filename, mode="a",
                                           maxBytes=LOG_SIZE_MB * 1024 * 1024,
@@ -115,29 +269,151 @@ class GifBot:
         log_handler.setFormatter(log_formatter)
         log_handler.setLevel(INFO)
 
-        log = getLogger('root')
-        log.setLevel(INFO)
+        # Filters run on the thread that logs the record, even when it is written in the background
+        if background:
+            log_handler = BackgroundHandler(log_handler)
+        if sample_rate < 1.:
+            log_handler.addFilter(InfoSampler(sample_rate))
+        if structured:
+            log_handler.addFilter(CorrelationFilter())
+        log_handler.log_key = key
+
         log.addHandler(log_handler)
 
         return log
 
+    def load_store(self) -> Union[GifStore, SnapshotStore]:
+        """
+        Creates a new GIF store, streaming its contents from the manifest file and then replaying
+        the journal of changes (if there is one). If a snapshot is configured, an up-to-date
+        snapshot is memory-mapped instead, and an out-of-date one is rewritten after loading.
+        """
+        fingerprint = None
+        if self.snapshot_loc:
+            fingerprint = source_fingerprint(self.manifest_loc, self.journal_loc)
+            snapshot = open_snapshot(self.snapshot_loc, fingerprint, adjectives=self.adjectives)
+            if snapshot is not None:
+                self.log.info("Loaded the GIF store from the snapshot %s", self.snapshot_loc)
+                snapshot.journal = self.journal
+                if self.journal is not None:
+                    snapshot.journal_records = self.journal.count()
+                snapshot.unavailable = self._unavailable()
+                return snapshot
+
+        if self.journal is not None:
+            with self.journal.loading():
+                store = self._read_manifest()
+                store.attach_journal(self.journal)
+        else:
+            store = self._read_manifest()
+        store.unavailable = self._unavailable()
+
+        if fingerprint is not None:
+            try:
+                write_snapshot(store, self.snapshot_loc, fingerprint)
+            except OSError as err:
+                self.log.warning("Unable to write the snapshot %s: %r", self.snapshot_loc, err)
+        return store
+
+    def _read_manifest(self) -> GifStore:
+        """ Creates a new GIF store from the manifest file alone """
+        with open(self.manifest_loc, newline="") as manifest_file:
+            return GifStore(adjectives=self.adjectives, manifest_data=manifest_file,
+                            compact=self.compact_store)
+
+    def _unavailable(self) -> Optional[Set[Text]]:
+        """ Gets the URLs of any GIFs that shouldn't be posted, because their links are broken """
+        return self.link_health.dead if self.link_health is not None else None
+
+    @contextmanager
+    def reading_store(self) -> Iterator[Union[GifStore, SnapshotStore]]:
+        """
+        Gets the current GIF store to read from. If the store is a snapshot that gets replaced in
+        the meantime, it isn't closed until the caller has finished with it.
+        """
+        with self._store_readers_changed:
+            store = self.store
+            self._store_readers[store] += 1
+        try:
+            yield store
+        finally:
+            with self._store_readers_changed:
+                self._store_readers[store] -= 1
+                if not self._store_readers[store]:
+                    del self._store_readers[store]
+                    self._store_readers_changed.notify_all()
+
+    def _close_snapshot(self, store: Union[GifStore, SnapshotStore]) -> None:
+        """ Unmaps a snapshot that has been replaced, once nothing is still reading it """
+        if not isinstance(store, SnapshotStore):
+            return
+        with self._store_readers_changed:
+            self._store_readers_changed.wait_for(lambda: store not in self._store_readers)
+        store.close()
+
+    def _store_urls(self) -> Iterator[Text]:
+        """ Gets the URLs of the GIFs in the current store, for checking their links """
+        # The URLs are copied up front, rather than read while the store changes or is replaced
+        with self.reading_store() as store:
+            if isinstance(store, SnapshotStore):
+                return iter([element.url for element in store.elements])
+            with store.lock:
+                return iter([element.url for element in store.elements])
+
+    def _writable_store(self) -> GifStore:
+        """
+        Gets the GIF store, first copying it out of its snapshot if it was loaded from one. The
+        caller should hold ``store_lock`` for as long as it uses the store.
+        """
+        with self.store_lock:
+            if isinstance(self.store, SnapshotStore):
+                store = self.store.to_gif_store(compact=self.compact_store)
+                # The snapshot already includes the journal's changes, so they mustn't be replayed
+                store.journal = self.journal
+                self._swap_store(store)
+            return self.store
+
+    def _swap_store(self, store: Union[GifStore, SnapshotStore]) -> None:
+        """ Replaces the GIF store with a newly loaded one, closing the old snapshot (if any) """
+        with self._store_readers_changed:
+            old_store, self.store = self.store, store
+        self._close_snapshot(old_store)
+
+    def _swap_reloaded(self, store: Union[GifStore, SnapshotStore]) -> None:
+        """
+        Swaps in a reloaded store, first applying any changes that were journaled while it was
+        loading. The caller should hold ``store_lock``.
+        """
+        if self.journal is not None and self.journal.count() > store.journal_records:
+            if isinstance(store, SnapshotStore):
+                snapshot, store = store, store.to_gif_store(compact=self.compact_store)
+                snapshot.close()
+            store.attach_journal(self.journal, start=store.journal_records)
+        self._swap_store(store)
+        self._prune_link_health()
+
+    def _prune_link_health(self) -> None:
+        """ Forgets the link statuses of any GIFs that aren't in the current store """
+        if self.link_health is not None:
+            self.link_health.prune(set(self._store_urls()))
+
+    def _log_api_error(self, method: Text, err: BaseException) -> None:
+        """ Logs an error from a Slack API call made in the background """
+        self.log.error("Unable to call the Slack command '%s': %r", method, err)
+
     def _get_user_id(self, names: Tuple[Text, ...]) -> Tuple[Text, ...]:
         """ Get the Slack API ID for a set of users """
-        api_call = self.client.api_call("users.list")
-
-        if not api_call.get("ok"):
-            self.log.error("Error in API call to users.list")
+        try:
+            ids = self.users.resolve(names)
+        except UserLookupError as err:
+            self.log.error("Error in API call to users.list: %s", err)
             raise self.SlackApiError("Unable to call the Slack command 'users.list'.")
 
-        def extract_name(user_name: Text) -> Text:
-            """ Extract the specific user's ID from the API call results """
-            for user in api_call["members"]:
-                if "name" in user and user["name"] == user_name:
-                    return user["id"]
-            raise self.SlackApiError("Unable to find a user with name {name}"
-                                     .format(name=user_name))
-
-        return tuple(extract_name(name) for name in names)
+        for name, user_id in zip(names, ids):
+            if user_id is None:
+                raise self.SlackApiError("Unable to find a user with name {name}"
+                                         .format(name=name))
+        return ids
 
     ################################################################################################
     # Standard entry point
@@ -149,20 +425,24 @@ class GifBot:
         """
         delay = ERR_DELAY
 
-        while True:
+        while not self.stopped:
             # Try to connect to the client, and loop through messages
             try:
                 if self.client.rtm_connect():
                     self.log.info("Bot connected to Slack RTM API")
-                    while True:
+                    while not self.stopped:
                         rtm_messages = self.client.rtm_read()
                         self.handle(rtm_messages)
                         sleep(STD_DELAY)
                 else:
                     self.log.error("Bot is unable to connect to the Slack service")
             except:  # pylint: disable=bare-except
-                self.log.error("Unknown exception encountered.")
-                self.log.error(str(exc_info()[0]))
+                self.log.exception("Unknown exception encountered.")
+                if self.metrics is not None:
+                    self.metrics.inc("gif_bot_connection_errors_total")
+
+            if self.stopped:
+                return
 
             # If we cannot connect or we get disconnected, wait for a while before retrying
             if delay < MAX_DELAY:
@@ -173,6 +453,21 @@ class GifBot:
                 self.log.error("Maximum number of exceptions caught. Exiting...")
                 return
 
+    def stop(self) -> None:
+        """
+        Asks the bot to stop running once it has finished handling its current batch of messages,
+        and waits for any queued Slack API calls to be made
+        """
+        self.stopped = True
+        self.reloader.close()
+        if self.link_checker is not None:
+            self.link_checker.close()
+        self.dispatcher.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.journal is not None:
+            self.journal.close()
+
     ################################################################################################
     # Message handlers
     ################################################################################################
@@ -186,12 +481,26 @@ class GifBot:
 
         for message_obj in rtm_messages:
             if message_obj["type"] == "message":
-                self.handle_message(message_obj)
+                # A failed Slack API call only affects the current message, so shouldn't drop the
+                # connection to the RTM API
+                try:
+                    self.handle_message(message_obj)
+                except self.SlackApiError as err:
+                    self.log.error(str(err))
 
-    #pylint: disable=inconsistent-return-statements
     def handle_message(self, message_obj) -> None:
         """
-        Handles an individual Slack RTM message read from the client service
+        Handles an individual Slack RTM message read from the client service, tagging anything
+        logged while doing so with the message's channel and timestamp
+        :param message_obj: An individual message extracted from the output of SlackClient::rtm_read
+        """
+        with correlation("{}:{}".format(message_obj.get("channel"), message_obj.get("ts"))):
+            self._route_message(message_obj)
+
+    #pylint: disable=inconsistent-return-statements
+    def _route_message(self, message_obj) -> None:
+        """
+        Passes a message on to the right handler, if it needs handling
         :param message_obj: An individual message extracted from the output of SlackClient::rtm_read
         """
         # It isn't a real message, so abort
@@ -214,11 +523,12 @@ class GifBot:
                                        message_obj["channel"],
                                        message_obj["ts"])
 
-        # Handle messages containing trigger words
-        if self.is_trigger(message_obj["text"]):
-            return self.handle_trigger(message_obj["channel"], message_obj["ts"])
+        # Handle messages containing trigger words, collapsing bursts of them if configured to
+        if self.is_trigger(message_obj["text"], message_obj["channel"]):
+            if self.trigger_coalescer is not None:
+                return self.handle_burst(message_obj["channel"], message_obj["ts"])
+            return self.handle_trigger(message_obj["channel"], message_obj["ts"], droppable=True)
 
-    # pylint: disable=inconsistent-return-statements,too-many-return-statements
     def handle_command(self, message: Text, channel: Text, time_stamp: Text) -> None:
         """
         Handles a direct command given from the bot owner in a direct message
@@ -226,61 +536,14 @@ class GifBot:
         :param channel: The channel ID where the message came from
         :param time_stamp: The timestamp of the message
         """
-        tokens = re.split(r"\s+", message)
-
-        if not tokens:
+        if self.commands.dispatch(Tokens(message), channel, time_stamp, admin=True):
             return
 
-        if tokens[0] == "add" and len(tokens) > 1:
-            # Add a GIF into the store
-            self.store.add_gif(tokens[1], set(tokens[2:]))
-            return self.post_message(text="Adding {gif}\nType `save` to save this to the manifest."
-                                     .format(gif=tokens[1]),
-                                     channel=channel)
-
-        if tokens[0] == "remove" and len(tokens) == 2:
-            # Remove a GIF from the store
-            self.store.remove_gif(tokens[1])
-            return self.post_message(text="Removing " + tokens[1], channel=channel)
-
-        if tokens[0] == "status":
-            # Gets information about the GIF store
-            return self.post_message(text=self.store.get_info(max_tags=10), channel=channel)
-
-        if tokens[0] == "compare" and len(tokens) >= 2:
-            # Compare the counts of multiple different tag types
-            return self.handle_compare(channel, tokens[1:])
-
-        if tokens[0] == "request":
-            # Handle a request for a particular GIF type
-            if len(tokens) == 1:
-                return self.handle_trigger(channel=channel, time_stamp=time_stamp)
-            return self.handle_trigger(channel=channel, time_stamp=time_stamp, gif_type=tokens[1])
-
-        if tokens[0] == "reload":
-            # Reload the store from the file
-            self.store = GifStore(adjectives=self.adjectives,
-                                  manifest_data=open(self.manifest_loc).read())
-            return self.post_message(text="Manifest reloaded", channel=channel)
-
-        if tokens[0] == "save":
-            # Save the store to the file
-            self.store.save_manifest(self.manifest_loc)
-            return self.post_message(text="Manifest saved", channel=channel)
-
-        # We've not had a valid trigger, so post a default message
-        self.post_message(text="Sorry, I don't understand that command.\n"
-                               "Supported commands:\n"
-                               "  `add url token1 token2...`\n"
-                               "  `remove url`\n"
-                               "  `status`\n"
-                               "  `request cat`\n"
-                               "  `compare cat dog alpaca`\n"
-                               "  `reload`\n"
-                               "  `save`",
+        # We've not had a valid command, so post a default message
+        self.post_message(text="Sorry, I don't understand that command.\nSupported commands:\n" +
+                          self.commands.help_text(admin=True),
                           channel=channel)
 
-    # pylint: disable=inconsistent-return-statements,too-many-return-statements
     def handle_mention(self, message: Text, channel: Text, time_stamp: Text) -> None:
         """
         Handles a mention or direct message to the bot.
@@ -288,50 +551,52 @@ class GifBot:
         :param channel: The channel ID where the message came from
         :param time_stamp: The timestamp of the message
         """
-        tokens = re.split(r"\s+", message.lower())
-
-        if len(tokens) < 2:
+        # The first word is the mention itself, so the command starts from the second
+        tokens = Tokens(message, lower=True)
+        if tokens.get(1) is None:
             return
 
-        if tokens[1] == "help":
-            message = "Hi! I know the following commands:\n" \
-                   "  `help` : Display self message\n" \
-                   "  `about` : Display info about me\n" \
-                   "  `status` : Give a status report of the bot\n" \
-                   "  `request cat` : Request a cat GIF\n" \
-                   "  `compare cat dog` : Compare the number of GIFs I know about"
-            return self.post_message(text=message, channel=channel)
-
-        if tokens[1] == "about":
-            message = "I'm a wholesome bot created by *Matthew Bedder*. You can " \
-                   "read my source-code at `https://github.com/bedder/gifbot`."
-            return self.post_message(text=message, channel=channel)
-
-        if tokens[1] == "status":
-            return self.post_message(text=self.store.get_info(max_tags=10), channel=channel)
-
-        if tokens[1] == "request":
-            if len(tokens) == 2:
-                return self.handle_trigger(channel=channel, time_stamp=time_stamp)
-            return self.handle_trigger(channel=channel, time_stamp=time_stamp, gif_type=tokens[2])
-
-        if tokens[1] == "compare" and len(tokens) > 2:
-            return self.handle_compare(channel, tokens[2:])
+        if self.commands.dispatch(tokens, channel, time_stamp, start=1):
+            return
 
         self.post_message(text="Sorry, I don't understand that!\n(HINT: try `@{} help` to see "
                                "a list of suitable commands)".format(self.bot_name),
                           channel=channel)
 
-    def handle_trigger(self, channel: Text, time_stamp: Text, gif_type: Text = "all") -> None:
+    def handle_trigger(self, channel: Text, time_stamp: Text, gif_type: Text = "all",
+                       droppable: bool = False) -> None:
         """
         Handles an message containing a trigger message
         :param channel: The channel ID where the message came from
         :param time_stamp: The timestamp of the message
         :param gif_type: The type of GIF that we should return
+        :param droppable: Whether the GIF can be dropped if posting it would be rate limited
+        """
+        success = self.post_gif(channel, gif_type, droppable=droppable)
+        settings = self.channel_settings.get(channel, self.default_settings)
+        self.post_reaction(channel, time_stamp,
+                           random.choice(settings.reactions) if success else "broken_heart")
+
+    def handle_burst(self, channel: Text, time_stamp: Text) -> None:
+        """
+        Handles a message containing a trigger word, only posting a GIF if there hasn't been
+        one for another trigger in the channel recently. Every trigger is still reacted to.
+        :param channel: The channel ID where the message came from
+        :param time_stamp: The timestamp of the message
         """
-        success = self.post_gif(channel, gif_type)
+        burst, is_new = self.trigger_coalescer.join(channel)
+        if is_new:
+            success = False
+            try:
+                success = self.post_gif(channel, droppable=True)
+            finally:
+                # The other triggers in the burst wait for this, even if posting the GIF failed
+                self.trigger_coalescer.posted(burst, success)
+        else:
+            success = burst.wait()
+        settings = self.channel_settings.get(channel, self.default_settings)
         self.post_reaction(channel, time_stamp,
-                           random.choice(self.reactions) if success else "broken_heart")
+                           random.choice(settings.reactions) if success else "broken_heart")
 
     def handle_compare(self, channel: Text, tokens: List[Text]) -> None:
         """
@@ -343,8 +608,14 @@ class GifBot:
         best_tag = "neither of them!"
         msg = "Current GIF counts:\n```"
 
+        settings = self.channel_settings.get(channel, self.default_settings)
         for token in tokens:
-            count = self.store.get_count(token)
+            try:
+                with self.reading_store() as store:
+                    count = store.get_count(settings.query(token))
+            except QueryError as err:
+                return self.post_message("Sorry, I don't understand `{}`: {} :weary:"
+                                         .format(token, err), channel=channel)
             msg += "  {token} : {count}\n".format(token=token, count=count)
 
             if count == 0:
@@ -362,6 +633,120 @@ class GifBot:
 
         self.post_message(text=msg, channel=channel)
 
+    ################################################################################################
+    # Commands
+    ################################################################################################
+    def _register_commands(self) -> CommandRegistry:
+        """ Registers the commands understood by the bot, in the order they are listed in help """
+        commands = CommandRegistry()
+        commands.register("help", self._command_help, description="Display this message")
+        commands.register("about", self._command_about, description="Display info about me")
+        commands.register("status", self._command_status,
+                          description="Give a status report of the bot")
+        commands.register("request", self._command_request, "request cat", "Request a cat GIF",
+                          max_args=1,
+                          examples=[("request cat+dog", "Request a GIF that's a cat and a dog "
+                                                        "(or `cat|alpaca` for a cat or an alpaca, "
+                                                        "or `cat-angry` for a cat but not angry)")])
+        commands.register("compare", self._command_compare, "compare cat dog",
+                          "Compare the number of GIFs I know about", min_args=1, max_args=None)
+        commands.register("add", self._command_add, "add url token1 token2...",
+                          "Add a GIF with some tags", min_args=1, max_args=None, admin=True)
+        commands.register("remove", self._command_remove, "remove url", "Remove a GIF",
+                          min_args=1, max_args=1, strict=True, admin=True)
+        commands.register("reload", self._command_reload,
+                          description="Reload the manifest in the background", admin=True)
+        commands.register("save", self._command_save,
+                          description="Save any changes to the manifest", admin=True)
+        return commands
+
+    def _command_help(self, command: Invocation) -> None:
+        """ Lists the commands that the user can give """
+        header = "Supported commands:\n" if command.admin else \
+            "Hi! I know the following commands:\n"
+        self.post_message(text=header + self.commands.help_text(command.admin),
+                          channel=command.channel)
+
+    def _command_about(self, command: Invocation) -> None:
+        """ Describes the bot """
+        message = "I'm a wholesome bot created by *Matthew Bedder*. You can " \
+                  "read my source-code at `https://github.com/bedder/gifbot`."
+        self.post_message(text=message, channel=command.channel)
+
+    def _command_status(self, command: Invocation) -> None:
+        """ Gets information about the GIF store, as far as the channel is allowed to see it """
+        settings = self.channel_settings.get(command.channel, self.default_settings)
+        with self.reading_store() as store:
+            info = store.get_info(max_tags=10, restrict=settings.query
+                                  if settings.tag_filter is not None else None)
+        self.post_message(text=info, channel=command.channel)
+
+    def _command_request(self, command: Invocation) -> None:
+        """ Handles a request for a particular GIF type """
+        if not command.args:
+            return self.handle_trigger(channel=command.channel, time_stamp=command.time_stamp)
+        return self.handle_trigger(channel=command.channel, time_stamp=command.time_stamp,
+                                   gif_type=command.args[0])
+
+    def _command_compare(self, command: Invocation) -> None:
+        """ Compares the counts of multiple different tag types """
+        self.handle_compare(command.channel, command.args)
+
+    def _command_add(self, command: Invocation) -> None:
+        """ Adds a GIF into the store """
+        url = command.args[0]
+        try:
+            with self.store_lock:
+                self._writable_store().add_gif(url, set(command.args[1:]))
+        except WeightError as err:
+            return self.post_message(text="Sorry, {} :weary:".format(err), channel=command.channel)
+        self.post_message(text="Adding {gif}\nType `save` to save this to the manifest."
+                          .format(gif=url),
+                          channel=command.channel)
+
+    def _command_remove(self, command: Invocation) -> None:
+        """ Removes a GIF from the store """
+        with self.store_lock:
+            self._writable_store().remove_gif(command.args[0])
+            if self.link_health is not None:
+                self.link_health.forget(command.args[0])
+        self.post_message(text="Removing " + command.args[0], channel=command.channel)
+
+    def _command_reload(self, command: Invocation) -> None:
+        """
+        Reloads the store from the file in the background, carrying on serving GIFs from the
+        current store until the new one is ready
+        """
+        self.reloader.reload().add_done_callback(
+            lambda future: self._report_reload(future, command.channel))
+        self.post_message(text="Reloading the manifest...", channel=command.channel)
+
+    def _report_reload(self, future: Future, channel: Text) -> None:
+        """
+        Lets the bot owner know that a reload they asked for has finished
+        :param future: The future for the reload
+        :param channel: The channel ID where the reload was requested
+        """
+        text = "Manifest reloaded" if future.exception() is None else \
+            "Unable to reload the manifest :weary:"
+        try:
+            self.post_message(text=text, channel=channel)
+        except self.SlackApiError as err:
+            self.log.error(str(err))
+
+    def _command_save(self, command: Invocation) -> None:
+        """
+        Saves the store to the file. With a journal, changes have already been written to it, so
+        they just need to be forced onto the disk.
+        """
+        with self.reading_store() as store:
+            if store.journal is not None:
+                store.journal.sync()
+            else:
+                with self.reloader.writing_manifest():
+                    store.save_manifest(self.manifest_loc)
+        self.post_message(text="Manifest saved", channel=command.channel)
+
     ################################################################################################
     # Message type tests
     ################################################################################################
@@ -371,52 +756,85 @@ class GifBot:
         :param message: The text of the command message
         :return: Whether the message mentions the bot
         """
-        return "@" + self.bot_name in message.split(" ")[0]
+        return self.mention in first_word(message)
 
-    def is_trigger(self, message: Text) -> bool:
+    def is_trigger(self, message: Text, channel: Optional[Text] = None) -> bool:
         """
         Checks to see if the message contains a trigger word
         :param message: The text of the command message
+        :param channel: The channel ID where the message came from, whose triggers are used
         :return: Whether the message is a trigger
         """
-        for trigger in self.triggers:
-            if trigger.lower() in message.lower():
-                return True
-        return False
+        return self.channel_settings.get(channel, self.default_settings).matcher.matches(message)
 
     ################################################################################################
     # Slack API wrapper functions
     ################################################################################################
-    def post_message(self, text: Text, channel: Text) -> None:
+    def post_message(self, text: Text, channel: Text, blocks: Optional[Text] = None,
+                     droppable: bool = False) -> bool:
         """
         Helper function to post a message into a channel
         :param text: The text we want to post
         :param channel: The channel ID where the message came from
+        :param blocks: The JSON of any Slack blocks to show in place of the text
+        :param droppable: Whether the message can be dropped if posting it would be rate limited
+        :return: Whether the message was posted (or queued to be posted), rather than dropped
         """
+        kwargs = {} if blocks is None else {"blocks": blocks}
         try:
-            self.client.api_call("chat.postMessage", channel=channel, text=text, as_user=True)
+            future = self.dispatcher.submit("chat.postMessage", channel, droppable=droppable,
+                                            channel=channel, text=text, as_user=True, **kwargs)
         except Exception as _:
             raise self.SlackApiError("Unable to call the Slack command 'chat.postMessage'.")
+        # Without any API workers the call has already been made, so it's known if it was dropped
+        if self.dispatcher.workers == 0:
+            response = future.result()
+            return not (isinstance(response, dict) and response.get("dropped"))
+        return True
 
-    def post_gif(self, channel: Text, gif_type: Text = "all") -> bool:
+    def post_gif(self, channel: Text, gif_type: Text = "all", droppable: bool = False) -> bool:
         """
         Attempts to retrieve a GIF from the store, and post it into the desired channel
         :param channel: The channel ID where the message came from
         :param gif_type: The GIF type we want to post
+        :param droppable: Whether the GIF can be dropped if posting it would be rate limited
         :return: Whether we were able to successfully find and post the GIF
         """
         self.log.info("Retrieving gif of type %s", gif_type)
-        url = self.store.get_gif(gif_type)
+        settings = self.channel_settings.get(channel, self.default_settings)
+        try:
+            url = self.choose_gif(channel, settings.query(gif_type))
+        except QueryError as err:
+            self.post_message("Sorry, I don't understand `{}`: {} :weary:".format(gif_type, err),
+                              channel=channel)
+            return False
 
         if url:
-            text = random.choice(self.greetings).format(random.choice(self.nouns)) + " " + url
-            self.post_message(text=text, channel=channel)
-            return True
+            if self.gif_blocks:
+                text, blocks = self.templates.render_blocks(
+                    url, "GIF" if gif_type == ALL else gif_type + " GIF")
+                return self.post_message(text=text, channel=channel, blocks=blocks,
+                                         droppable=droppable)
+            return self.post_message(text=self.templates.render(url), channel=channel,
+                                     droppable=droppable)
 
         self.post_message("Sorry, I have no gifs of type `{}` :weary:".format(gif_type),
                           channel=channel)
         return False
 
+    def choose_gif(self, channel: Text, query: Text) -> Optional[Text]:
+        """
+        Picks a GIF from the store, avoiding any posted in the channel recently
+        :param channel: The channel ID where the GIF will be posted
+        :param query: The query that the GIF should match, with the channel's tag filter applied
+        :return: The URL of the GIF, or None if no GIFs match the query
+        :raises QueryError: If the query is malformed
+        """
+        with self.reading_store() as store:
+            if self.recently_posted is not None:
+                return self.recently_posted.choose(store, channel, query)
+            return store.get_gif(query)
+
     def post_reaction(self, channel: Text, time_stamp: Text, reaction_str: Text) -> None:
         """
         Post a reaction in response to a particular message
@@ -426,8 +844,10 @@ class GifBot:
         """
         self.log.info("Adding reaction [%s] to message [ts:%s]", reaction_str, time_stamp)
         try:
-            self.client.api_call("reactions.add", name=reaction_str, channel=channel,
-                                 timestamp=time_stamp)
+            # Reactions are queued behind the channel's messages, so they never land before the GIF
+            # or reply that they go with
+            self.dispatcher.submit("reactions.add", channel, droppable=False,
+                                   name=reaction_str, channel=channel, timestamp=time_stamp)
 
         except Exception as _:
             raise self.SlackApiError("Unable to call the Slack command 'reactions.add'.")
@@ -24,131 +24,446 @@
 Implementation of the ``GifStore`` class.
 """
 
-import random
-from typing import Text, List, Optional, Dict, Set  # pylint: disable=unused-import
+import csv
+import heapq
+import io
+import threading
+from array import array
+from functools import wraps
+from typing import (Any, Callable, Container, Text, Iterable,  # pylint: disable=unused-import
+                    Iterator, List, Optional, Dict, Sequence, Set, Tuple, Union)
+
+from gif_bot.journal import Journal
+from gif_bot.query import ALL, CountCache, QueryError, QueryPlan, compile_query, quote_tag
+from gif_bot.selection import DEFAULT_WEIGHT, FenwickTree, WeightError, split_weight, weight_tag
+from gif_bot.storage import CompactStorage, Element, ObjectStorage
+from gif_bot.tag_index import TagIndex
+from gif_bot.templates import StatusTemplates
+from gif_bot.utils import atomic_write
+
+
+# Tombstoned slots are only compacted away once there are at least this many of them, and they
+# outnumber the live elements
+COMPACTION_MIN_TOMBSTONES = 64
+
+
+def _locked(method: Callable) -> Callable:
+    """ Makes a method of ``GifStore`` hold the store's lock while it runs """
+    @wraps(method)
+    def _wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return _wrapper
+
+
+def read_manifest(lines: Iterable[Text]) -> Iterator[Tuple[Text, Set[Text]]]:
+    """
+    Lazily parses the lines of a manifest file, which may use CSV quoting
+    :param lines: The lines of the manifest, e.g. an open file
+    :return: A generator of (url, tags) pairs
+    """
+    for row in csv.reader(lines):
+        if len(row) >= 2:
+            yield row[0], set(row[1:])
+
+
+def write_manifest(elements: Iterable[Element], filename: Text) -> None:
+    """
+    Atomically writes a manifest file
+    :param elements: The GIFs to write into the manifest
+    :param filename: The name of the manifest file
+    """
+    with atomic_write(filename) as file:
+        writer = csv.writer(file, lineterminator="\n")
+        for element in elements:
+            writer.writerow([element.url] + list(element.tags))
+
+
+def describe_store(num_gifs: int, ranked_tags: List[Tuple[Text, int]], num_tags: int,
+                   templates: StatusTemplates) -> Text:
+    """
+    Describes the contents of a store
+    :param num_gifs: The number of GIFs in the store
+    :param ranked_tags: The (tag, count) pairs to describe, most common first
+    :param num_tags: The total number of tags in the store
+    :param templates: The pre-rendered lines describing each tag
+    """
+    lines = ["We have " + str(num_gifs) + " gifs, including..."]
+    for tag, count in ranked_tags:
+        lines.append(templates.render(tag, count))
+    if num_tags > len(ranked_tags):
+        lines.append("... and many more!")
+    return "\n".join(lines)
+
+
+def rank_restricted_tags(ranked_tags: List[Tuple[Text, int]], count: Callable[[Text], int],
+                         max_tags: int) -> Tuple[List[Tuple[Text, int]], bool]:
+    """
+    Ranks tags by how many of their GIFs are allowed by a restriction (such as a channel's tag
+    filter). A tag never has more GIFs allowed than it has in all, so tags are only counted until
+    none of the rest could make the cut.
+    :param ranked_tags: Every (tag, count) pair, most common first
+    :param count: Counts the GIFs carrying a tag that are allowed
+    :param max_tags: The maximum number of tags to return, or 0 for all
+    :return: Up to ``max_tags`` (tag, allowed count) pairs, most common first, and whether any
+             other tags have GIFs that are allowed
+    """
+    top = []  # type: List[Tuple[int, int, Text]]
+    more = False
+    for position, (tag, full_count) in enumerate(ranked_tags):
+        if max_tags and len(top) == max_tags and top[0][0] >= full_count:
+            more = any(count(rest) for rest, _ in ranked_tags[position:])
+            break
+        allowed = count(tag)
+        if allowed == 0:
+            continue
+        # Ties are kept in the original order
+        if not max_tags or len(top) < max_tags:
+            heapq.heappush(top, (allowed, -position, tag))
+        else:
+            heapq.heappushpop(top, (allowed, -position, tag))
+            more = True
+    return [(tag, allowed) for allowed, _, tag in sorted(top, reverse=True)], more
+
+
+def describe_restricted_store(store: Any, ranked_tags: List[Tuple[Text, int]], max_tags: int,
+                              restrict: Callable[[Text], Text]) -> Text:
+    """
+    Describes the GIFs in a store that a restriction allows
+    :param store: The store to describe
+    :param ranked_tags: Every (tag, count) pair in the store, most common first
+    :param max_tags: The maximum number of tags to describe, or 0 for all
+    :param restrict: Restricts a query to the allowed GIFs
+    """
+    def count(tag: Text) -> int:
+        try:
+            return store.get_count(restrict(quote_tag(tag)))
+        except QueryError:
+            return 0
+
+    ranked, more = rank_restricted_tags(ranked_tags, count, max_tags)
+    return describe_store(store.get_count(restrict(ALL)), ranked, len(ranked) + more,
+                          store.status_templates)
+
+
+def choose_gif(plan: QueryPlan, source: Any, url: Callable[[int], Text],
+               exclude: Optional[Container[Text]] = None,
+               unavailable: Optional[Container[Text]] = None) -> Optional[int]:
+    """
+    Chooses a GIF that matches a query
+    :param plan: The compiled query
+    :param source: The store to choose from
+    :param url: Gets the URL of a GIF from its element ID
+    :param exclude: The URLs of GIFs to avoid choosing, unless they're the only matches
+    :param unavailable: The URLs of GIFs that must never be chosen (e.g. because they're broken)
+    :return: The element ID of the GIF, or None if nothing that is available matches
+    """
+    element_id = None
+    if exclude:
+        element_id = plan.choose(source, lambda excluded: url(excluded) in exclude or
+                                 (unavailable is not None and url(excluded) in unavailable))
+    if element_id is None:
+        element_id = plan.choose(source, lambda excluded: url(excluded) in unavailable) \
+            if unavailable else plan.choose(source)
+    return element_id
 
 
 class GifStore:
     """ An storage and accessor class for maintaining a collection of nice, wholesome GIFs """
 
-    class Element:  # pylint: disable=too-few-public-methods
-        """ Storage struct for GIF data """
-        def __init__(self, url: Text, tags: Set[Text]) -> None:
-            self.url = url
-            self.tags = tags
+    Element = Element
+
+    class Elements:
+        """ A read-only view of the live elements in the store """
+        def __init__(self, store: "GifStore") -> None:
+            self._store = store
+
+        def __len__(self) -> int:
+            return len(self._store.storage) - self._store.tombstones
+
+        def __iter__(self) -> Iterator[Element]:
+            store = self._store
+            return (store.element(slot) for slot in range(len(store.storage))
+                    if store.storage.is_live(slot))
 
     def __init__(self, adjectives: Optional[List[Text]] = None,
-                 manifest_data: Optional[Text] = None) -> None:
-        self.elements = []  # type: List[GifStore.Element]
-        self.tags = {}  # type: Dict[Text, int]
+                 manifest_data: Optional[Union[Text, Iterable[Text]]] = None,
+                 compact: bool = False) -> None:
+        """
+        :param adjectives: The adjectives used to describe GIFs in the store's status
+        :param manifest_data: The manifest to load GIFs from, either as text or as an iterable of
+                              lines (such as an open file), which is read one line at a time
+        :param compact: Whether to use the compact storage backend
+        """
+        # Elements live in slots, with removed elements left as tombstones until the slots are next
+        # compacted. Slot numbers are the element IDs used by the tag index. Compact storage trades
+        # a little lookup speed for a much smaller memory footprint.
+        self.storage = CompactStorage() if compact else ObjectStorage()
+        self.tombstones = 0
+        self.url_slots = {}  # type: Dict[Text, int]
+        self.index = TagIndex()
+        self.counts = CountCache()
+        # The weight of each slot, which is only kept once any GIF has a weight other than 1, and a
+        # tree over them that is only built once a weighted choice is needed
+        self.weights = None  # type: Optional[array]
+        self._max_weight = DEFAULT_WEIGHT
+        self._weight_tree = None  # type: Optional[FenwickTree]
         self.modifiers = adjectives if adjectives is not None else ["wholesome"]
+        self.status_templates = StatusTemplates(self.modifiers)
+        # Once attached, changes made through ``add_gif`` and ``remove_gif`` are also recorded here
+        self.journal = None  # type: Optional[Journal]
+        # The number of the journal's records that the store included once it was loaded
+        self.journal_records = 0
+        # The URLs of GIFs that are known to be broken, which are never chosen
+        self.unavailable = None  # type: Optional[Container[Text]]
+        # Messages are handled on several threads, so changes to the store (which move elements
+        # between slots and rebuild the index) mustn't overlap with anything reading it
+        self.lock = threading.RLock()
 
         if manifest_data is not None:
-            for line in manifest_data.splitlines():
-                line_data = line.split(",")
-                if len(line_data) >= 2:
-                    self.add_gif(line_data[0], set(line_data[1:]))
+            self.load_manifest(manifest_data)
+
+    def attach_journal(self, journal: Journal, start: int = 0) -> None:
+        """
+        Replays a journal of changes over the store, and then records any further changes in it
+        :param journal: The journal of changes to the store's manifest
+        :param start: The number of records at the start of the journal that the store already
+                      includes
+        """
+        self.journal = None
+        self.journal_records = journal.replay(self, start)
+        self.journal = journal
+
+    def _journal_changed(self) -> None:
+        """ Compacts the journal into the manifest once it has grown large enough """
+        if self.journal.needs_compaction(len(self.elements)):
+            self.journal.compact(self)
+
+    def load_manifest(self, manifest_data: Union[Text, Iterable[Text]]) -> None:
+        """
+        Adds all of the GIFs in a manifest into the store
+        :param manifest_data: The manifest, either as text or as an iterable of lines
+        :raises WeightError: If any GIF has a malformed weight
+        """
+        lines = io.StringIO(manifest_data) if isinstance(manifest_data, str) else manifest_data
+        for url, tags in read_manifest(lines):
+            try:
+                self.add_gif(url, tags)
+            except WeightError as err:
+                raise WeightError("{}: {}".format(url, err))
+
+    @property
+    def elements(self) -> "GifStore.Elements":
+        """ The live elements in the store """
+        return self.Elements(self)
 
+    @_locked
     def add_gif(self, url: Text, tags: Set[Text]) -> None:
         """
         Adds a GIF into the store
         :param url: The URL of the new GIF
-        :param tags: The tags for the new GIF
+        :param tags: The tags for the new GIF, which may include a ``weight=N`` pseudo-tag
+        :raises WeightError: If the weight isn't a finite, non-negative number
         """
-        existing_elements = [element for element in self.elements if element.url == url]
-        if existing_elements:
-            # Add any new tags
-            for tag in tags.difference(existing_elements[0].tags):
-                self.tags[tag] = 1
-
-            # Add the new tags to the existing record
-            existing_elements[0].tags.update(tags)
+        plain_tags, weight = split_weight(tags)
+        slot = self.url_slots.get(url)
+        if slot is not None:
+            # Add any new tags to the existing record
+            new_tags = self.storage.add_tags(slot, plain_tags)
+            self.index.add(slot, new_tags)
+            reweighted = weight is not None and self._set_weight(slot, weight)
+            if not new_tags and not reweighted:
+                return
+            self.counts.invalidate(new_tags)
         else:
             # Add a new record
-            self.elements.append(self.Element(url, tags))
-            for tag in tags:
-                if tag in self.tags.keys():
-                    self.tags[tag] += 1
-                else:
-                    self.tags[tag] = 1
+            slot = self.storage.append(url, plain_tags)
+            self.url_slots[url] = slot
+            self.index.add(slot, plain_tags)
+            self.counts.invalidate(plain_tags)
+            if self.weights is not None:
+                self._append_weight(DEFAULT_WEIGHT if weight is None else weight)
+            elif weight is not None:
+                self._set_weight(slot, weight)
+
+        if self.journal is not None:
+            self.journal.record_add(url, tags)
+            self._journal_changed()
 
+    @_locked
+    def merge_gifs(self, url: Text, duplicates: Iterable[Text]) -> None:
+        """
+        Merges copies of a GIF into one, which is given all of their tags
+        :param url: The URL of the copy to keep
+        :param duplicates: The URLs of the copies to remove
+        """
+        for duplicate in duplicates:
+            slot = self.url_slots.get(duplicate)
+            if slot is None or duplicate == url:
+                continue
+            self.add_gif(url, set(self.storage.tags(slot)))
+            self.remove_gif(duplicate)
+
+    @_locked
     def remove_gif(self, url: Text) -> None:
         """
         Removes a GIF from the store
         :param url: The URL of the GIF we want to remove
         """
-        matches = [e for e in self.elements
-                   if e.url == url]
-        if not matches:
+        slot = self.url_slots.pop(url, None)
+        if slot is None:
             return
-        self.elements = [e for e in self.elements if e.url != url]
-        # Update the tags
-        match_tags = [t for t_ in matches
-                      for t in t_.tags]
-        for tag in match_tags:
-            self.tags[tag] -= 1
-            if self.tags[tag] == 0:
-                del self.tags[tag]
+
+        self.index.discard(slot, self.storage.tags(slot))
+        self.counts.invalidate(self.storage.tags(slot))
+        if self.weights is not None:
+            self._set_weight(slot, 0.)
+        self.storage.clear(slot)
+        self.tombstones += 1
+
+        if self.tombstones >= COMPACTION_MIN_TOMBSTONES and \
+                self.tombstones > len(self.storage) - self.tombstones:
+            self.compact()
+
+        if self.journal is not None:
+            self.journal.record_remove(url)
+            self._journal_changed()
+
+    def _append_weight(self, weight: float) -> None:
+        """ Records the weight of a newly appended slot """
+        self.weights.append(weight)
+        self._max_weight = max(self._max_weight, weight)
+        if self._weight_tree is not None:
+            self._weight_tree.append(weight)
+
+    def _set_weight(self, slot: int, weight: float) -> bool:
+        """
+        Changes the weight of a slot
+        :return: Whether the weight changed
+        """
+        if self.weights is None:
+            if weight == DEFAULT_WEIGHT:
+                return False
+            self.weights = array("d", (DEFAULT_WEIGHT if self.storage.is_live(other) else 0.
+                                       for other in range(len(self.storage))))
+        old_weight = self.weights[slot]
+        if old_weight == weight:
+            return False
+        self.weights[slot] = weight
+        self._max_weight = max(self._max_weight, weight)
+        if self._weight_tree is not None:
+            self._weight_tree.add(slot, weight - old_weight)
+        return True
+
+    @_locked
+    def compact(self) -> None:
+        """
+        Drops any tombstoned slots, renumbering the remaining elements
+        """
+        if self.weights is not None:
+            self.weights = array("d", (weight for slot, weight in enumerate(self.weights)
+                                       if self.storage.is_live(slot)))
+            self._max_weight = max(self.weights, default=DEFAULT_WEIGHT)
+            self._weight_tree = None
+        self.storage = self.storage.compacted()
+        self.tombstones = 0
+        self.url_slots = {}
+        self.index.clear()
+        for slot in range(len(self.storage)):
+            self.url_slots[self.storage.url(slot)] = slot
+            self.index.add(slot, self.storage.tags(slot))
+
+    @property
+    def tags(self) -> TagIndex:
+        """
+        The tags in the store, usable as a mapping from each tag to the number of GIFs carrying it
+        """
+        return self.index
 
     def get_tags(self) -> Set[Text]:
         """
         Gets all of the tags in the store
         """
-        return {tag for tag in self.tags}
+        return set(self.index)
 
-    def get_info(self, max_tags: int) -> Text:
+    @_locked
+    def get_info(self, max_tags: int, restrict: Optional[Callable[[Text], Text]] = None) -> Text:
         """
         Gets the status of the store
-        :param max_tags: The maximum number of tags to return
-        """
-        text = "We have " + str(len(self.elements)) + " gifs, including..."
-        if max == 0 or len(self.tags) < max_tags:
-            for tag in self.tags:
-                count = self.tags[tag]
-                text += "\n  " + str(count) + \
-                        " " + random.choice(self.modifiers) + \
-                        " " + tag + \
-                        " gif" + ("s" if count > 1 else "") + "!"
-        else:
-            for tag in random.sample(list(self.tags), max_tags):
-                count = self.tags[tag]
-                text += "\n  " + str(count) + \
-                        " " + random.choice(self.modifiers) + \
-                        " " + tag + \
-                        " gif" + ("s" if count > 1 else "") + "!"
-            text += "\n... and many more!"
-        return text
+        :param max_tags: The maximum number of tags to return (the most common ones), or 0 for all
+        :param restrict: Restricts a query to the GIFs to describe (e.g. a channel's
+                         ``ChannelSettings.query``), or None to describe every GIF
+        """
+        histogram = self.index.histogram
+        if restrict is not None:
+            return describe_restricted_store(self, histogram.top(len(histogram)), max_tags,
+                                             restrict)
+        return describe_store(len(self.elements), histogram.top(max_tags or len(histogram)),
+                              len(histogram), self.status_templates)
 
+    @_locked
     def get_count(self, tag: Text) -> int:
         """
-        Gets the number of GIFs containing the provided tag(s)
-        :param tag: A tag, or multiple tags joined with "+"  (e.g. `"cat+dog`")
+        Gets the number of GIFs matching the provided query. GIFs with a weight of 0 are still
+        counted, although they're never chosen.
+        :param tag: A tag, or a query combining tags (e.g. `"cat+dog"`, `"cat|alpaca"` or
+                    `"cat-angry"`)
+        :raises QueryError: If the query is malformed
         """
-        sub_tags = tag.split("+")
-        return len([e for e in self.elements if all(t in e.tags for t in sub_tags)])
+        return self.counts.count(tag, self)
 
-    def get_gif(self, tag: Text) -> Optional[Text]:
+    @_locked
+    def get_gif(self, tag: Text, exclude: Optional[Container[Text]] = None) -> Optional[Text]:
         """
-        Gets a GIF of the provided type
-        :param tag: A tag, or multiple tags joined with "+"  (e.g. `"cat+dog`")
-        :return: Either a URL if a GIF of the provided type exists in the store, else None
+        Gets a GIF of the provided type, chosen in proportion to the GIFs' weights
+        :param tag: A tag, or a query combining tags (e.g. `"cat+dog"`, `"cat|alpaca"` or
+                    `"cat-angry"`)
+        :param exclude: The URLs of GIFs to avoid choosing, unless they're the only matches
+        :return: Either a URL if an available GIF of the provided type exists in the store, else
+                 None
+        :raises QueryError: If the query is malformed
         """
-        if tag == "all":
-            matches = self.elements
-        else:
-            sub_tags = tag.split("+")
-            matches = [e for e in self.elements if all(t in e.tags for t in sub_tags)]
-        return random.choice(matches).url if matches else None
+        slot = choose_gif(compile_query(tag), self, self.storage.url, exclude, self.unavailable)
+        return self.storage.url(slot) if slot is not None else None
+
+    def element(self, slot: int) -> Element:
+        """ Gets the GIF in a slot, with its weight as a pseudo-tag if it isn't the default """
+        element = self.storage.element(slot)
+        if self.weights is not None and self.weights[slot] != DEFAULT_WEIGHT:
+            element = Element(element.url, element.tags | {weight_tag(self.weights[slot])})
+        return element
+
+    def postings(self, tag: Text) -> Optional[Sequence[int]]:
+        """ Gets the (sorted) slots of the GIFs carrying a tag, for evaluating queries """
+        return self.index.postings(tag)
+
+    def universe(self) -> Sequence[int]:
+        """ Gets every slot in the store, including tombstones, for evaluating queries """
+        return range(len(self.storage))
+
+    def is_live(self, slot: int) -> bool:
+        """ Checks whether a slot holds a GIF, rather than a tombstone """
+        return self.storage.is_live(slot)
+
+    def weight(self, slot: int) -> float:
+        """ Gets the weight of the GIF in a slot """
+        return self.weights[slot] if self.weights is not None else DEFAULT_WEIGHT
+
+    def max_weight(self) -> Optional[float]:
+        """ Gets an upper bound on the GIFs' weights, or None if they all have the default """
+        return self._max_weight if self.weights is not None else None
+
+    def weight_tree(self) -> Optional[FenwickTree]:
+        """ Gets a tree over the GIFs' weights, or None if they all have the default """
+        if self.weights is not None and self._weight_tree is None:
+            self._weight_tree = FenwickTree.from_weights(self.weights)
+        return self._weight_tree
 
+    @_locked
     def save_manifest(self, filename: Text) -> None:
         """
-        Saves the current status of the store into the manifest file
+        Saves the current status of the store into the manifest file. The manifest is written to a
+        temporary file which then replaces the original, so a crash can't leave it half-written.
         :param filename: The name we should save the manifest file as
         """
-        file = open(filename, "w")
-        for element in self.elements:
-            line = element.url
-            for tag in element.tags:
-                line += "," + tag
-            file.write(line + "\n")
-        file.close()
+        write_manifest(self.elements, filename)
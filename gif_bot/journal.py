@@ -0,0 +1,183 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``Journal`` class, an append-only log of the changes made to a ``GifStore``.
+"""
+
+import csv
+import io
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import (Any, Callable, ContextManager, Iterable,  # pylint: disable=unused-import
+                    Iterator, List, Optional, Set, Text, Tuple)
+
+ADD = "+"
+REMOVE = "-"
+
+# The journal is only compacted into the manifest once it has at least this many records, and they
+# outnumber half of the GIFs in the store
+COMPACTION_MIN_RECORDS = 1000
+
+
+class Journal:
+    """
+    An append-only journal of GIFs added to and removed from a store, kept alongside its manifest.
+
+    Each change is appended to the journal as a single CSV line (``+,url,tag,...`` or ``-,url``), so
+    that saving changes costs O(changes) rather than rewriting the manifest. On start-up the journal
+    is replayed over the manifest, and every so often it is compacted by writing out a fresh
+    manifest and starting a new, empty journal.
+    """
+
+    def __init__(self, filename: Text, manifest_loc: Text, fsync: bool = False) -> None:
+        """
+        :param filename: The location of the journal file
+        :param manifest_loc: The location of the manifest file that the journal applies to
+        :param fsync: Whether to force every record to disk, rather than just flushing it to the OS
+        """
+        self.filename = filename
+        self.manifest_loc = manifest_loc
+        self.fsync = fsync
+        self.records = 0
+        self._lock = threading.RLock()
+        # The number of stores being loaded from the manifest and journal, which mustn't change
+        # underneath them
+        self._loading = 0
+        # Wraps rewriting the manifest when the journal is compacted, e.g. so that whatever watches
+        # the manifest for changes can ignore it
+        self.writing_manifest = nullcontext  # type: Callable[[], ContextManager]
+        self._file = None  # type: Optional[Any]
+
+    def _write(self, row: List[Text]) -> None:
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow(row)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.filename, "a", newline="")
+            self._file.write(line.getvalue())
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+
+    def record_add(self, url: Text, tags: Set[Text]) -> None:
+        """ Appends a record of a GIF (or extra tags for a GIF) being added """
+        self._write([ADD, url] + sorted(tags))
+
+    def record_remove(self, url: Text) -> None:
+        """ Appends a record of a GIF being removed """
+        self._write([REMOVE, url])
+
+    def sync(self) -> None:
+        """ Forces every record written so far onto the disk """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def read(self) -> Iterator[Tuple[Text, Text, Set[Text]]]:
+        """
+        Reads the records in the journal. A final record that was only partially written (for
+        example because the bot crashed while writing it) is ignored.
+        :return: A generator of (operation, url, tags) tuples
+        """
+        with self._lock:
+            try:
+                journal_file = open(self.filename, newline="")
+            except FileNotFoundError:
+                return
+            with journal_file:
+                complete_lines = (line for line in journal_file if line.endswith("\n"))
+                for row in csv.reader(complete_lines):
+                    if len(row) >= 2 and row[0] in (ADD, REMOVE):
+                        yield row[0], row[1], set(row[2:])
+
+    def replay(self, store: Any, start: int = 0) -> int:
+        """
+        Applies the changes recorded in the journal to a store. Replaying is idempotent, so it does
+        no harm if some of the changes have already been saved into the manifest.
+        :param store: The ``GifStore`` (which shouldn't yet be attached to the journal)
+        :param start: The number of records at the start of the journal to skip, because the
+                      store already includes them
+        :return: The number of records in the journal
+        """
+        count = 0
+        with self._lock:
+            for operation, url, tags in self.read():
+                if count >= start:
+                    if operation == ADD:
+                        store.add_gif(url, tags)
+                    else:
+                        store.remove_gif(url)
+                count += 1
+            self.records = count
+        return count
+
+    def count(self) -> int:
+        """ Counts the records in the journal file """
+        with self._lock:
+            return sum(1 for _ in self.read())
+
+    @contextmanager
+    def loading(self) -> Iterator[None]:
+        """
+        Stops the journal from being compacted while a new store is read from the manifest and
+        then has the journal replayed over it, as compacting in between would rewrite the manifest
+        and empty the journal, so that the new store missed (or repeated) changes
+        """
+        with self._lock:
+            self._loading += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._loading -= 1
+
+    def needs_compaction(self, store_size: int) -> bool:
+        """ Checks whether the journal has grown large enough to be worth compacting """
+        return not self._loading and self.records >= COMPACTION_MIN_RECORDS and \
+            self.records > store_size // 2
+
+    def compact(self, store: Any) -> None:
+        """
+        Atomically replaces the manifest with a snapshot of the store, and then empties the journal.
+        Nothing is done while a new store is being loaded.
+        :param store: The ``GifStore`` to snapshot
+        """
+        with self._lock:
+            if self._loading:
+                return
+            with self.writing_manifest():
+                store.save_manifest(self.manifest_loc)
+            self.close()
+            open(self.filename, "w").close()
+            self.records = 0
+
+    def close(self) -> None:
+        """ Closes the journal file, if it is open """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,316 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Implementation of the ``LinkChecker`` class, which checks in the background that the URLs of the
+GIFs in the store still work, so that broken links aren't posted.
+
+Checking needs the optional ``aiohttp`` package.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from logging import Logger
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Text, \
+    Tuple
+
+from gif_bot.utils import atomic_write
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+# The number of URLs checked at the same time
+DEFAULT_CHECK_CONCURRENCY = 32
+# How long to wait for each check, in seconds
+DEFAULT_TIMEOUT = 10.
+# How long a working link is trusted for before it is checked again, in seconds
+DEFAULT_LINK_TTL = 24 * 60 * 60.
+# Broken links are checked again sooner, so that GIFs whose hosts recover are posted again
+DEAD_TTL = 60 * 60.
+# Servers that don't allow HEAD requests are asked for the first byte of the GIF instead
+HEAD_NOT_ALLOWED = (405, 501)
+# Client errors that say nothing about whether the GIF is still there. These (like server errors,
+# timeouts and connection failures) leave a link's status as it was.
+TRANSIENT_CLIENT_ERRORS = (408, 429)
+# When more than this fraction of a round of checks fail, the problem is more likely to be with
+# the bot's connection (or hosts turning it away) than with the links, so none are marked broken
+MAX_FAILED_FRACTION = 0.5
+# ... as long as the round was large enough for the fraction to mean anything
+MIN_CHECKS_FOR_OUTAGE = 10
+
+# The outcomes of a check
+ALIVE = "alive"
+DEAD = "dead"
+FAILED = "failed"
+
+
+def is_dead(status: int) -> bool:
+    """ Checks whether a HTTP status definitely means that a link is broken """
+    return 400 <= status < 500 and status not in TRANSIENT_CLIENT_ERRORS
+
+
+class LinkStatus(NamedTuple):
+    """ The result of checking a URL """
+    alive: bool
+    checked_at: float
+    etag: Optional[Text] = None
+    last_modified: Optional[Text] = None
+
+
+class CheckReport(NamedTuple):
+    """ A summary of a round of checks """
+    checked: int
+    dead: int
+    seconds: float
+    # The checks that couldn't tell whether a link works (e.g. timeouts or server errors)
+    failed: int = 0
+
+    @property
+    def urls_per_second(self) -> float:
+        """ The throughput of the checks """
+        return self.checked / self.seconds if self.seconds > 0 else 0.
+
+
+class LinkHealth:
+    """
+    The last known status of each URL, optionally cached on disk. The URLs that are currently
+    broken are kept in the ``dead`` set, which the stores use to avoid choosing them.
+    """
+
+    def __init__(self, cache_loc: Optional[Text] = None, ttl: float = DEFAULT_LINK_TTL,
+                 dead_ttl: float = DEAD_TTL, clock: Callable[[], float] = time.time) -> None:
+        """
+        :param cache_loc: Where to cache the statuses on disk, if anywhere
+        :param ttl: How long a working link is trusted for, in seconds
+        :param dead_ttl: How long a broken link is assumed to stay broken for, in seconds
+        :param clock: The wall clock, used to age the statuses
+        """
+        self.cache_loc = cache_loc
+        self.ttl = ttl
+        self.dead_ttl = dead_ttl
+        self.clock = clock
+        self.statuses = {}  # type: Dict[Text, LinkStatus]
+        self.dead = set()  # type: Set[Text]
+        if cache_loc is not None:
+            self._load_cache()
+
+    def _load_cache(self) -> None:
+        """ Loads the statuses from the on-disk cache, unless it is missing or invalid """
+        try:
+            with open(self.cache_loc) as cache_file:
+                statuses = {url: LinkStatus(*status)
+                            for url, status in json.load(cache_file)["statuses"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return
+        self.statuses = statuses
+        self.dead = {url for url, status in statuses.items() if not status.alive}
+
+    def save(self) -> None:
+        """ Atomically writes the statuses into the on-disk cache """
+        if self.cache_loc is None:
+            return
+        with atomic_write(self.cache_loc) as cache_file:
+            json.dump({"statuses": self.statuses}, cache_file)
+
+    def due(self, urls: Iterable[Text]) -> Iterator[Text]:
+        """ Filters a set of URLs down to those that haven't been checked recently """
+        now = self.clock()
+        for url in urls:
+            status = self.statuses.get(url)
+            if status is None or \
+                    now - status.checked_at >= (self.ttl if status.alive else self.dead_ttl):
+                yield url
+
+    def record(self, url: Text, alive: bool, etag: Optional[Text] = None,
+               last_modified: Optional[Text] = None) -> None:
+        """ Records the result of checking a URL """
+        self.statuses[url] = LinkStatus(alive, self.clock(), etag, last_modified)
+        if alive:
+            self.dead.discard(url)
+        else:
+            self.dead.add(url)
+
+    def forget(self, url: Text) -> None:
+        """ Forgets the status of a URL, e.g. once its GIF has been removed from the store """
+        self.statuses.pop(url, None)
+        self.dead.discard(url)
+
+    def prune(self, live_urls: Set[Text]) -> int:
+        """
+        Forgets the statuses of every URL that isn't in the store any more
+        :param live_urls: The URLs of the GIFs in the store
+        :return: The number of URLs forgotten
+        """
+        # The statuses are copied first, as a round of checks may be recording more meanwhile
+        stale = [url for url in list(self.statuses) if url not in live_urls]
+        for url in stale:
+            self.forget(url)
+        return len(stale)
+
+
+class LinkChecker:
+    """
+    Checks URLs with HEAD requests (or requests for their first byte, if HEAD isn't allowed) on an
+    asyncio event loop. A bounded number of checks are made at once over a single pool of reused
+    connections, and the ETag and modification time of each GIF are sent with later checks, so
+    that unchanged GIFs can be confirmed without being sent again.
+    """
+
+    def __init__(self, health: LinkHealth, concurrency: int = DEFAULT_CHECK_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, log: Optional[Logger] = None) -> None:
+        """
+        :param health: Where the results of the checks are recorded
+        :param concurrency: The number of URLs checked at the same time
+        :param timeout: How long to wait for each check, in seconds
+        :param log: The logger to report each round of checks to
+        :raises RuntimeError: If ``aiohttp`` isn't installed
+        """
+        if aiohttp is None:
+            raise RuntimeError("Checking links requires the aiohttp package")
+        self.health = health
+        self.concurrency = max(concurrency, 1)
+        self.timeout = timeout
+        self.log = log
+        self.last_report = None  # type: Optional[CheckReport]
+        self._stop_watching = threading.Event()
+        self._watcher = None  # type: Optional[threading.Thread]
+
+    def metrics(self) -> Dict[Text, float]:
+        """ Gets the number of broken links, and the throughput of the last round of checks """
+        report = self.last_report
+        return {"broken": len(self.health.dead),
+                "checked_per_second": report.urls_per_second if report is not None else 0.}
+
+    def check(self, urls: Iterable[Text]) -> CheckReport:
+        """ Checks every URL that is due to be checked """
+        return asyncio.run(self.check_async(urls))
+
+    async def check_async(self, urls: Iterable[Text]) -> CheckReport:
+        """ Coroutine version of ``check`` """
+        pending = self.health.due(urls)
+        counts = {ALIVE: 0, DEAD: 0, FAILED: 0}
+        # Broken links are only recorded once the whole round has been checked
+        dead = []  # type: List[Tuple[Text, Optional[Text], Optional[Text]]]
+        start = time.perf_counter()
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            # A fixed set of workers share the URLs, so there are never more tasks than checks in
+            # flight however many GIFs there are
+            async def worker() -> None:
+                for url in pending:
+                    if self._stop_watching.is_set():
+                        return
+                    outcome = await self._check_url(session, url, dead)
+                    counts[outcome] += 1
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        checked = sum(counts.values())
+        report = CheckReport(checked, counts[DEAD], time.perf_counter() - start, counts[FAILED])
+        self.last_report = report
+        if checked >= MIN_CHECKS_FOR_OUTAGE and counts[FAILED] > MAX_FAILED_FRACTION * checked:
+            if self.log is not None:
+                self.log.warning("%d of %d link checks failed, so no links were marked as "
+                                 "broken", counts[FAILED], checked)
+        else:
+            for url, etag, last_modified in dead:
+                self.health.record(url, False, etag, last_modified)
+        if self.log is not None:
+            self.log.info("Checked %d links (%d broken, %d failed) at %.0f URLs/s",
+                          report.checked, report.dead, report.failed, report.urls_per_second)
+        return report
+
+    async def _check_url(self, session: Any, url: Text,
+                         dead: List[Tuple[Text, Optional[Text], Optional[Text]]]) -> Text:
+        """
+        Checks a URL, recording the result if it works
+        :param session: The HTTP session to check the URL with
+        :param url: The URL to check
+        :param dead: Where to put the URL (with its ETag and modification time) if it is broken
+        :return: Whether the URL is ``ALIVE`` or ``DEAD``, or the check ``FAILED``
+        """
+        previous = self.health.statuses.get(url)
+        headers = {}
+        if previous is not None and previous.alive:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        try:
+            async with session.head(url, headers=headers, allow_redirects=True) as response:
+                status, response_headers = response.status, response.headers
+            if status in HEAD_NOT_ALLOWED:
+                headers["Range"] = "bytes=0-0"
+                async with session.get(url, headers=headers) as response:
+                    status, response_headers = response.status, response.headers
+        except aiohttp.InvalidURL:
+            dead.append((url, None, None))
+            return DEAD
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return FAILED
+
+        if status == 304 and previous is not None:
+            self.health.record(url, True, previous.etag, previous.last_modified)
+            return ALIVE
+        if is_dead(status):
+            dead.append((url, response_headers.get("ETag"), response_headers.get("Last-Modified")))
+            return DEAD
+        if status >= 400:
+            return FAILED
+        self.health.record(url, True, response_headers.get("ETag"),
+                           response_headers.get("Last-Modified"))
+        return ALIVE
+
+    def watch(self, urls: Callable[[], Iterable[Text]], interval: float) -> None:
+        """
+        Starts checking URLs on a background thread, every ``interval`` seconds
+        :param urls: Gets the URLs to check
+        :param interval: The time between rounds of checks, in seconds
+        """
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(urls, interval), daemon=True,
+                                         name="gif_bot_links")
+        self._watcher.start()
+
+    def _watch(self, urls: Callable[[], Iterable[Text]], interval: float) -> None:
+        while not self._stop_watching.is_set():
+            try:
+                self.check(urls())
+                self.health.save()
+            except Exception as err:  # pylint: disable=broad-except
+                if self.log is not None:
+                    self.log.error("Unable to check links: %r", err)
+            if self._stop_watching.wait(interval):
+                return
+
+    def close(self) -> None:
+        """ Stops checking links once the current round of checks has finished """
+        self._stop_watching.set()
+        if self._watcher is not None and self._watcher is not threading.current_thread():
+            self._watcher.join()
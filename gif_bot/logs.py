@@ -0,0 +1,148 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Helpers for logging from the message handlers without slowing them down: a handler that hands
+records to a background thread to be written, a formatter for structured JSON records, and
+filters that tag records with the ID of the message being handled and sample INFO records.
+"""
+
+import json
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging import Filter, Formatter, Handler, INFO, LogRecord
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from typing import Iterator, Optional, Text  # pylint: disable=unused-import
+from zlib import crc32
+
+# The ID of the message being handled by the current thread (or task), if there is one
+_correlation_id = ContextVar("correlation_id", default=None)  # type: ContextVar
+
+
+@contextmanager
+def correlation(correlation_id: Text) -> Iterator[None]:
+    """
+    Tags everything logged within the context with a correlation ID
+    :param correlation_id: Identifies the request being handled (e.g. a message's channel and
+                           timestamp)
+    """
+    token = _correlation_id.set(correlation_id)
+    try:
+        yield
+    finally:
+        _correlation_id.reset(token)
+
+
+def current_correlation_id() -> Optional[Text]:
+    """ Gets the correlation ID of the request being handled, if there is one """
+    return _correlation_id.get()
+
+
+class CorrelationFilter(Filter):
+    """
+    Stamps records with the current correlation ID. This has to happen on the thread that logged
+    the record, so the filter is added to the handler that hands records to the background thread.
+    """
+
+    def filter(self, record: LogRecord) -> bool:
+        record.correlation_id = _correlation_id.get()
+        return True
+
+
+class InfoSampler(Filter):
+    """
+    Keeps a fraction of the records at INFO level or below, and every record above it. The
+    records logged while handling a request are all kept or all dropped, so that the requests
+    that are logged are logged in full.
+    """
+
+    def __init__(self, rate: float) -> None:
+        """
+        :param rate: The fraction of INFO records to keep, between 0 and 1
+        """
+        super().__init__()
+        self.rate = rate
+        self._threshold = int(rate * 2 ** 32)
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno > INFO:
+            return True
+        correlation_id = _correlation_id.get()
+        if correlation_id is None:
+            return random.random() < self.rate
+        return crc32(correlation_id.encode()) < self._threshold
+
+
+class JsonFormatter(Formatter):
+    """ Formats records as single-line JSON objects """
+
+    def format(self, record: LogRecord) -> Text:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+                            .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "function": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        correlation_id = getattr(record, "correlation_id", None)
+        if correlation_id is not None:
+            entry["correlation_id"] = correlation_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queues records to be written by another handler on a background thread, so that logging
+    never waits for the disk
+    """
+
+    def __init__(self, handler: Handler) -> None:
+        """
+        :param handler: The handler that writes the records
+        """
+        # The listener marks each record done once it's written, which is what flush waits for
+        super().__init__(Queue())
+        self.handler = handler
+        self.listener = QueueListener(self.queue, handler, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # The records never leave the process, so they're formatted by the background thread
+        # rather than being made picklable here
+        return record
+
+    def flush(self) -> None:
+        """ Waits for every queued record to be written """
+        self.queue.join()
+        self.handler.flush()
+
+    def close(self) -> None:
+        if self.listener._thread is not None:  # pylint: disable=protected-access
+            self.listener.stop()
+        self.handler.close()
+        super().close()
@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``TriggerMatcher`` class, used to spot trigger words in messages.
+"""
+
+import re
+from typing import Dict, Iterable, Optional, Text  # pylint: disable=unused-import
+
+# Word boundaries are expressed as lookarounds rather than ``\b`` so that they also work for
+# triggers that start or end with punctuation (e.g. ``:sos:``)
+WORD_START = r"(?<!\w)"
+WORD_END = r"(?!\w)"
+
+# Below this many triggers, a few plain substring searches are quicker than the compiled regex
+MAX_SUBSTRING_TRIGGERS = 64
+
+
+def _build_trie(patterns: Iterable[Text]) -> Dict:
+    """ Builds a character trie, marking the end of each pattern with an empty-string key """
+    root = {}  # type: Dict
+    for pattern in patterns:
+        node = root
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return root
+
+
+def _trie_to_regex(node: Dict) -> Text:
+    """
+    Converts a trie into an equivalent regular expression. Common prefixes are factored out, so
+    the regex engine only ever follows a single path through the trie from each start position.
+    """
+    terminal = "" in node
+    branches = [re.escape(char) + _trie_to_regex(child)
+                for char, child in sorted(node.items()) if char]
+
+    if not branches:
+        return ""
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    regex = "(?:" + "|".join(branches) + ")"
+    return regex + "?" if terminal else regex
+
+
+class TriggerMatcher:
+    """
+    Matches a set of case-insensitive trigger words against messages in a single pass, by
+    compiling all of the triggers into one prefix-factored regular expression.
+    """
+
+    def __init__(self, triggers: Iterable[Text], word_boundary: bool = False) -> None:
+        """
+        :param triggers: The trigger words and phrases
+        :param word_boundary: Whether triggers must match whole words, rather than any substring
+        """
+        self.triggers = sorted({trigger.lower() for trigger in triggers})
+        self.word_boundary = word_boundary
+        self._use_substrings = not word_boundary and len(self.triggers) <= MAX_SUBSTRING_TRIGGERS
+
+        if self.triggers:
+            regex = _trie_to_regex(_build_trie(self.triggers))
+            if word_boundary:
+                regex = WORD_START + "(?:" + regex + ")" + WORD_END
+            self._regex = re.compile(regex)  # type: Optional[re.Pattern]
+        else:
+            self._regex = None
+
+    def find(self, message: Text) -> Optional[Text]:
+        """
+        Finds the first trigger in a message
+        :param message: The text of the message
+        :return: The (lower case) trigger found in the message, or None if there isn't one
+        """
+        if self._regex is None:
+            return None
+        if self._use_substrings:
+            message = message.lower()
+            # Prefer the earliest match and then the longest, as the regex does
+            found = [(message.find(t), -len(t), t) for t in self.triggers if t in message]
+            return min(found)[2] if found else None
+        match = self._regex.search(message.lower())
+        return match.group(0) if match else None
+
+    def matches(self, message: Text) -> bool:
+        """
+        Checks to see if a message contains any of the triggers
+        :param message: The text of the message
+        """
+        if self._regex is None:
+            return False
+        if self._use_substrings:
+            message = message.lower()
+            return any(trigger in message for trigger in self.triggers)
+        return self._regex.search(message.lower()) is not None
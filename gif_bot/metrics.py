@@ -0,0 +1,292 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Low-overhead instrumentation for the bot: counters, latency histograms and gauges, which can be
+served in the Prometheus text format from a local HTTP endpoint.
+
+Instrumentation is applied by wrapping functions when the bot starts, so when metrics are disabled
+nothing is wrapped and the hot paths run exactly as they would without it.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple  # pylint: disable=unused-import
+
+# The upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1., 2.5, 5., 10.)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# The handlers of ``GifBot`` that are timed by ``instrument_bot``
+HANDLERS = ("handle", "handle_message", "handle_command", "handle_mention", "handle_trigger",
+            "handle_burst", "handle_compare", "is_trigger", "post_gif")
+
+
+class Histogram:
+    """ Counts observations into fixed buckets, along with their total """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """ Records an observation """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, quantile: float) -> float:
+        """ Estimates a quantile, as the upper bound of the bucket that contains it """
+        rank = quantile * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _format_labels(labels: Tuple[Tuple[Text, Text], ...], extra: Text = "") -> Text:
+    """ Formats a set of labels in the Prometheus text format """
+    parts = ['{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+             for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """ A thread-safe registry of counters, histograms and gauges """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = {}  # type: Dict[Tuple[Text, Tuple], float]
+        self._histograms = {}  # type: Dict[Tuple[Text, Tuple], Histogram]
+        self._collectors = []  # type: List[Tuple[Text, Callable[[], Dict[Text, Any]]]]
+
+    def inc(self, name: Text, amount: float = 1., **labels: Text) -> None:
+        """ Increments a counter """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.) + amount
+
+    def observe(self, name: Text, value: float, **labels: Text) -> None:
+        """ Records an observation in a histogram """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def collect(self, prefix: Text, collector: Callable[[], Dict[Text, Any]]) -> None:
+        """
+        Registers a function whose results are reported as gauges whenever the metrics are read
+        :param prefix: The prefix of the gauges' names
+        :param collector: Returns a dictionary of gauge names (after the prefix) and values
+        """
+        with self._lock:
+            self._collectors.append((prefix, collector))
+
+    def counter(self, name: Text, **labels: Text) -> float:
+        """ Gets the value of a counter """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0.)
+
+    def histogram(self, name: Text, **labels: Text) -> Optional[Histogram]:
+        """ Gets a histogram, if anything has been observed in it """
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def timed(self, name: Text, function: Callable, **labels: Text) -> Callable:
+        """
+        Wraps a function so that its latency is recorded in a histogram, and any exceptions it
+        raises are counted
+        :param name: The name of the histogram
+        :param function: The function to time
+        """
+        key = (name, tuple(sorted(labels.items())))
+        error_key = (name.rsplit("_seconds", 1)[0] + "_errors_total", key[1])
+        lock, histograms, counters = self._lock, self._histograms, self._counters
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except BaseException:
+                with lock:
+                    counters[error_key] = counters.get(error_key, 0.) + 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    histogram = histograms.get(key)
+                    if histogram is None:
+                        histogram = histograms[key] = Histogram()
+                    histogram.observe(elapsed)
+
+        return timed_function
+
+    def render(self) -> Text:
+        """ Renders all of the metrics in the Prometheus text format """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.total, h.count, h.buckets)
+                          for key, h in histograms]
+            collectors = list(self._collectors)
+
+        lines = []  # type: List[Text]
+        typed = set()
+
+        def declare(name: Text, metric_type: Text) -> None:
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE {} {}".format(name, metric_type))
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append("{}{} {:g}".format(name, _format_labels(labels), value))
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                extra = 'le="{}"'.format("+Inf" if bound == float("inf") else "{:g}".format(bound))
+                lines.append("{}_bucket{} {}".format(name, _format_labels(labels, extra),
+                                                     cumulative))
+            lines.append("{}_sum{} {:g}".format(name, _format_labels(labels), total))
+            lines.append("{}_count{} {}".format(name, _format_labels(labels), count))
+
+        for prefix, collector in collectors:
+            for key, value in sorted(collector().items()):
+                name = "{}_{}".format(prefix, key)
+                declare(name, "gauge")
+                lines.append("{} {:g}".format(name, value))
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """ Serves metrics in the Prometheus text format over HTTP, from a background thread """
+
+    def __init__(self, metrics: Metrics, port: int, host: Text = "127.0.0.1") -> None:
+        """
+        :param metrics: The metrics to serve
+        :param port: The port to listen on (0 picks a free port)
+        :param host: The address to listen on, which is local only by default
+        :raises OSError: If the port can't be listened on
+        """
+        class Handler(BaseHTTPRequestHandler):
+            """ Serves the metrics at /metrics """
+            def do_GET(self) -> None:  # pylint: disable=invalid-name
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="gif_bot:metrics",
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """ Stops serving the metrics """
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+def instrument_api_call(metrics: Metrics, call: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wraps a Slack API call function, recording the latency of each method and counting the calls
+    that fail
+    :param metrics: Where to record the metrics
+    :param call: The function making Slack API calls, like ``SlackClient.api_call``
+    """
+    @wraps(call)
+    def instrumented_call(method: Text, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = call(method, *args, **kwargs)
+            return response
+        finally:
+            metrics.observe("gif_bot_slack_api_seconds", time.perf_counter() - start,
+                            method=method)
+            if not isinstance(response, dict) or not response.get("ok", False):
+                error = response.get("error", "unknown") if isinstance(response, dict) \
+                    else "exception"
+                metrics.inc("gif_bot_slack_api_errors_total", method=method, error=error)
+
+    return instrumented_call
+
+
+def _store_metrics(bot: Any) -> Dict[Text, float]:
+    """ Gets the gauges for the bot's GIF store """
+    with bot.reading_store() as store:
+        return {"gifs": len(store.elements), "tags": len(store.tags),
+                "cached_counts": len(store.counts)}
+
+
+def instrument_bot(metrics: Metrics, bot: Any) -> None:
+    """
+    Times the message handlers of a bot and its choices of GIF, and reports its queues and store
+    as gauges
+    :param metrics: Where to record the metrics
+    :param bot: The ``GifBot`` to instrument
+    """
+    for handler in HANDLERS:
+        setattr(bot, handler, metrics.timed("gif_bot_handler_seconds", getattr(bot, handler),
+                                            handler=handler))
+    # Choosing a GIF has a histogram of its own, so that the store's share of ``post_gif`` can be
+    # told apart from the time spent handing the message to Slack
+    bot.choose_gif = metrics.timed("gif_bot_store_seconds", bot.choose_gif,
+                                   operation="choose_gif")
+
+    metrics.collect("gif_bot_dispatcher", bot.dispatcher.metrics)
+    metrics.collect("gif_bot_rate_limiter", bot.rate_limiter.metrics)
+    metrics.collect("gif_bot_store", lambda: _store_metrics(bot))
+    if getattr(bot, "trigger_coalescer", None) is not None:
+        metrics.collect("gif_bot_trigger_coalescer", bot.trigger_coalescer.metrics)
+    if getattr(bot, "link_checker", None) is not None:
+        metrics.collect("gif_bot_links", bot.link_checker.metrics)
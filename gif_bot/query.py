@@ -0,0 +1,463 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+A small query language for selecting GIFs by their tags.
+
+Queries combine tags with ``+`` (and), ``|`` (or) and ``-`` (and not), with ``+`` and ``-`` binding
+more tightly than ``|``, and with brackets for grouping. For example ``cat+dog`` matches GIFs tagged
+with both ``cat`` and ``dog``, ``cat|alpaca`` matches either, ``cat-angry`` matches cats that
+aren't angry, and ``-angry`` matches every GIF that isn't angry. The tag ``all`` matches every GIF.
+Tags that contain operators (such as ``thumbs-up``) can be given in double quotes, as in
+``"thumbs-up"+cat``.
+
+Queries are compiled into a ``QueryPlan`` once, and the plans for recent queries are cached.
+Plans are evaluated against a store's posting lists (the sorted IDs of the elements carrying each
+tag), so that they only ever touch the elements carrying the tags in the query.
+"""
+
+import heapq
+import random
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
+from typing import (Any, Callable, Dict, FrozenSet, Iterable,  # pylint: disable=unused-import
+                    Iterator, List, Optional, Sequence, Set, Text)
+
+from gif_bot.tag_index import MAX_CHOICE_ATTEMPTS, _contains
+
+ALL = "all"
+OPERATORS = "+-|()"
+PLAN_CACHE_SIZE = 1024
+COUNT_CACHE_SIZE = 1024
+
+# Quoted tags can also use the curly quotes that some keyboards type
+QUOTES = "\"\u201c\u201d"
+_TOKEN_RE = re.compile(r"\s*(?:([-+|()])"                      # Operators
+                       r"|[\"\u201c]([^\"\u201d]*)[\"\u201d]"  # Quoted tags
+                       r"|([^-+|()\s\"\u201c\u201d]+))")      # Bare tags
+
+
+def quote_tag(tag: Text) -> Text:
+    """
+    Quotes a tag for use in a query, if it needs quoting
+    :raises QueryError: If the tag can't be used in a query, even quoted
+    """
+    if not tag or any(quote in tag for quote in QUOTES):
+        raise QueryError("`{}` can't be used in a query".format(tag))
+    if tag == ALL or re.search(r"[-+|()\s]", tag):
+        return '"' + tag + '"'
+    return tag
+
+
+class QueryError(ValueError):
+    """ Errors relating to malformed queries """
+    pass
+
+
+# Plans are evaluated against a ``source``, which must provide:
+#  * ``postings(tag)`` : the sorted IDs of the live elements carrying a tag, or None
+#  * ``universe()`` : a sequence of the IDs of all elements, possibly including removed ones
+#  * ``is_live(element_id)`` : whether an element ID from the universe hasn't been removed
+#  * ``elements`` : the live elements, supporting ``len``
+#  * ``weight(element_id)`` : the weight of an element
+#  * ``max_weight()`` : an upper bound on the weights, or None if every element has weight 1
+#  * ``weight_tree()`` : a ``FenwickTree`` over the weights, or None if every element has weight 1
+
+class QueryPlan:
+    """ A node of a compiled query """
+
+    # The tags that the query depends on, including ``ALL`` if it depends on every element
+    tags = frozenset()  # type: FrozenSet[Text]
+
+    def ids(self, source: Any) -> Iterator[int]:
+        """ Iterates through the IDs of the matching elements, in increasing order """
+        raise NotImplementedError
+
+    def contains(self, source: Any, element_id: int) -> bool:
+        """ Checks whether a (live) element matches """
+        raise NotImplementedError
+
+    def size(self, source: Any) -> int:
+        """ An upper bound on the number of matching elements """
+        raise NotImplementedError
+
+    def space(self, source: Any) -> Optional[Sequence[int]]:
+        """
+        A sequence of element IDs, each at most once, that includes every matching element and
+        can be sampled from. None if there is no such sequence to hand.
+        """
+        return None
+
+    def count(self, source: Any) -> int:
+        """ Counts the matching elements """
+        return sum(1 for _ in self.ids(source))
+
+    def choose(self, source: Any,
+               excluded: Optional[Callable[[int], bool]] = None) -> Optional[int]:
+        """
+        Picks a matching element at random, in proportion to the elements' weights. Each attempt
+        is accepted in proportion to the element's share of the largest weight, so if one matching
+        element far outweighs the rest this usually falls back to a pass over every match.
+        :param excluded: Tests whether an element ID should be excluded from the choice
+        :return: The chosen element ID, or None if nothing (that isn't excluded) matches
+        """
+        max_weight = source.max_weight()
+
+        # Rejection sampling is quick whenever the matches are a decent fraction of the space...
+        space = self.space(source)
+        if space is not None:
+            if not space:
+                return None
+            for _ in range(MAX_CHOICE_ATTEMPTS):
+                element_id = space[random.randrange(len(space))]
+                if source.is_live(element_id) and self.contains(source, element_id) and \
+                        (excluded is None or not excluded(element_id)) and \
+                        (max_weight is None or
+                         random.random() * max_weight < source.weight(element_id)):
+                    return element_id
+
+        # ... and otherwise fall back to (weighted) reservoir sampling across the matches
+        chosen, total = None, 0.
+        for element_id in self.ids(source):
+            if excluded is not None and excluded(element_id):
+                continue
+            weight = 1. if max_weight is None else source.weight(element_id)
+            total += weight
+            if weight > 0 and random.random() * total < weight:
+                chosen = element_id
+        return chosen
+
+
+class TagPlan(QueryPlan):
+    """ Matches the elements carrying a tag """
+
+    def __init__(self, tag: Text) -> None:
+        self.tag = tag
+        self.tags = frozenset((tag,))
+
+    def __repr__(self) -> Text:
+        return self.tag
+
+    def ids(self, source: Any) -> Iterator[int]:
+        return iter(source.postings(self.tag) or ())
+
+    def contains(self, source: Any, element_id: int) -> bool:
+        postings = source.postings(self.tag)
+        return bool(postings) and _contains(postings, element_id)
+
+    def size(self, source: Any) -> int:
+        return len(source.postings(self.tag) or ())
+
+    def space(self, source: Any) -> Optional[Sequence[int]]:
+        return source.postings(self.tag) or ()
+
+    def count(self, source: Any) -> int:
+        return self.size(source)
+
+
+class AllPlan(QueryPlan):
+    """ Matches every element """
+
+    tags = frozenset((ALL,))
+
+    def __repr__(self) -> Text:
+        return ALL
+
+    def ids(self, source: Any) -> Iterator[int]:
+        return filter(source.is_live, source.universe())
+
+    def contains(self, source: Any, element_id: int) -> bool:
+        return source.is_live(element_id)
+
+    def size(self, source: Any) -> int:
+        return len(source.universe())
+
+    def space(self, source: Any) -> Optional[Sequence[int]]:
+        return source.universe()
+
+    def count(self, source: Any) -> int:
+        return len(source.elements)
+
+    def choose(self, source: Any,
+               excluded: Optional[Callable[[int], bool]] = None) -> Optional[int]:
+        # Weighted choices over every element can be drawn straight from the source's weight tree
+        tree = source.weight_tree()
+        if tree is not None:
+            for _ in range(MAX_CHOICE_ATTEMPTS):
+                element_id = tree.sample()
+                if element_id is None:
+                    return None
+                if source.weight(element_id) > 0 and \
+                        (excluded is None or not excluded(element_id)):
+                    return element_id
+        return super().choose(source, excluded)
+
+
+class AndPlan(QueryPlan):
+    """ Matches the elements matching all of one set of plans, and none of another """
+
+    def __init__(self, includes: List[QueryPlan], excludes: List[QueryPlan]) -> None:
+        # Excluding from nothing excludes from everything
+        self.includes = includes or [AllPlan()]
+        self.excludes = excludes
+        self.tags = frozenset(chain.from_iterable(plan.tags for plan in self.includes + excludes))
+
+    def __repr__(self) -> Text:
+        return "(" + "+".join(map(repr, self.includes)) + \
+               "".join("-" + repr(plan) for plan in self.excludes) + ")"
+
+    def _driver(self, source: Any) -> QueryPlan:
+        """ The included plan with the fewest matches, which all other plans are checked against """
+        return min(self.includes, key=lambda plan: plan.size(source))
+
+    def ids(self, source: Any) -> Iterator[int]:
+        driver = self._driver(source)
+        others = [plan for plan in self.includes if plan is not driver]
+        return (element_id for element_id in driver.ids(source)
+                if all(plan.contains(source, element_id) for plan in others) and
+                not any(plan.contains(source, element_id) for plan in self.excludes))
+
+    def contains(self, source: Any, element_id: int) -> bool:
+        return all(plan.contains(source, element_id) for plan in self.includes) and \
+            not any(plan.contains(source, element_id) for plan in self.excludes)
+
+    def size(self, source: Any) -> int:
+        return self._driver(source).size(source)
+
+    def space(self, source: Any) -> Optional[Sequence[int]]:
+        return self._driver(source).space(source)
+
+
+class OrPlan(QueryPlan):
+    """ Matches the elements matching any of a set of plans """
+
+    def __init__(self, plans: List[QueryPlan]) -> None:
+        self.plans = plans
+        self.tags = frozenset(chain.from_iterable(plan.tags for plan in plans))
+
+    def __repr__(self) -> Text:
+        return "(" + "|".join(map(repr, self.plans)) + ")"
+
+    def ids(self, source: Any) -> Iterator[int]:
+        previous = None
+        for element_id in heapq.merge(*(plan.ids(source) for plan in self.plans)):
+            if element_id != previous:
+                yield element_id
+                previous = element_id
+
+    def contains(self, source: Any, element_id: int) -> bool:
+        return any(plan.contains(source, element_id) for plan in self.plans)
+
+    def size(self, source: Any) -> int:
+        return sum(plan.size(source) for plan in self.plans)
+
+
+class _QuotedTag:  # pylint: disable=too-few-public-methods
+    """ A tag that was quoted in a query, so is never mistaken for an operator """
+    __slots__ = ("tag",)
+
+    def __init__(self, tag: Text) -> None:
+        self.tag = tag
+
+    def __str__(self) -> Text:
+        return '"' + self.tag + '"'
+
+
+class _Parser:
+    """ A recursive descent parser for queries """
+
+    def __init__(self, query: Text) -> None:
+        self.query = query
+        self.tokens = []  # type: List[Any]
+        position = 0
+        query = query.rstrip()
+        while position < len(query):
+            match = _TOKEN_RE.match(query, position)
+            if match is None:
+                raise QueryError("Missing closing quote")
+            if match.group(2) is not None:
+                # Quoted tags are kept apart from operators, and from "all"
+                if not match.group(2):
+                    raise QueryError("Empty quotes")
+                self.tokens.append(_QuotedTag(match.group(2)))
+            else:
+                self.tokens.append(match.group(1) or match.group(3))
+            position = match.end()
+        self.position = 0
+
+    def peek(self) -> Optional[Text]:
+        """ Gets the next token, if there is one """
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def parse(self) -> QueryPlan:
+        """ Parses the whole query """
+        if not self.tokens:
+            raise QueryError("The query is empty")
+        plan = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError("Unexpected `{}`".format(self.peek()))
+        return plan
+
+    def parse_or(self) -> QueryPlan:
+        """ Parses alternatives separated by ``|`` """
+        plans = [self.parse_and()]
+        while self.peek() == "|":
+            self.position += 1
+            plans.append(self.parse_and())
+        flattened = []  # type: List[QueryPlan]
+        for plan in plans:
+            flattened += plan.plans if isinstance(plan, OrPlan) else [plan]
+        return flattened[0] if len(flattened) == 1 else OrPlan(flattened)
+
+    def parse_and(self) -> QueryPlan:
+        """ Parses terms joined by ``+`` and ``-`` """
+        includes, excludes = [], []  # type: List[QueryPlan], List[QueryPlan]
+        if self.peek() != "-":
+            includes.append(self.parse_term())
+        while self.peek() in ("+", "-"):
+            operator = self.peek()
+            self.position += 1
+            (includes if operator == "+" else excludes).append(self.parse_term())
+
+        # Merge in nested conjunctions, and drop redundant "all"s
+        flattened = []  # type: List[QueryPlan]
+        for plan in includes:
+            if isinstance(plan, AndPlan):
+                flattened += plan.includes
+                excludes += plan.excludes
+            else:
+                flattened.append(plan)
+        flattened = [plan for plan in flattened if not isinstance(plan, AllPlan)] or \
+            flattened[:1]
+        if len(flattened) == 1 and not excludes:
+            return flattened[0]
+        return AndPlan(flattened, excludes)
+
+    def parse_term(self) -> QueryPlan:
+        """ Parses a tag or a bracketed query """
+        token = self.peek()
+        self.position += 1
+        if token == "(":
+            plan = self.parse_or()
+            if self.peek() != ")":
+                raise QueryError("Missing `)`")
+            self.position += 1
+            return plan
+        if isinstance(token, _QuotedTag):
+            return TagPlan(token.tag)
+        if token is None or token in OPERATORS:
+            raise QueryError("Expected a tag " + ("at the end" if token is None
+                                                   else "before `{}`".format(token)))
+        return AllPlan() if token == ALL else TagPlan(token)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_query(query: Text) -> QueryPlan:
+    """
+    Compiles a query into a plan, which is cached for future use
+    :param query: The text of the query (e.g. ``"cat+dog-angry"``)
+    :raises QueryError: If the query is malformed
+    """
+    return _Parser(query).parse()
+
+
+class CountCache:
+    """
+    Memoises the number of elements matching each query. As elements are added and removed, only
+    the counts of the queries that depend on their tags are forgotten.
+    """
+
+    def __init__(self, max_size: int = COUNT_CACHE_SIZE) -> None:
+        """
+        :param max_size: The number of counts to remember, with the least recently used forgotten
+        """
+        self.max_size = max_size
+        self._counts = OrderedDict()  # type: OrderedDict
+        self._dependents = {}  # type: Dict[Text, Set[Text]]
+        # Bumped by every invalidation, so that counts made during one aren't remembered
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def count(self, query: Text, source: Any) -> int:
+        """
+        Counts the elements matching a query, reusing the previous count if nothing it depends on
+        has changed since
+        :param query: The text of the query
+        :param source: The store to count elements in
+        :raises QueryError: If the query is malformed
+        """
+        with self._lock:
+            count = self._counts.get(query)
+            if count is not None:
+                self._counts.move_to_end(query)
+                return count
+            generation = self._generation
+
+        plan = compile_query(query)
+        count = plan.count(source)
+        with self._lock:
+            if generation != self._generation:
+                return count
+            self._counts[query] = count
+            for tag in plan.tags:
+                self._dependents.setdefault(tag, set()).add(query)
+            if len(self._counts) > self.max_size:
+                self._forget(next(iter(self._counts)))
+        return count
+
+    def _forget(self, query: Text) -> None:
+        """ Forgets the count of a query """
+        del self._counts[query]
+        for tag in compile_query(query).tags:
+            dependents = self._dependents.get(tag)
+            if dependents is not None:
+                dependents.discard(query)
+                if not dependents:
+                    del self._dependents[tag]
+
+    def invalidate(self, tags: Iterable[Text]) -> None:
+        """
+        Forgets the counts of the queries that depend on any of the tags of an element that has
+        been added, removed or changed
+        :param tags: The tags of the element that have changed
+        """
+        with self._lock:
+            self._generation += 1
+            if not self._counts:
+                return
+            for tag in chain(tags, (ALL,)):
+                for query in list(self._dependents.get(tag, ())):
+                    self._forget(query)
+
+    def clear(self) -> None:
+        """ Forgets all of the counts """
+        with self._lock:
+            self._generation += 1
+            self._counts.clear()
+            self._dependents.clear()
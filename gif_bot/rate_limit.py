@@ -0,0 +1,253 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Client-side rate limiting for Slack Web API calls, using token buckets per method and per channel.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from logging import Logger
+from typing import (Any, Callable, Dict, NamedTuple, Optional, Set,  # pylint: disable=unused-import
+                    Text, Tuple)
+
+# How long to back off for when Slack rate limits us without saying how long to wait, in seconds
+DEFAULT_RETRY_AFTER = 1.
+
+# The maximum number of per-channel buckets to keep, with the least recently used being discarded
+MAX_CHANNEL_BUCKETS = 10000
+
+# What to do with a call that can't be made straight away, if it is droppable (other calls, such as
+# replies to commands, always wait):
+#   "wait": wait until it can be made
+#   "drop": don't make it
+#   "coalesce": wait, unless a call with the same method and channel has already been delayed, so
+#               that a burst of calls collapses into a single delayed call
+POLICIES = ("wait", "drop", "coalesce")
+
+RATE_LIMITED = {"ok": False, "error": "ratelimited"}
+
+
+class Limit(NamedTuple):
+    """ A token bucket's refill rate (in calls per second) and size """
+    rate: float
+    burst: int
+
+
+class MethodLimits(NamedTuple):
+    """ The limits of a Slack API method, across the whole workspace and within a channel """
+    workspace: Optional[Limit]
+    channel: Optional[Limit]
+
+
+# Approximations of Slack's published limits for the methods the bot uses. Methods that are missing
+# are not limited on the client side, although we still back off if Slack limits them.
+DEFAULT_LIMITS = {
+    "chat.postMessage": MethodLimits(workspace=Limit(5., 20), channel=Limit(1., 3)),
+    "reactions.add": MethodLimits(workspace=Limit(50. / 60., 10), channel=None),
+}  # type: Dict[Text, MethodLimits]
+
+
+class TokenBucket:
+    """ A token bucket allowing bursts of ``burst`` calls, refilled at ``rate`` calls per second """
+
+    def __init__(self, limit: Limit, now: float) -> None:
+        self.rate = limit.rate
+        self.burst = limit.burst
+        self.tokens = float(limit.burst)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """ Gets how long it will be until a token is available """
+        self._refill(now)
+        return 0. if self.tokens >= 1. else (1. - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """ Takes a token, which may leave the bucket in debt """
+        self._refill(now)
+        self.tokens -= 1.
+
+
+class RateLimiter:
+    """
+    Limits the rate of Slack Web API calls, both proactively using token buckets and reactively by
+    backing off whenever Slack says that a method has been rate limited
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, policy: Text = "wait", limits: Optional[Dict[Text, MethodLimits]] = None,
+                 max_wait: float = 30., clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep, log: Optional[Logger] = None) -> None:
+        """
+        :param policy: What to do with droppable calls that can't be made straight away (see
+                       ``POLICIES``)
+        :param limits: The limits of each method, defaulting to ``DEFAULT_LIMITS``
+        :param max_wait: The longest that a droppable call will wait for before being dropped, in
+                         seconds
+        :param clock: The source of the current time
+        :param sleep: The function used to wait
+        :param log: Where to log dropped calls, if anywhere
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown rate limit policy '{}'".format(policy))
+        self.policy = policy
+        self.limits = limits if limits is not None else DEFAULT_LIMITS
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self.log = log
+        self._lock = threading.Lock()
+        self._workspace_buckets = {}  # type: Dict[Text, TokenBucket]
+        self._channel_buckets = OrderedDict()  # type: OrderedDict
+        self._blocked_until = {}  # type: Dict[Text, float]
+        # The (method, channel) pairs that have had a call delayed since they were last able to make
+        # a call straight away. With the "coalesce" policy, any other calls for them are dropped.
+        self._delayed = set()  # type: Set[Tuple[Text, Optional[Text]]]
+        self.dropped = 0
+        self.limited = 0
+
+    def _buckets(self, method: Text, channel: Optional[Text], now: float) -> Tuple:
+        """ Gets the (possibly missing) workspace and channel buckets for a call """
+        limits = self.limits.get(method)
+        if limits is None:
+            return None, None
+
+        workspace_bucket = None
+        if limits.workspace is not None:
+            workspace_bucket = self._workspace_buckets.get(method)
+            if workspace_bucket is None:
+                workspace_bucket = TokenBucket(limits.workspace, now)
+                self._workspace_buckets[method] = workspace_bucket
+
+        channel_bucket = None
+        if limits.channel is not None and channel is not None:
+            key = (method, channel)
+            channel_bucket = self._channel_buckets.get(key)
+            if channel_bucket is None:
+                channel_bucket = TokenBucket(limits.channel, now)
+                self._channel_buckets[key] = channel_bucket
+                if len(self._channel_buckets) > MAX_CHANNEL_BUCKETS:
+                    self._channel_buckets.popitem(last=False)
+            else:
+                self._channel_buckets.move_to_end(key)
+
+        return workspace_bucket, channel_bucket
+
+    def acquire(self, method: Text, channel: Optional[Text] = None,
+                droppable: bool = True) -> bool:
+        """
+        Waits (according to the policy) until a call can be made
+        :param method: The Slack API method
+        :param channel: The channel the call relates to, if any
+        :param droppable: Whether the policy applies to the call, rather than it always waiting
+        :return: Whether the call should be made, rather than dropped
+        """
+        key = (method, channel)
+        with self._lock:
+            wait = self._take(method, channel)
+            if wait == 0.:
+                self._delayed.discard(key)
+                return True
+            self.limited += 1
+            if droppable and (self.policy == "drop" or wait > self.max_wait or
+                              (self.policy == "coalesce" and key in self._delayed)):
+                self.dropped += 1
+                return False
+            if droppable and self.policy == "coalesce":
+                self._delayed.add(key)
+
+        while True:
+            self._sleep(wait)
+            with self._lock:
+                wait = self._take(method, channel)
+                if wait == 0.:
+                    return True
+
+    def _take(self, method: Text, channel: Optional[Text]) -> float:
+        """
+        Takes tokens for a call if it can be made now
+        :return: How long to wait before trying again, or zero if the tokens have been taken
+        """
+        now = self._clock()
+        wait = max(self._blocked_until.get(method, now) - now, 0.)
+        buckets = [bucket for bucket in self._buckets(method, channel, now) if bucket is not None]
+        for bucket in buckets:
+            wait = max(wait, bucket.wait_time(now))
+        if wait == 0.:
+            for bucket in buckets:
+                bucket.take(now)
+        return wait
+
+    def back_off(self, method: Text, retry_after: Optional[float] = None) -> None:
+        """
+        Stops any calls to a method being made for a while, after Slack has rate limited it
+        :param method: The Slack API method
+        :param retry_after: How long Slack asked us to wait for, in seconds
+        """
+        retry_after = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        with self._lock:
+            until = self._clock() + retry_after
+            self._blocked_until[method] = max(self._blocked_until.get(method, until), until)
+
+    def wrap(self, call: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        Wraps a function that makes Slack API calls (such as ``SlackClient.api_call``) so that the
+        calls are rate limited. The wrapped function takes an extra ``droppable`` argument, saying
+        whether the policy applies to the call. Calls that are dropped, or that Slack rate limits,
+        return a ``"ratelimited"`` error rather than raising.
+        """
+        def limited_call(method: Text, droppable: bool = True, **kwargs) -> Any:
+            channel = kwargs.get("channel")
+            if not self.acquire(method, channel, droppable):
+                return self._dropped(method, channel)
+
+            response = call(method, **kwargs)
+            if isinstance(response, dict) and response.get("error") == "ratelimited":
+                self.back_off(method, response.get("retry_after"))
+                # Try once more after backing off, if the policy allows it
+                if self.policy != "drop" or not droppable:
+                    if self.acquire(method, channel, droppable):
+                        response = call(method, **kwargs)
+                    else:
+                        response = self._dropped(method, channel)
+            return response
+
+        return limited_call
+
+    def _dropped(self, method: Text, channel: Optional[Text]) -> Dict[Text, Any]:
+        """ Logs a dropped call, and gets the response that stands in for it """
+        if self.log is not None:
+            self.log.warning("Dropped a call to %s in channel %s, as it was rate limited", method,
+                             channel)
+        return dict(RATE_LIMITED, dropped=True)
+
+    def metrics(self) -> Dict[Text, int]:
+        """ Gets counters of how many calls have been limited and dropped """
+        with self._lock:
+            return {"limited": self.limited, "dropped": self.dropped,
+                    "channel_buckets": len(self._channel_buckets)}
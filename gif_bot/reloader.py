@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``StoreReloader`` class, which rebuilds a ``GifStore`` in the background.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from logging import Logger
+from typing import Any, Callable, Iterator, Optional, Text  # pylint: disable=unused-import
+
+from gif_bot.gif_store import GifStore
+from gif_bot.journal import Journal
+
+
+class StoreReloader:
+    """
+    Loads a new ``GifStore`` on a background thread, and then hands it over to be swapped in with a
+    single assignment. Until then, everything carries on being served from the old store, and can
+    still be changed. Changes are only held off (with a shared lock) while the new store is swapped
+    in, which is when any that were journaled in the meantime are applied to it.
+
+    The reloader can also watch the manifest file, and reload it automatically when it changes
+    (other than when the bot rewrites it from the store itself, see ``writing_manifest``).
+    """
+
+    def __init__(self, load: Callable[[], GifStore], swap: Callable[[GifStore], None],
+                 manifest_loc: Text, log: Logger, lock: Optional[Any] = None,
+                 journal: Optional[Journal] = None) -> None:
+        """
+        :param load: Creates a new store from the manifest file
+        :param swap: Replaces the current store with a newly loaded one, after applying any
+                     changes journaled since it was loaded
+        :param manifest_loc: The location of the manifest file
+        :param log: The logger to report progress to
+        :param lock: A lock held by anything that changes the store, which the reloader holds
+                     while the new store is swapped in
+        :param journal: The journal of changes to the store, if any, which isn't compacted
+                        between the new store being loaded and swapped in
+        """
+        self._load = load
+        self._swap = swap
+        self._store_lock = lock if lock is not None else threading.RLock()
+        self._journal = journal
+        self.manifest_loc = manifest_loc
+        self.log = log
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gif_bot_reload")
+        self._lock = threading.Lock()
+        self._pending = None  # type: Optional[Future]
+        self._stop_watching = threading.Event()
+        self._watcher = None  # type: Optional[threading.Thread]
+        # Held while the watcher checks the manifest, or while the manifest is being rewritten
+        self._watch_lock = threading.Lock()
+        self._mtime = self._manifest_mtime()
+
+    def _manifest_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.manifest_loc).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self) -> Future:
+        """
+        Starts reloading the store, unless a reload is already in progress
+        :return: A future that resolves to the new store once it has been swapped in
+        """
+        with self._lock:
+            if self._pending is None or self._pending.done():
+                self._pending = self._executor.submit(self._reload)
+            return self._pending
+
+    def _reload(self) -> GifStore:
+        self.log.info("Reloading the manifest from %s", self.manifest_loc)
+        with self._journal.loading() if self._journal is not None else nullcontext():
+            mtime = self._manifest_mtime()
+            try:
+                store = self._load()
+            except Exception as err:
+                self.log.error("Unable to reload the manifest: %r", err)
+                raise
+            with self._store_lock:
+                self._swap(store)
+        self._mtime = mtime
+        self.log.info("Manifest reloaded with %d gifs", len(store.elements))
+        return store
+
+    def watch(self, interval: float) -> None:
+        """
+        Starts checking the manifest's modification time every ``interval`` seconds, and reloading
+        it whenever it changes
+        """
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True,
+                                         name="gif_bot_watch")
+        self._watcher.start()
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop_watching.wait(interval):
+            with self._watch_lock:
+                mtime = self._manifest_mtime()
+                if mtime is not None and mtime != self._mtime:
+                    self._mtime = mtime
+                    self.reload()
+
+    @contextmanager
+    def writing_manifest(self) -> Iterator[None]:
+        """
+        Holds off the watcher while the manifest is rewritten from the current store (such as when
+        the journal is compacted), and then records the new modification time, so that the bot's
+        own writes don't trigger a reload
+        """
+        with self._watch_lock:
+            yield
+            self._mtime = self._manifest_mtime()
+
+    def close(self) -> None:
+        """ Stops watching the manifest, and waits for any reload in progress to finish """
+        self._stop_watching.set()
+        if self._watcher is not None and self._watcher is not threading.current_thread():
+            self._watcher.join()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,228 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Support for weighted GIF selection, and for avoiding repeating GIFs in a channel.
+
+GIFs can be given a weight with a ``weight=N`` pseudo-tag in the manifest (or when adding them),
+making them N times as likely to be chosen as a GIF with the default weight of 1. Weights of every
+GIF are kept in a ``FenwickTree``, so that a GIF can be drawn in proportion to its weight in
+O(log n) time, and updated as weights change in O(log n) time.
+
+Only choices from every GIF (``all``) are drawn from the tree. A choice for any other query is
+made by rejection sampling its matches against the largest weight, which falls back to an
+O(matches) reservoir-sampling pass whenever the matching weights are too skewed (or the matches
+too sparse) for a few attempts to succeed.
+"""
+
+import math
+import random
+import threading
+from array import array
+from collections import OrderedDict
+from typing import (Any, Iterable, Optional, Sequence, Set, Text,  # pylint: disable=unused-import
+                    Tuple)
+
+WEIGHT_PREFIX = "weight="
+DEFAULT_WEIGHT = 1.
+
+# Bounds on the memory used to remember the GIFs recently posted in each channel
+MAX_WINDOWS = 10000
+MAX_WINDOW_SIZE = 10000
+
+
+class WeightError(ValueError):
+    """ Errors relating to malformed ``weight=N`` pseudo-tags """
+    pass
+
+
+def split_weight(tags: Iterable[Text]) -> Tuple[Set[Text], Optional[float]]:
+    """
+    Separates a ``weight=N`` pseudo-tag from a GIF's tags
+    :param tags: The tags of the GIF, which may include a weight
+    :return: The remaining tags, and the weight (or None if there wasn't one)
+    :raises WeightError: If the weight isn't a finite, non-negative number
+    """
+    weight = None
+    remaining = set()
+    for tag in tags:
+        if tag.startswith(WEIGHT_PREFIX):
+            try:
+                weight = float(tag[len(WEIGHT_PREFIX):])
+            except ValueError:
+                weight = -1.
+            if weight < 0 or not math.isfinite(weight):
+                raise WeightError("`{}` isn't a valid weight (expected a number of at least 0)"
+                                  .format(tag))
+        else:
+            remaining.add(tag)
+    return remaining, weight
+
+
+def weight_tag(weight: float) -> Text:
+    """ Formats a weight as a pseudo-tag """
+    return "{}{:g}".format(WEIGHT_PREFIX, weight)
+
+
+class FenwickTree:
+    """
+    A Fenwick (binary indexed) tree over element weights, supporting weight updates, prefix sums and
+    weighted sampling in O(log n) time. The tree is a flat array of sums (with an unused first
+    entry), so it can also be used directly from a snapshot file.
+    """
+
+    def __init__(self, tree: Optional[Sequence[float]] = None) -> None:
+        """
+        :param tree: The array of an existing tree, which is only modified by ``append``/``add``
+        """
+        self.tree = tree if tree is not None else array("d", [0.])
+
+    @classmethod
+    def from_weights(cls, weights: Iterable[float]) -> "FenwickTree":
+        """ Builds a tree over a sequence of weights in O(n) time """
+        tree = array("d", [0.])
+        tree.extend(weights)
+        size = len(tree) - 1
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        return cls(tree)
+
+    def __len__(self) -> int:
+        return len(self.tree) - 1
+
+    def append(self, weight: float) -> None:
+        """ Adds a weight for the next element """
+        index = len(self.tree)
+        # The new node sums the weights in (index - lowbit(index), index]
+        total, child, stop = weight, index - 1, index - (index & -index)
+        while child > stop:
+            total += self.tree[child]
+            child -= child & -child
+        self.tree.append(total)
+
+    def add(self, element_id: int, delta: float) -> None:
+        """ Changes the weight of an element by ``delta`` """
+        index, size = element_id + 1, len(self.tree) - 1
+        while index <= size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, count: int) -> float:
+        """ Sums the weights of the first ``count`` elements """
+        total = 0.
+        while count > 0:
+            total += self.tree[count]
+            count -= count & -count
+        return total
+
+    def total(self) -> float:
+        """ Sums the weights of all of the elements """
+        return self.prefix_sum(len(self.tree) - 1)
+
+    def find(self, value: float) -> int:
+        """
+        Finds the element whose share of the cumulative weights contains ``value``, i.e. the first
+        element whose prefix sum (including itself) is greater than ``value``
+        """
+        size = len(self.tree) - 1
+        position = 0
+        step = 1 << (size.bit_length() - 1) if size else 0
+        while step:
+            if position + step <= size and self.tree[position + step] <= value:
+                position += step
+                value -= self.tree[position]
+            step >>= 1
+        return min(position, size - 1)
+
+    def sample(self) -> Optional[int]:
+        """ Picks an element with probability proportional to its weight """
+        total = self.total()
+        if total <= 0:
+            return None
+        return self.find(random.random() * total)
+
+
+class RecentlyPosted:
+    """
+    Remembers the GIFs recently posted for each query in each channel, so that none are repeated
+    until a given fraction of the GIFs matching the query have been shown
+    """
+
+    class Window:  # pylint: disable=too-few-public-methods
+        """ The URLs recently posted for a single query in a channel, oldest first """
+        def __init__(self) -> None:
+            self.urls = OrderedDict()  # type: OrderedDict
+            self.lock = threading.Lock()
+
+    def __init__(self, fraction: float, max_windows: int = MAX_WINDOWS,
+                 max_window_size: int = MAX_WINDOW_SIZE) -> None:
+        """
+        :param fraction: The fraction of matching GIFs to show before allowing repeats
+        :param max_windows: The number of (channel, query) pairs to remember, with the least
+                            recently used forgotten
+        :param max_window_size: The most GIFs to remember for any one (channel, query) pair
+        """
+        self.fraction = fraction
+        self.max_windows = max_windows
+        self.max_window_size = max_window_size
+        self._windows = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def _window(self, channel: Text, query: Text) -> "RecentlyPosted.Window":
+        """ Gets the window for a query in a channel, creating it if required """
+        key = (channel, query)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = self.Window()
+                if len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+        return window
+
+    def choose(self, store: Any, channel: Text, query: Text) -> Optional[Text]:
+        """
+        Picks a GIF for a query that hasn't been posted in the channel recently
+        :param store: The store to pick the GIF from
+        :param channel: The channel ID the GIF will be posted in
+        :param query: The tag query the GIF should match
+        :return: The URL of the GIF, or None if no GIFs match the query
+        :raises QueryError: If the query is malformed
+        """
+        size = min(self.max_window_size, int(self.fraction * store.get_count(query)))
+        if size == 0:
+            return store.get_gif(query)
+
+        window = self._window(channel, query)
+        with window.lock:
+            urls = window.urls
+            while len(urls) >= size:
+                urls.popitem(last=False)
+            url = store.get_gif(query, exclude=urls)
+            if url is not None:
+                urls.pop(url, None)
+                urls[url] = None
+        return url
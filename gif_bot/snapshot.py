@@ -0,0 +1,465 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``SnapshotStore`` class, a read-only ``GifStore`` backed by a memory-mapped
+binary snapshot of the manifest.
+
+Parsing a large CSV manifest and building its tag index dominates start-up time, so once a store
+has been loaded it can be written out as a snapshot: the URLs, tag names and posting lists laid out
+as flat arrays that can be memory-mapped and used in place. Opening a snapshot costs a few page
+faults rather than a full parse, and the pages are shared between processes mapping the same file.
+
+A snapshot records the size and modification time of the manifest (and journal) it was built from,
+so that a stale snapshot is never used in place of a manifest that has since changed.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from typing import (Callable, Container, Dict, Iterator, List,  # pylint: disable=unused-import
+                    NamedTuple, Optional, Sequence, Set, Text)
+
+from gif_bot.gif_store import (GifStore, choose_gif, describe_restricted_store, describe_store,
+                               write_manifest)
+from gif_bot.journal import Journal
+from gif_bot.query import CountCache, compile_query
+from gif_bot.selection import DEFAULT_WEIGHT, FenwickTree, split_weight, weight_tag
+from gif_bot.storage import Element
+from gif_bot.tag_index import TagHistogram
+from gif_bot.templates import StatusTemplates
+from gif_bot.utils import atomic_write
+
+MAGIC = b"GIFSNAP\x02"
+# Written in the machine's byte order, so that a snapshot copied to a machine with a different byte
+# order is rejected rather than misread
+BYTE_ORDER_MARK = 0x01020304
+
+# The arrays stored in a snapshot, in the order they appear in the file
+SECTIONS = (
+    ("url_offsets", "Q"),          # Offsets of each element's URL within ``urls``
+    ("element_tag_offsets", "Q"),  # Offsets of each element's tags within ``element_tags``
+    ("element_tags", "I"),         # The tag IDs of each element
+    ("tag_offsets", "Q"),          # Offsets of each tag's name within ``tag_names``
+    ("posting_offsets", "Q"),      # Offsets of each tag's posting list within ``postings``
+    ("postings", "I"),             # The element IDs carrying each tag, in increasing order
+    ("urls", "B"),                 # UTF-8 encoded URLs
+    ("tag_names", "B"),            # UTF-8 encoded tag names, in sorted order
+    ("weights", "d"),              # The weight of each element, if any differ from the default
+    ("weight_tree", "d"),          # A ``FenwickTree`` over the weights, if there are any
+)
+HEADER = struct.Struct("=8sI4xQQqqqd" + "QQ" * len(SECTIONS))
+ALIGNMENT = 8
+
+
+class Fingerprint(NamedTuple):
+    """ Identifies the version of the manifest (and journal) that a snapshot was built from """
+    manifest_mtime_ns: int
+    manifest_size: int
+    journal_size: int
+
+
+class SnapshotError(RuntimeError):
+    """ Errors relating to reading a snapshot file """
+    pass
+
+
+def source_fingerprint(manifest_loc: Text, journal_loc: Optional[Text] = None) -> Fingerprint:
+    """
+    Fingerprints the current version of a manifest and its journal
+    :param manifest_loc: The location of the manifest file
+    :param journal_loc: The location of the journal file, if there is one
+    """
+    manifest_stat = os.stat(manifest_loc)
+    journal_size = 0
+    if journal_loc is not None:
+        try:
+            journal_size = os.stat(journal_loc).st_size
+        except FileNotFoundError:
+            pass
+    return Fingerprint(manifest_stat.st_mtime_ns, manifest_stat.st_size, journal_size)
+
+
+def write_snapshot(store: GifStore, filename: Text, fingerprint: Fingerprint) -> None:
+    """
+    Atomically writes the contents of a store into a snapshot file
+    :param store: The store to snapshot
+    :param filename: The name of the snapshot file
+    :param fingerprint: The version of the manifest that the store was loaded from
+    """
+    tag_names = sorted(store.tags, key=lambda tag: tag.encode("utf-8"))
+    tag_ids = {tag: tag_id for tag_id, tag in enumerate(tag_names)}
+    tag_postings = [array("I") for _ in tag_names]  # type: List[array]
+
+    url_offsets, urls = array("Q", [0]), bytearray()
+    element_tag_offsets, element_tags = array("Q", [0]), array("I")
+    weights = array("d")
+    for element_id, element in enumerate(store.elements):
+        urls += element.url.encode("utf-8")
+        url_offsets.append(len(urls))
+        tags, weight = split_weight(element.tags)
+        weights.append(DEFAULT_WEIGHT if weight is None else weight)
+        for tag_id in sorted(tag_ids[tag] for tag in tags):
+            element_tags.append(tag_id)
+            tag_postings[tag_id].append(element_id)
+        element_tag_offsets.append(len(element_tags))
+
+    tag_offsets, names = array("Q", [0]), bytearray()
+    for tag in tag_names:
+        names += tag.encode("utf-8")
+        tag_offsets.append(len(names))
+    posting_offsets, postings = array("Q", [0]), array("I")
+    for tag_posting in tag_postings:
+        postings.extend(tag_posting)
+        posting_offsets.append(len(postings))
+
+    if all(weight == DEFAULT_WEIGHT for weight in weights):
+        weights = array("d")
+    weight_tree = FenwickTree.from_weights(weights).tree if weights else array("d")
+
+    sections = {"weights": weights, "weight_tree": weight_tree,
+                "url_offsets": url_offsets, "element_tag_offsets": element_tag_offsets,
+                "element_tags": element_tags, "tag_offsets": tag_offsets,
+                "posting_offsets": posting_offsets, "postings": postings,
+                "urls": urls, "tag_names": names}
+
+    # Lay the sections out one after another, each aligned so that it can be cast in place
+    layout = []
+    position = HEADER.size
+    for name, _ in SECTIONS:
+        position += -position % ALIGNMENT
+        size = len(memoryview(sections[name]).cast("B"))
+        layout += [position, size]
+        position += size
+
+    with atomic_write(filename, binary=True) as file:
+        file.write(HEADER.pack(MAGIC, BYTE_ORDER_MARK, len(url_offsets) - 1, len(tag_names),
+                               *fingerprint, max(weights, default=DEFAULT_WEIGHT), *layout))
+        for (name, _), start in zip(SECTIONS, layout[::2]):
+            file.write(b"\0" * (start - file.tell()))
+            file.write(memoryview(sections[name]).cast("B"))
+
+
+def ensure_snapshot(filename: Text, manifest_loc: Text, journal_loc: Optional[Text] = None) -> bool:
+    """
+    Rebuilds a snapshot from its manifest (and journal) if it is missing or out of date
+    :param filename: The name of the snapshot file
+    :param manifest_loc: The location of the manifest file
+    :param journal_loc: The location of the manifest's journal, if it has one
+    :return: Whether the snapshot had to be rebuilt
+    """
+    fingerprint = source_fingerprint(manifest_loc, journal_loc)
+    snapshot = open_snapshot(filename, fingerprint)
+    if snapshot is not None:
+        snapshot.close()
+        return False
+
+    with open(manifest_loc, newline="") as manifest_file:
+        store = GifStore(manifest_data=manifest_file, compact=True)
+    if journal_loc is not None:
+        Journal(journal_loc, manifest_loc).replay(store)
+    write_snapshot(store, filename, fingerprint)
+    return True
+
+
+def open_snapshot(filename: Text, fingerprint: Optional[Fingerprint] = None,
+                  adjectives: Optional[List[Text]] = None) -> Optional["SnapshotStore"]:
+    """
+    Opens a snapshot, if it exists and is up to date
+    :param filename: The name of the snapshot file
+    :param fingerprint: The current version of the manifest, which the snapshot must match
+    :param adjectives: The adjectives used to describe GIFs in the store's status
+    :return: The snapshot store, or None if the snapshot is missing, unreadable or out of date
+    """
+    try:
+        store = SnapshotStore(filename, adjectives=adjectives)
+    except (OSError, ValueError, SnapshotError):
+        return None
+    if fingerprint is not None and store.fingerprint != fingerprint:
+        store.close()
+        return None
+    return store
+
+
+class SnapshotStore:
+    """
+    A read-only store of GIFs, backed by a memory-mapped snapshot file. It supports the same queries
+    as ``GifStore``, and can be converted into one to make changes.
+    """
+
+    class Tags:
+        """ A read-only mapping from each tag in a snapshot to the number of GIFs carrying it """
+        def __init__(self, store: "SnapshotStore") -> None:
+            self._store = store
+
+        def __len__(self) -> int:
+            return self._store.num_tags
+
+        def __iter__(self) -> Iterator[Text]:
+            return (self._store.tag_name(tag_id) for tag_id in range(self._store.num_tags))
+
+        def __contains__(self, tag: object) -> bool:
+            return isinstance(tag, str) and self._store.tag_id(tag) is not None
+
+        def __getitem__(self, tag: Text) -> int:
+            postings = self._store.postings(tag)
+            if postings is None:
+                raise KeyError(tag)
+            return len(postings)
+
+        def keys(self) -> Iterator[Text]:
+            """ Iterates through the tags """
+            return iter(self)
+
+        def items(self) -> Iterator:
+            """ Iterates through (tag, count) pairs """
+            return ((tag, self[tag]) for tag in self)
+
+        def get(self, tag: Text, default: int = 0) -> int:
+            """ Gets the number of GIFs carrying a tag """
+            postings = self._store.postings(tag)
+            return len(postings) if postings is not None else default
+
+    class Elements:
+        """ A read-only view of the elements in a snapshot """
+        def __init__(self, store: "SnapshotStore") -> None:
+            self._store = store
+
+        def __len__(self) -> int:
+            return self._store.num_elements
+
+        def __iter__(self) -> Iterator[Element]:
+            return (self._store.element(element_id)
+                    for element_id in range(self._store.num_elements))
+
+    def __init__(self, filename: Text, adjectives: Optional[List[Text]] = None) -> None:
+        """
+        :param filename: The name of the snapshot file
+        :param adjectives: The adjectives used to describe GIFs in the store's status
+        """
+        self.modifiers = adjectives if adjectives is not None else ["wholesome"]
+        self.status_templates = StatusTemplates(self.modifiers)
+        # Snapshots can't be changed, but a journal may still be attached so it can be synced
+        self.journal = None
+        # The number of the journal's records that the snapshot was built with
+        self.journal_records = 0
+        # The URLs of GIFs that are known to be broken, which are never chosen
+        self.unavailable = None  # type: Optional[Container[Text]]
+        # Tag names are looked up by binary search, and then remembered
+        self._tag_ids = {}  # type: Dict[Text, int]
+        # Snapshots never change, so counts and the tag ranking can be kept once they are needed
+        self.counts = CountCache()
+        self._histogram = None  # type: Optional[TagHistogram]
+
+        with open(filename, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []  # type: List[memoryview]
+        try:
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self) -> None:
+        """ Reads the header of the snapshot, and maps each of its sections """
+        if len(self._mmap) < HEADER.size:
+            raise SnapshotError("Snapshot is truncated")
+        fields = HEADER.unpack_from(self._mmap)
+        if fields[0] != MAGIC:
+            raise SnapshotError("Not a snapshot file")
+        if fields[1] != BYTE_ORDER_MARK:
+            raise SnapshotError("Snapshot was written with a different byte order")
+        self.num_elements, self.num_tags = fields[2], fields[3]
+        self.fingerprint = Fingerprint(*fields[4:7])
+        self._max_weight = fields[7]
+
+        data = memoryview(self._mmap)
+        self._views.append(data)
+        layout = fields[8:]
+        for index, (name, typecode) in enumerate(SECTIONS):
+            start, size = layout[2 * index], layout[2 * index + 1]
+            if start + size > len(self._mmap):
+                raise SnapshotError("Snapshot is truncated")
+            view = data[start:start + size].cast(typecode)
+            self._views.append(view)
+            setattr(self, "_" + name, view)
+
+    def close(self) -> None:
+        """ Unmaps the snapshot file. The store can't be used afterwards. """
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self) -> "SnapshotStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def url(self, element_id: int) -> Text:
+        """ Gets the URL of an element """
+        return str(self._urls[self._url_offsets[element_id]:self._url_offsets[element_id + 1]],
+                   "utf-8")
+
+    def element(self, element_id: int) -> Element:
+        """ Materialises an element """
+        tag_ids = self._element_tags[self._element_tag_offsets[element_id]:
+                                     self._element_tag_offsets[element_id + 1]]
+        tags = {self.tag_name(tag_id) for tag_id in tag_ids}
+        if self._weights and self._weights[element_id] != DEFAULT_WEIGHT:
+            tags.add(weight_tag(self._weights[element_id]))
+        return Element(self.url(element_id), tags)
+
+    def tag_name(self, tag_id: int) -> Text:
+        """ Gets the name of a tag """
+        return str(self._tag_names[self._tag_offsets[tag_id]:self._tag_offsets[tag_id + 1]],
+                   "utf-8")
+
+    def tag_id(self, tag: Text) -> Optional[int]:
+        """ Finds the ID of a tag by binary searching the sorted tag names """
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._search_tag(tag)
+            if tag_id is not None:
+                self._tag_ids[tag] = tag_id
+        return tag_id
+
+    def _search_tag(self, tag: Text) -> Optional[int]:
+        """ Binary searches the sorted tag names for a tag """
+        key = tag.encode("utf-8")
+        names, offsets = self._tag_names, self._tag_offsets
+        low, high = 0, self.num_tags
+        while low < high:
+            middle = (low + high) // 2
+            name = names[offsets[middle]:offsets[middle + 1]]
+            if name == key:
+                return middle
+            if bytes(name) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def postings(self, tag: Text) -> Optional[Sequence[int]]:
+        """ Gets the IDs of the elements with a tag, or None if the tag isn't in the snapshot """
+        tag_id = self.tag_id(tag)
+        if tag_id is None:
+            return None
+        return self._postings[self._posting_offsets[tag_id]:self._posting_offsets[tag_id + 1]]
+
+    @property
+    def tags(self) -> "SnapshotStore.Tags":
+        """
+        The tags in the store, usable as a mapping from each tag to the number of GIFs carrying it
+        """
+        return self.Tags(self)
+
+    @property
+    def elements(self) -> "SnapshotStore.Elements":
+        """ The elements in the store """
+        return self.Elements(self)
+
+    def get_tags(self) -> Set[Text]:
+        """
+        Gets all of the tags in the store
+        """
+        return set(self.tags)
+
+    def get_info(self, max_tags: int, restrict: Optional[Callable[[Text], Text]] = None) -> Text:
+        """
+        Gets the status of the store
+        :param max_tags: The maximum number of tags to return (the most common ones), or 0 for all
+        :param restrict: Restricts a query to the GIFs to describe (e.g. a channel's
+                         ``ChannelSettings.query``), or None to describe every GIF
+        """
+        if self._histogram is None:
+            self._histogram = TagHistogram(self.tags.items())
+        if restrict is not None:
+            return describe_restricted_store(self, self._histogram.top(self.num_tags), max_tags,
+                                             restrict)
+        return describe_store(self.num_elements, self._histogram.top(max_tags or self.num_tags),
+                              self.num_tags, self.status_templates)
+
+    def get_count(self, tag: Text) -> int:
+        """
+        Gets the number of GIFs matching the provided query
+        :param tag: A tag, or a query combining tags (e.g. `"cat+dog"`, `"cat|alpaca"` or
+                    `"cat-angry"`)
+        :raises QueryError: If the query is malformed
+        """
+        return self.counts.count(tag, self)
+
+    def get_gif(self, tag: Text, exclude: Optional[Container[Text]] = None) -> Optional[Text]:
+        """
+        Gets a GIF of the provided type, chosen in proportion to the GIFs' weights
+        :param tag: A tag, or a query combining tags (e.g. `"cat+dog"`, `"cat|alpaca"` or
+                    `"cat-angry"`)
+        :param exclude: The URLs of GIFs to avoid choosing, unless they're the only matches
+        :return: Either a URL if an available GIF of the provided type exists in the store, else
+                 None
+        :raises QueryError: If the query is malformed
+        """
+        element_id = choose_gif(compile_query(tag), self, self.url, exclude, self.unavailable)
+        return self.url(element_id) if element_id is not None else None
+
+    def universe(self) -> Sequence[int]:
+        """ Gets every element ID in the snapshot, for evaluating queries """
+        return range(self.num_elements)
+
+    @staticmethod
+    def is_live(_: int) -> bool:
+        """ Snapshots never contain removed elements """
+        return True
+
+    def weight(self, element_id: int) -> float:
+        """ Gets the weight of an element """
+        return self._weights[element_id] if self._weights else DEFAULT_WEIGHT
+
+    def max_weight(self) -> Optional[float]:
+        """ Gets the largest weight, or None if every element has the default weight """
+        return self._max_weight if self._weights else None
+
+    def weight_tree(self) -> Optional[FenwickTree]:
+        """ Gets the tree over the weights, or None if every element has the default weight """
+        return FenwickTree(self._weight_tree) if self._weights else None
+
+    def save_manifest(self, filename: Text) -> None:
+        """
+        Saves the contents of the snapshot as a manifest file
+        :param filename: The name we should save the manifest file as
+        """
+        write_manifest(self.elements, filename)
+
+    def to_gif_store(self, compact: bool = False) -> GifStore:
+        """
+        Copies the contents of the snapshot into a new, modifiable store
+        :param compact: Whether the new store should use the compact storage backend
+        """
+        store = GifStore(adjectives=self.modifiers, compact=compact)
+        for element in self.elements:
+            store.add_gif(element.url, element.tags)
+        store.unavailable = self.unavailable
+        store.journal_records = self.journal_records
+        return store
@@ -0,0 +1,245 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Slot-based storage backends for the elements held in a ``GifStore``.
+
+``ObjectStorage`` keeps one ``Element`` per slot, while ``CompactStorage`` keeps the same data in
+flat arrays with every tag interned into a shared string table.
+"""
+
+from array import array
+from typing import (Dict, Iterable, Iterator, List, Optional, Set,  # pylint: disable=unused-import
+                    Text)
+
+# The tag array of ``CompactStorage`` is repacked once at least this many of its entries are stale,
+# and they make up half of the array
+REPACK_MIN_STALE = 1024
+
+
+class Element:  # pylint: disable=too-few-public-methods
+    """ Storage struct for GIF data """
+    __slots__ = ("url", "tags")
+
+    def __init__(self, url: Text, tags: Set[Text]) -> None:
+        self.url = url
+        self.tags = tags
+
+
+class StringTable:
+    """ Interns strings, mapping each onto a stable integer ID """
+
+    def __init__(self) -> None:
+        self._ids = {}  # type: Dict[Text, int]
+        self._strings = []  # type: List[Text]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern(self, string: Text) -> int:
+        """ Gets the ID of a string, adding it to the table if required """
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._ids[string] = string_id
+            self._strings.append(string)
+        return string_id
+
+    def lookup(self, string_id: int) -> Text:
+        """ Gets the string with the provided ID """
+        return self._strings[string_id]
+
+
+class ObjectStorage:
+    """ Stores each GIF as an individual ``Element`` object """
+
+    def __init__(self, elements: Optional[List[Optional[Element]]] = None) -> None:
+        self._elements = elements if elements is not None else []
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+    def append(self, url: Text, tags: Set[Text]) -> int:
+        """
+        Stores a new GIF in the next free slot
+        :param url: The URL of the GIF
+        :param tags: The tags of the GIF
+        :return: The slot that the GIF has been stored in
+        """
+        self._elements.append(Element(url, set(tags)))
+        return len(self._elements) - 1
+
+    def is_live(self, slot: int) -> bool:
+        """ Checks whether a slot holds a GIF, rather than a tombstone """
+        return self._elements[slot] is not None
+
+    def url(self, slot: int) -> Text:
+        """ Gets the URL of the GIF in a slot """
+        return self._elements[slot].url
+
+    def tags(self, slot: int) -> Set[Text]:
+        """ Gets the tags of the GIF in a slot """
+        return self._elements[slot].tags
+
+    def add_tags(self, slot: int, tags: Set[Text]) -> Set[Text]:
+        """
+        Adds tags to the GIF in a slot
+        :return: The tags that the GIF did not already have
+        """
+        element = self._elements[slot]
+        new_tags = tags.difference(element.tags)
+        element.tags.update(new_tags)
+        return new_tags
+
+    def clear(self, slot: int) -> None:
+        """ Replaces the GIF in a slot with a tombstone """
+        self._elements[slot] = None
+
+    def element(self, slot: int) -> Element:
+        """ Gets the GIF in a slot as an ``Element`` """
+        return self._elements[slot]
+
+    def compacted(self) -> "ObjectStorage":
+        """ Creates a copy of the storage with all of the tombstones removed """
+        return ObjectStorage([element for element in self._elements if element is not None])
+
+
+class CompactStorage:
+    """
+    Stores GIFs as a struct of arrays: a list of URLs, plus a single array of interned tag IDs
+    that each slot references by start and end offsets.
+    """
+
+    def __init__(self, strings: Optional[StringTable] = None) -> None:
+        self.strings = strings if strings is not None else StringTable()
+        self._urls = []  # type: List[Optional[Text]]
+        self._tag_starts = array("Q")
+        self._tag_ends = array("Q")
+        self._tag_ids = array("I")
+        # The number of entries in the tag array that no slot references any more
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def _write_tags(self, slot: int, tag_ids: Iterable[int]) -> None:
+        """ Appends a slot's tag IDs to the end of the tag array """
+        self._tag_starts[slot] = len(self._tag_ids)
+        self._tag_ids.extend(tag_ids)
+        self._tag_ends[slot] = len(self._tag_ids)
+
+    def _slot_tag_ids(self, slot: int) -> array:
+        return self._tag_ids[self._tag_starts[slot]:self._tag_ends[slot]]
+
+    def _append(self, url: Text, tag_ids: Iterable[int]) -> int:
+        slot = len(self._urls)
+        self._urls.append(url)
+        self._tag_starts.append(0)
+        self._tag_ends.append(0)
+        self._write_tags(slot, tag_ids)
+        return slot
+
+    def append(self, url: Text, tags: Set[Text]) -> int:
+        """
+        Stores a new GIF in the next free slot
+        :param url: The URL of the GIF
+        :param tags: The tags of the GIF
+        :return: The slot that the GIF has been stored in
+        """
+        return self._append(url, sorted({self.strings.intern(tag) for tag in tags}))
+
+    def is_live(self, slot: int) -> bool:
+        """ Checks whether a slot holds a GIF, rather than a tombstone """
+        return self._urls[slot] is not None
+
+    def url(self, slot: int) -> Text:
+        """ Gets the URL of the GIF in a slot """
+        return self._urls[slot]
+
+    def tags(self, slot: int) -> Set[Text]:
+        """ Gets the tags of the GIF in a slot """
+        return {self.strings.lookup(tag_id) for tag_id in self._slot_tag_ids(slot)}
+
+    def add_tags(self, slot: int, tags: Set[Text]) -> Set[Text]:
+        """
+        Adds tags to the GIF in a slot. The slot's tags are rewritten at the end of the tag array,
+        which overwrites them if they were already at the end, and otherwise leaves the old copy
+        behind until the array is next repacked.
+        :return: The tags that the GIF did not already have
+        """
+        tag_ids = set(self._slot_tag_ids(slot))
+        new_tags = {tag for tag in tags if self.strings.intern(tag) not in tag_ids}
+        if new_tags:
+            tag_ids.update(self.strings.intern(tag) for tag in new_tags)
+            start, end = self._tag_starts[slot], self._tag_ends[slot]
+            if end == len(self._tag_ids):
+                del self._tag_ids[start:]
+                self._write_tags(slot, sorted(tag_ids))
+            else:
+                self._write_tags(slot, sorted(tag_ids))
+                self._discarded(end - start)
+        return new_tags
+
+    def clear(self, slot: int) -> None:
+        """ Replaces the GIF in a slot with a tombstone """
+        self._urls[slot] = None
+        stale = self._tag_ends[slot] - self._tag_starts[slot]
+        self._tag_starts[slot] = self._tag_ends[slot] = 0
+        self._discarded(stale)
+
+    def _discarded(self, count: int) -> None:
+        """ Records that entries of the tag array have gone stale, repacking it once enough have """
+        self.stale += count
+        if self.stale >= REPACK_MIN_STALE and self.stale * 2 >= len(self._tag_ids):
+            self._repack()
+
+    def _repack(self) -> None:
+        """ Rewrites the tag array without its stale entries, keeping every GIF in its slot """
+        tag_starts, tag_ends, tag_ids = array("Q"), array("Q"), array("I")
+        for start, end in zip(self._tag_starts, self._tag_ends):
+            tag_starts.append(len(tag_ids))
+            tag_ids.extend(self._tag_ids[start:end])
+            tag_ends.append(len(tag_ids))
+        self._tag_starts, self._tag_ends, self._tag_ids = tag_starts, tag_ends, tag_ids
+        self.stale = 0
+
+    def element(self, slot: int) -> Element:
+        """ Gets the GIF in a slot as an ``Element`` """
+        return Element(self._urls[slot], self.tags(slot))
+
+    def compacted(self) -> "CompactStorage":
+        """
+        Creates a copy of the storage with all of the tombstones and stale tags removed. Tags are
+        interned into a new string table, so that tags only used by removed GIFs are dropped too.
+        """
+        storage = CompactStorage()
+        new_ids = {}  # type: Dict[int, int]
+        for slot, url in enumerate(self._urls):
+            if url is not None:
+                tag_ids = []
+                for tag_id in self._slot_tag_ids(slot):
+                    if tag_id not in new_ids:
+                        new_ids[tag_id] = storage.strings.intern(self.strings.lookup(tag_id))
+                    tag_ids.append(new_ids[tag_id])
+                storage._append(url, sorted(tag_ids))  # pylint: disable=protected-access
+        return storage
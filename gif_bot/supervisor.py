@@ -0,0 +1,209 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``Supervisor`` class, which serves several Slack workspaces from a single
+deployment by running one ``GifBot`` worker process per workspace config.
+
+Before starting the workers, the supervisor brings each config's snapshot (``snapshot_loc``) up to
+date. Every worker then memory-maps the same read-only snapshot file, so however many workspaces
+share a manifest, the operating system only keeps one copy of its GIFs in memory.
+"""
+
+import multiprocessing
+import os
+import signal
+import time
+from logging import Logger, getLogger
+from multiprocessing.connection import wait
+from typing import Any, Callable, List, Optional, Text  # pylint: disable=unused-import
+
+from configobj import ConfigObj
+
+from gif_bot.snapshot import ensure_snapshot
+
+# Crashed workers are restarted after a delay that doubles with each consecutive crash...
+RESTART_DELAY = 1.
+MAX_RESTART_DELAY = 60.
+# ... and which is reset once a worker has stayed up for this long
+HEALTHY_UPTIME = 60.
+
+
+def run_worker(config_filename: Text, log_filename: Text) -> None:
+    """
+    Runs a bot until it stops. This is the entry point of each worker process.
+    :param config_filename: The config file for the bot's workspace
+    :param log_filename: The file the bot should log to
+    """
+    # Interrupts are handled by the supervisor, which then stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Imported here, so that the supervisor itself doesn't need to load the bot and its dependencies
+    from gif_bot.async_runner import AsyncRunner
+    from gif_bot.gif_bot import GifBot
+
+    bot = GifBot(config_filename=config_filename, log_filename=log_filename)
+    if bot.async_mode:
+        AsyncRunner(bot).run()
+    else:
+        bot.run()
+
+
+class Supervisor:
+    """
+    Runs a worker process for each of a set of bot configs, restarting any worker that crashes
+    """
+
+    class Worker:  # pylint: disable=too-few-public-methods
+        """ The state of a single worker process """
+        def __init__(self, config_filename: Text, log_filename: Text) -> None:
+            self.config_filename = config_filename
+            self.log_filename = log_filename
+            self.process = None  # type: Optional[Any]
+            self.started = 0.
+            self.restarts = 0
+            self.delay = RESTART_DELAY
+            # When the worker should next be (re)started, or None once it has finished for good
+            self.start_at = 0.  # type: Optional[float]
+
+    def __init__(self, config_filenames: List[Text], log_dir: Text = ".",
+                 target: Callable[[Text, Text], None] = run_worker,
+                 log: Optional[Logger] = None, context: Optional[Any] = None) -> None:
+        """
+        :param config_filenames: The config file of each workspace to serve
+        :param log_dir: The directory to write each worker's log file into
+        :param target: The function run by each worker, given its config and log file names
+        :param log: Where to log the workers' starts and exits
+        :param context: The multiprocessing context used to create the workers
+        """
+        self.target = target
+        self.log = log if log is not None else getLogger(__name__)
+        self.context = context if context is not None else multiprocessing.get_context("spawn")
+        self.stopped = False
+        self.workers = [
+            self.Worker(config_filename, os.path.join(
+                log_dir, os.path.splitext(os.path.basename(config_filename))[0] + ".log"))
+            for config_filename in config_filenames]
+
+    def prepare_snapshots(self) -> None:
+        """ Brings the snapshot of each config's manifest up to date, for the workers to share """
+        prepared = set()
+        for worker in self.workers:
+            config = ConfigObj(worker.config_filename)
+            snapshot_loc = config.get("snapshot_loc")
+            if not snapshot_loc:
+                self.log.warning("%s has no snapshot_loc, so its worker will load its own copy "
+                                 "of the manifest", worker.config_filename)
+                continue
+            if snapshot_loc in prepared:
+                continue
+            if ensure_snapshot(snapshot_loc, config["manifest_loc"], config.get("journal_loc")):
+                self.log.info("Rebuilt the snapshot %s", snapshot_loc)
+            prepared.add(snapshot_loc)
+
+    def run(self) -> None:
+        """ Runs the workers until they have all finished, or the supervisor is stopped """
+        self.prepare_snapshots()
+        try:
+            while not self.stopped and self.poll():
+                pass
+        except KeyboardInterrupt:
+            self.log.info("Interrupted, so stopping the workers")
+        finally:
+            self.stop()
+
+    def poll(self, timeout: float = 1.) -> bool:
+        """
+        Starts any workers that are due to be (re)started, and then waits for a worker to exit
+        :param timeout: The longest time to wait for
+        :return: Whether any workers are still running or waiting to be restarted
+        """
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None and worker.start_at is not None and worker.start_at <= now:
+                self._start(worker)
+
+        running = [worker.process.sentinel for worker in self.workers
+                   if worker.process is not None]
+        pending = [worker.start_at for worker in self.workers
+                   if worker.process is None and worker.start_at is not None]
+        if not running and not pending:
+            return False
+        if pending:
+            timeout = max(0., min(timeout, min(pending) - now))
+        if running:
+            wait(running, timeout)
+        else:
+            time.sleep(timeout)
+
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                self._exited(worker)
+        return True
+
+    def _start(self, worker: "Supervisor.Worker") -> None:
+        """ Starts a worker process """
+        worker.process = self.context.Process(target=self.target, daemon=True,
+                                              args=(worker.config_filename, worker.log_filename),
+                                              name="gif_bot:" + worker.config_filename)
+        worker.process.start()
+        worker.started = time.monotonic()
+        self.log.info("Started the worker for %s [pid:%s]", worker.config_filename,
+                      worker.process.pid)
+
+    def _exited(self, worker: "Supervisor.Worker") -> None:
+        """ Handles a worker process exiting, scheduling a restart if it crashed """
+        worker.process.join()
+        exit_code = worker.process.exitcode
+        worker.process = None
+        if exit_code == 0 or self.stopped:
+            self.log.info("The worker for %s has finished", worker.config_filename)
+            worker.start_at = None
+            return
+
+        now = time.monotonic()
+        if now - worker.started >= HEALTHY_UPTIME:
+            worker.delay = RESTART_DELAY
+        worker.start_at = now + worker.delay
+        self.log.error("The worker for %s crashed with exit code %s, restarting it in %s seconds",
+                       worker.config_filename, exit_code, worker.delay)
+        worker.delay = min(worker.delay * 2, MAX_RESTART_DELAY)
+        worker.restarts += 1
+
+    def stop(self, timeout: float = 5.) -> None:
+        """
+        Stops all of the workers
+        :param timeout: How long to give each worker to exit before it is killed
+        """
+        self.stopped = True
+        for worker in self.workers:
+            worker.start_at = None
+            if worker.process is not None:
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+                worker.process = None
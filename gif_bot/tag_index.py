@@ -0,0 +1,316 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``TagIndex`` class, an inverted index from tags onto GIF element IDs.
+"""
+
+import random
+from array import array
+from bisect import bisect_left
+from typing import (Dict, Iterable, Iterator, List, Optional,  # pylint: disable=unused-import
+                    Sequence, Text)
+
+# Element IDs are stored as unsigned 32-bit integers
+ID_TYPECODE = "I"
+
+# The number of rejection-sampling attempts made by ``TagIndex.choose`` before falling back to a
+# single reservoir-sampling pass over the intersection
+MAX_CHOICE_ATTEMPTS = 32
+
+
+def _contains(postings: Sequence[int], element_id: int) -> bool:
+    """ Binary search for an element ID within a sorted posting list """
+    pos = bisect_left(postings, element_id)
+    return pos < len(postings) and postings[pos] == element_id
+
+
+class TagHistogram:
+    """
+    The tags of an index ranked by their GIF counts, most common first. Each change to a tag's count
+    moves it to the edge of the run of tags sharing its old count, so the ranking is kept up to
+    date in O(1) per change rather than being re-sorted.
+    """
+
+    def __init__(self, counts: Iterable) -> None:
+        """
+        :param counts: The initial (tag, count) pairs
+        """
+        self._ranked = [[tag, count] for tag, count in
+                        sorted(counts, key=lambda item: item[1], reverse=True)]  # type: List[list]
+        self._positions = {}  # type: Dict[Text, int]
+        # The [start, end) positions of the run of tags with each count
+        self._runs = {}  # type: Dict[int, List[int]]
+        for position, (tag, count) in enumerate(self._ranked):
+            self._positions[tag] = position
+            run = self._runs.setdefault(count, [position, position])
+            run[1] = position + 1
+
+    def __len__(self) -> int:
+        return len(self._ranked)
+
+    def top(self, num_tags: int) -> List[tuple]:
+        """
+        Gets the most common tags
+        :param num_tags: The number of tags to get
+        :return: Up to ``num_tags`` (tag, count) pairs, most common first
+        """
+        return [tuple(item) for item in self._ranked[:num_tags]]
+
+    def _swap(self, position: int, other: int) -> None:
+        """ Swaps the tags at two positions """
+        ranked = self._ranked
+        ranked[position], ranked[other] = ranked[other], ranked[position]
+        self._positions[ranked[position][0]] = position
+        self._positions[ranked[other][0]] = other
+
+    def increment(self, tag: Text) -> None:
+        """ Records that one more element carries a tag """
+        position = self._positions.get(tag)
+        if position is None:
+            position = len(self._ranked)
+            self._ranked.append([tag, 0])
+            self._positions[tag] = position
+            self._runs.setdefault(0, [position, position])[1] = position + 1
+
+        # Move the tag to the start of its run, and then over into the run before it
+        count = self._ranked[position][1]
+        run = self._runs[count]
+        start = run[0]
+        self._swap(position, start)
+        self._ranked[start][1] = count + 1
+        run[0] += 1
+        if run[0] == run[1]:
+            del self._runs[count]
+        higher = self._runs.get(count + 1)
+        if higher is not None:
+            higher[1] += 1
+        else:
+            self._runs[count + 1] = [start, start + 1]
+
+    def decrement(self, tag: Text) -> None:
+        """ Records that one fewer element carries a tag, dropping it once no elements do """
+        position = self._positions[tag]
+
+        # Move the tag to the end of its run, and then over into the run after it
+        count = self._ranked[position][1]
+        run = self._runs[count]
+        end = run[1] - 1
+        self._swap(position, end)
+        self._ranked[end][1] = count - 1
+        run[1] -= 1
+        if run[0] == run[1]:
+            del self._runs[count]
+        if count == 1:
+            # Tags with a single element are always ranked last
+            self._ranked.pop()
+            del self._positions[tag]
+            return
+        lower = self._runs.get(count - 1)
+        if lower is not None:
+            lower[0] -= 1
+        else:
+            self._runs[count - 1] = [end, end + 1]
+
+
+class TagIndex:
+    """
+    An inverted index mapping each tag onto a sorted posting list of the IDs of the elements that
+    carry it. The index can also be used as a read-only mapping from each tag to its GIF count.
+    """
+
+    def __init__(self) -> None:
+        self._postings = {}  # type: Dict[Text, array]
+        # Only built once it's needed, so that bulk loads don't pay to keep it up to date
+        self._histogram = None  # type: Optional[TagHistogram]
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def __iter__(self) -> Iterator[Text]:
+        return iter(self._postings)
+
+    def __contains__(self, tag: object) -> bool:
+        return tag in self._postings
+
+    def __getitem__(self, tag: Text) -> int:
+        return len(self._postings[tag])
+
+    def keys(self) -> Iterable[Text]:
+        """ Gets all of the tags in the index """
+        return self._postings.keys()
+
+    def items(self) -> Iterable:
+        """ Gets (tag, count) pairs for all of the tags in the index """
+        return ((tag, len(postings)) for tag, postings in self._postings.items())
+
+    def get(self, tag: Text, default: int = 0) -> int:
+        """ Gets the number of elements carrying a tag """
+        postings = self._postings.get(tag)
+        return default if postings is None else len(postings)
+
+    def clear(self) -> None:
+        """ Removes everything from the index """
+        self._postings.clear()
+        self._histogram = None
+
+    @property
+    def histogram(self) -> TagHistogram:
+        """ The tags ranked by their GIF counts, which is kept up to date once it has been built """
+        if self._histogram is None:
+            self._histogram = TagHistogram(self.items())
+        return self._histogram
+
+    def add(self, element_id: int, tags: Iterable[Text]) -> None:
+        """
+        Adds an element to the posting lists of the provided tags
+        :param element_id: The ID of the element
+        :param tags: The tags that the element should be indexed under
+        """
+        histogram = self._histogram
+        for tag in tags:
+            postings = self._postings.get(tag)
+            if postings is None:
+                self._postings[tag] = array(ID_TYPECODE, (element_id,))
+            elif not postings or postings[-1] < element_id:
+                # IDs are normally handed out in increasing order, so this is the common case
+                postings.append(element_id)
+            else:
+                pos = bisect_left(postings, element_id)
+                if pos < len(postings) and postings[pos] == element_id:
+                    continue
+                postings.insert(pos, element_id)
+            if histogram is not None:
+                histogram.increment(tag)
+
+    def discard(self, element_id: int, tags: Iterable[Text]) -> None:
+        """
+        Removes an element from the posting lists of the provided tags, dropping any tags that are
+        left without elements
+        :param element_id: The ID of the element
+        :param tags: The tags that the element is indexed under
+        """
+        for tag in tags:
+            postings = self._postings.get(tag)
+            if postings is None:
+                continue
+            pos = bisect_left(postings, element_id)
+            if pos < len(postings) and postings[pos] == element_id:
+                del postings[pos]
+                if self._histogram is not None:
+                    self._histogram.decrement(tag)
+            if not postings:
+                del self._postings[tag]
+
+    def postings(self, tag: Text) -> Optional[array]:
+        """ Gets the posting list of a tag, or None if no elements carry it """
+        return self._postings.get(tag)
+
+    def _sorted_postings(self, tags: Iterable[Text]) -> Optional[List[array]]:
+        """ Gets the posting lists for a set of tags, smallest first, or None if any are empty """
+        return sorted_postings(self._postings.get(tag) for tag in set(tags))
+
+    def intersect(self, tags: Iterable[Text]) -> Iterator[int]:
+        """
+        Iterates through the IDs of the elements that carry all of the provided tags, in
+        increasing order
+        :param tags: The tags that must all be present
+        """
+        return intersect_postings(self._sorted_postings(tags))
+
+    def count(self, tags: Iterable[Text]) -> int:
+        """
+        Counts the elements that carry all of the provided tags
+        :param tags: The tags that must all be present
+        """
+        return count_postings(self._sorted_postings(tags))
+
+    def choose(self, tags: Iterable[Text]) -> Optional[int]:
+        """
+        Picks the ID of an element carrying all of the provided tags uniformly at random, without
+        materialising the intersection
+        :param tags: The tags that must all be present
+        :return: The ID of the chosen element, or None if no element carries all of the tags
+        """
+        return choose_posting(self._sorted_postings(tags))
+
+
+# The functions below work on any sorted sequences of element IDs (such as arrays, or memoryviews
+# of a snapshot file), passed in smallest first as returned by ``sorted_postings``
+
+def sorted_postings(postings: Iterable[Optional[Sequence[int]]]) -> Optional[List[Sequence[int]]]:
+    """
+    Sorts a set of posting lists smallest first
+    :return: The sorted posting lists, or None if any of them are missing or empty
+    """
+    result = []
+    for tag_postings in postings:
+        if not tag_postings:
+            return None
+        result.append(tag_postings)
+    result.sort(key=len)
+    return result
+
+
+def intersect_postings(postings: Optional[List[Sequence[int]]]) -> Iterator[int]:
+    """ Iterates through the element IDs that are in every posting list, in increasing order """
+    if not postings:
+        return iter(())
+    smallest, others = postings[0], postings[1:]
+    if not others:
+        return iter(smallest)
+    return (element_id for element_id in smallest
+            if all(_contains(other, element_id) for other in others))
+
+
+def count_postings(postings: Optional[List[Sequence[int]]]) -> int:
+    """ Counts the element IDs that are in every posting list """
+    if not postings:
+        return 0
+    if len(postings) == 1:
+        return len(postings[0])
+    return sum(1 for _ in intersect_postings(postings))
+
+
+def choose_posting(postings: Optional[List[Sequence[int]]]) -> Optional[int]:
+    """
+    Picks an element ID that is in every posting list uniformly at random
+    :return: The chosen ID, or None if the posting lists have no IDs in common
+    """
+    if not postings:
+        return None
+    smallest, others = postings[0], postings[1:]
+
+    # Rejection sampling from the smallest posting list is uniform over the intersection, and is
+    # quick whenever the intersection is a decent fraction of the smallest list
+    for _ in range(MAX_CHOICE_ATTEMPTS):
+        element_id = smallest[random.randrange(len(smallest))]
+        if all(_contains(other, element_id) for other in others):
+            return element_id
+
+    # Otherwise fall back to reservoir sampling across the (sparse) intersection
+    chosen = None
+    for seen, element_id in enumerate(intersect_postings(postings), start=1):
+        if random.randrange(seen) == 0:
+            chosen = element_id
+    return chosen
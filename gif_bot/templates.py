@@ -0,0 +1,168 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Implementation of the ``GreetingTemplates`` class, which renders every combination of greeting and
+noun once when the bot is configured, so that posting a GIF only has to pick one and add the URL.
+``StatusTemplates`` does the same for the adjectives describing each tag in a store's status.
+"""
+
+import json
+import random
+from functools import lru_cache
+from string import Formatter
+from typing import Iterable, List, Text, Tuple  # pylint: disable=unused-import
+
+PLACEHOLDERS = ("", "0", "noun", "url")
+PAYLOAD_CACHE_SIZE = 4096
+
+# Stands in for the URL while templates are rendered, so that they can then be split around it
+_URL_MARKER = "\x00url\x00"
+
+
+class TemplateError(ValueError):
+    """ Errors relating to malformed greeting templates """
+    pass
+
+
+def validate_template(template: Text) -> None:
+    """
+    Checks that a greeting only uses the placeholders that are filled in when it is rendered:
+    ``{}`` or ``{noun}`` for the noun, and ``{url}`` for the URL of the GIF
+    :raises TemplateError: If the template is malformed, or uses any other placeholders
+    """
+    try:
+        fields = [field for _, field, _, _ in Formatter().parse(template) if field is not None]
+    except ValueError as err:
+        raise TemplateError("Malformed greeting '{}': {}".format(template, err))
+    for field in fields:
+        if field not in PLACEHOLDERS:
+            raise TemplateError("Unknown placeholder '{{{}}}' in the greeting '{}' (expected "
+                                "{{}}, {{noun}} or {{url}})".format(field, template))
+    # Mixing ``{}`` with ``{0}``, repeating ``{}`` and nesting placeholders in format specs only
+    # fail once the greeting is rendered
+    _render(template, "noun")
+
+
+def _render(template: Text, noun: Text) -> Text:
+    """
+    Renders a greeting with a noun, leaving a marker where the URL goes
+    :raises TemplateError: If the greeting can't be rendered
+    """
+    try:
+        return template.format(noun, noun=noun, url=_URL_MARKER)
+    except (IndexError, KeyError, ValueError) as err:
+        raise TemplateError("Malformed greeting '{}': {}".format(template, err))
+
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def image_block(url: Text, alt_text: Text) -> Text:
+    """ Gets the JSON of a Slack image block showing a GIF, which is cached for future posts """
+    return json.dumps({"type": "image", "image_url": url, "alt_text": alt_text})
+
+
+def _blocks_start(greeting: Text) -> Text:
+    """ Renders the start of a list of blocks, with a section showing the greeting (if any) """
+    if not greeting:
+        return "["
+    return "[" + json.dumps({"type": "section", "text": {"type": "mrkdwn", "text": greeting}}) + ","
+
+
+class GreetingTemplates:
+    """
+    A table of pre-rendered greetings. Each greeting is stored as the text either side of the GIF's
+    URL, so that posting a GIF is a single random index into the table followed by a single join.
+    """
+
+    def __init__(self, greetings: Iterable[Text], nouns: Iterable[Text],
+                 templates: Iterable[Text] = (), blocks: bool = False) -> None:
+        """
+        :param greetings: The greetings, where ``{}`` is replaced by a noun and the URL of the GIF
+                          follows the greeting
+        :param nouns: The nouns used to address people
+        :param templates: Additional greetings, which can also use the ``{noun}`` and ``{url}``
+                          placeholders to choose where the noun and URL go
+        :param blocks: Whether to also pre-render each greeting as a Slack section block
+        :raises TemplateError: If any of the greetings are malformed
+        """
+        nouns = list(nouns) or [""]
+        self.parts = []  # type: List[Tuple[Text, ...]]
+        self.blocks_start = []  # type: List[Text]
+
+        for template in list(greetings) + list(templates):
+            validate_template(template)
+            # Every greeting is rendered with every noun, so each greeting is as likely to be
+            # chosen as it would be if the greeting and noun were chosen separately
+            for noun in nouns:
+                text = _render(template, noun)
+                parts = tuple(text.split(_URL_MARKER))
+                if len(parts) == 1:
+                    parts = (text + " ", "")
+                self.parts.append(parts)
+                if blocks:
+                    self.blocks_start.append(_blocks_start("".join(parts).strip()))
+
+        if not self.parts:
+            self.parts.append(("", ""))
+            if blocks:
+                self.blocks_start.append(_blocks_start(""))
+
+    def __len__(self) -> int:
+        return len(self.parts)
+
+    def render(self, url: Text) -> Text:
+        """ Renders a random greeting for a GIF """
+        return url.join(random.choice(self.parts))
+
+    def render_blocks(self, url: Text, alt_text: Text) -> Tuple[Text, Text]:
+        """
+        Renders a random greeting for a GIF, along with the Slack blocks that show it
+        :param url: The URL of the GIF
+        :param alt_text: A description of the GIF
+        :return: The text of the greeting, and the JSON of the blocks
+        """
+        index = random.randrange(len(self.parts))
+        return (url.join(self.parts[index]),
+                "".join((self.blocks_start[index], image_block(url, alt_text), "]")))
+
+
+class StatusTemplates:
+    """
+    A table of pre-rendered lines for a store's status. Each adjective is stored as the text that
+    goes between a tag's count and the tag, so that describing a tag is a single random index into
+    the table followed by a single join.
+    """
+
+    def __init__(self, modifiers: Iterable[Text]) -> None:
+        """
+        :param modifiers: The adjectives used to describe the GIFs
+        """
+        self.modifiers = list(modifiers)
+        self.middles = [" " + modifier + " " for modifier in self.modifiers] or [" "]
+
+    def __len__(self) -> int:
+        return len(self.middles)
+
+    def render(self, tag: Text, count: int) -> Text:
+        """ Renders the line describing how many GIFs carry a tag """
+        return "".join(("  ", str(count), self.middles[random.randrange(len(self.middles))], tag,
+                        " gifs!" if count > 1 else " gif!"))
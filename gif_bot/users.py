@@ -0,0 +1,141 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Implementation of the ``UserDirectory`` class, which resolves Slack user names into user IDs.
+"""
+
+import json
+import time
+from typing import (Any, Callable, Dict, Iterable, Optional, Text,  # pylint: disable=unused-import
+                    Tuple)
+
+from gif_bot.utils import atomic_write
+
+# The number of users requested per page of ``users.list``
+PAGE_SIZE = 200
+# How long a cached directory can be used for before it is fetched again, in seconds
+DEFAULT_TTL = 24 * 60 * 60.
+# A lookup that misses only refreshes the directory if it wasn't refreshed within this many seconds
+MIN_REFRESH_INTERVAL = 60.
+# The number of times a rate limited page is retried before giving up
+MAX_RATE_LIMIT_RETRIES = 5
+
+
+class UserLookupError(RuntimeError):
+    """ Errors relating to fetching the list of users from Slack """
+    pass
+
+
+class UserDirectory:
+    """
+    A mapping from Slack user names onto user IDs. The directory is fetched a page at a time from
+    ``users.list`` (so workspaces of any size are fully covered), optionally cached on disk so that
+    restarts within the cache's lifetime don't need to fetch it again, and refreshed whenever a
+    lookup misses.
+    """
+
+    def __init__(self, call: Callable[..., Dict], cache_loc: Optional[Text] = None,
+                 ttl: float = DEFAULT_TTL, page_size: int = PAGE_SIZE,
+                 clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        """
+        :param call: Makes a Slack API call, like ``SlackClient.api_call``
+        :param cache_loc: Where to cache the directory on disk, if anywhere
+        :param ttl: How long the cached directory can be used for, in seconds
+        :param page_size: The number of users to request per page
+        :param clock: The wall clock, used to age the cache
+        :param sleep: Used to wait before retrying a rate limited page
+        """
+        self.call = call
+        self.cache_loc = cache_loc
+        self.ttl = ttl
+        self.page_size = page_size
+        self.clock = clock
+        self.sleep = sleep
+        self.ids = {}  # type: Dict[Text, Text]
+        self.fetched_at = None  # type: Optional[float]
+        if cache_loc is not None:
+            self._load_cache()
+
+    def _load_cache(self) -> None:
+        """ Loads the directory from the on-disk cache, unless it is missing, invalid or expired """
+        try:
+            with open(self.cache_loc) as cache_file:
+                cache = json.load(cache_file)
+            fetched_at, ids = float(cache["fetched_at"]), dict(cache["ids"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        if self.clock() - fetched_at < self.ttl:
+            self.ids, self.fetched_at = ids, fetched_at
+
+    def _save_cache(self) -> None:
+        """ Atomically writes the directory into the on-disk cache """
+        with atomic_write(self.cache_loc) as cache_file:
+            json.dump({"fetched_at": self.fetched_at, "ids": self.ids}, cache_file)
+
+    def _pages(self) -> Iterable[Dict]:
+        """ Fetches ``users.list`` one page at a time, following the pagination cursors """
+        cursor = None
+        retries = 0
+        while True:
+            kwargs = {"limit": self.page_size}
+            if cursor:
+                kwargs["cursor"] = cursor
+            page = self.call("users.list", **kwargs)
+            if not page.get("ok"):
+                if page.get("error") == "ratelimited" and retries < MAX_RATE_LIMIT_RETRIES:
+                    retries += 1
+                    self.sleep(float(page.get("retry_after") or 1.))
+                    continue
+                raise UserLookupError("Unable to call the Slack command 'users.list': {}"
+                                      .format(page.get("error")))
+            retries = 0
+            yield page
+            cursor = page.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                return
+
+    def refresh(self) -> None:
+        """ Fetches the whole directory from Slack, and updates the on-disk cache """
+        ids = {}
+        for page in self._pages():
+            for user in page.get("members", ()):
+                if "name" in user and "id" in user:
+                    ids[user["name"]] = user["id"]
+        self.ids, self.fetched_at = ids, self.clock()
+        if self.cache_loc is not None:
+            self._save_cache()
+
+    def resolve(self, names: Iterable[Text]) -> Tuple[Optional[Text], ...]:
+        """
+        Gets the IDs of a set of users, refreshing the directory if any of them aren't known
+        :param names: The user names
+        :return: The ID of each user, or None for any users that don't exist
+        :raises UserLookupError: If the directory can't be fetched
+        """
+        names = tuple(names)
+        if any(name not in self.ids for name in names) and \
+                (self.fetched_at is None or self.clock() - self.fetched_at >= MIN_REFRESH_INTERVAL):
+            self.refresh()
+        return tuple(self.ids.get(name) for name in names)
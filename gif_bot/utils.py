@@ -24,14 +24,44 @@
 Helper functions for gif_bot
 """
 
-from typing import Union, List, Any, Text
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator, Union, List, Any, Text
 
 
 def get_config_list(config, key: Text) -> List[Text]:
     """
     Read a list from the config file
     """
-    return [line.lstrip() for line in config[key].split('\n') if line]
+    return [line.strip() for line in config[key].split('\n') if line.strip()]
+
+
+def get_config_bool(config, key: Text, default: bool = False) -> bool:
+    """
+    Read an optional boolean from the config file
+    """
+    if key not in config:
+        return default
+    return config.as_bool(key)
+
+
+def get_config_int(config, key: Text, default: int = 0) -> int:
+    """
+    Read an optional integer from the config file
+    """
+    if key not in config:
+        return default
+    return config.as_int(key)
+
+
+def get_config_float(config, key: Text, default: float = 0.) -> float:
+    """
+    Read an optional float from the config file
+    """
+    if key not in config:
+        return default
+    return config.as_float(key)
 
 
 def as_list(item: Union[List, Any]) -> List:
@@ -42,3 +72,29 @@ def as_list(item: Union[List, Any]) -> List:
         return item
 
     return [item]
+
+
+@contextmanager
+def atomic_write(filename: Text, binary: bool = False) -> Iterator[IO]:
+    """
+    Open a file for writing, such that it is only replaced once it has been completely written.
+    The contents are written to a temporary file in the same directory, which is then renamed over
+    the original, so a crash can never leave the file half-written.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    file_descriptor, temp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with open(file_descriptor, "wb" if binary else "w",
+                  **({} if binary else {"newline": ""})) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        # Keep the permissions of the original file, rather than those of the temporary file
+        try:
+            os.chmod(temp_filename, os.stat(filename).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temp_filename, 0o644)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
@@ -20,20 +20,43 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import signal
 import sys
 
+from gif_bot.async_runner import AsyncRunner
 from gif_bot.gif_bot import GifBot
+from gif_bot.supervisor import Supervisor
+
+
+def _supervise(config_filenames):
+    """ Serves several workspaces, with a worker process for each of their configs """
+    supervisor = Supervisor(config_filenames, log=GifBot._init_log("supervisor.log"))
+
+    def _stop(*_):
+        supervisor.stopped = True
+    signal.signal(signal.SIGTERM, _stop)
+
+    supervisor.run()
 
 
 def _main():
+    # Usage: python3 run.py [config ...]
+    config_filenames = sys.argv[1:] or ["bot.config"]
+    if len(config_filenames) > 1:
+        _supervise(config_filenames)
+        return
+
     try:
-        bot = GifBot(config_filename="bot.config", log_filename="wbb.log")
+        bot = GifBot(config_filename=config_filenames[0], log_filename="wbb.log")
     except Exception as e:
         print("[ERROR]  Unable to initialise the bot")
         print("[ERROR]  {}".format(e))
         return
 
-    bot.run()
+    if bot.async_mode:
+        AsyncRunner(bot).run()
+    else:
+        bot.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``AsyncRunner`` class, run against a local fake Slack RTM server.
+"""
+
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from benchmarks.fake_slack import FakeSlackClient, FakeSlackServer
+from gif_bot.async_runner import AsyncRunner
+from gif_bot.gif_bot import GifBot
+
+
+@patch("gif_bot.async_runner.ERR_DELAY", 0.01)
+@patch("gif_bot.gif_bot.getLogger")
+@patch("gif_bot.gif_bot.Formatter")
+@patch("gif_bot.gif_bot.Logger")
+@patch("gif_bot.gif_bot.RotatingFileHandler")
+class TestAsyncRunner(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSlackServer().start()
+        self.client = FakeSlackClient("UNUSED", self.server, api_latency=0.01)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def start_runner(self):
+        with patch("gif_bot.gif_bot.SlackClient", lambda _: self.client):
+            bot = GifBot("test.config", MagicMock())
+        runner = AsyncRunner(bot)
+        thread = threading.Thread(target=runner.run, daemon=True)
+        thread.start()
+        self.assertTrue(self.server.wait_for_clients())
+        return runner, thread
+
+    @staticmethod
+    def message(text, ts="test_ts", user="test_user_id", channel="test_channel"):
+        return {"type": "message", "user": user, "text": text, "channel": channel, "ts": ts}
+
+    def test_handles_triggers(self, *args):
+        """ Messages pushed over the websocket should be handled as soon as they arrive """
+        runner, thread = self.start_runner()
+
+        self.server.send_event({"type": "hello"})
+        self.server.send_event(self.message("Something something test_trigger"))
+        self.assertTrue(self.client.wait_for_calls("reactions.add", 1))
+        self.assertEqual(self.client.calls_to("reactions.add")[0],
+                         {"name": "test_reaction", "channel": "test_channel",
+                          "timestamp": "test_ts"})
+
+        runner.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_handles_messages_concurrently(self, *args):
+        """ Slow Slack API calls for different messages should overlap """
+        runner, thread = self.start_runner()
+        self.client.api_latency = 0.2
+
+        for i in range(8):
+            self.server.send_event(self.message("test_trigger", ts=str(i), channel="C{}".format(i)))
+        self.assertTrue(self.client.wait_for_calls("reactions.add", 8, timeout=1.5))
+
+        runner.stop()
+        thread.join(5)
+
+    def test_handles_channel_in_order(self, *args):
+        """ Messages from the same channel should be handled one at a time, in order """
+        runner, thread = self.start_runner()
+        self.client.api_latency = 0.05
+
+        for i in range(4):
+            self.server.send_event(self.message("test_trigger", ts=str(i)))
+        self.assertTrue(self.client.wait_for_calls("reactions.add", 4))
+        self.assertEqual([call["timestamp"] for call in self.client.calls_to("reactions.add")],
+                         ["0", "1", "2", "3"])
+
+        runner.stop()
+        thread.join(5)
+
+    def test_reconnects(self, *args):
+        """ The runner should reconnect if the websocket is dropped """
+        runner, thread = self.start_runner()
+
+        self.server.disconnect_all()
+        self.assertTrue(self.server.wait_for_clients())
+        self.server.send_event(self.message("test_trigger"))
+        self.assertTrue(self.client.wait_for_calls("reactions.add", 1))
+
+        runner.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
@@ -0,0 +1,113 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the per-channel settings.
+"""
+
+import unittest
+
+from configobj import ConfigObj
+
+from gif_bot.channels import ChannelSettings, TagFilter, compile_channels
+from gif_bot.gif_store import GifStore
+from gif_bot.matcher import TriggerMatcher
+from gif_bot.query import QueryError
+
+CHANNELS = """
+[channels]
+    [[C_SAFE]]
+        blocked_tags = nsfw
+    [[C_DOGS]]
+        allowed_tags = '''
+            dog
+            puppy
+        '''
+        reactions = dog
+    [[C_WORDS]]
+        triggers = '''
+            Fetch
+            walkies
+        '''
+    [[C_SAME]]
+        triggers = '''
+            walkies
+            fetch
+        '''
+""".split("\n")
+
+
+class TestTagFilter(unittest.TestCase):
+    def setUp(self):
+        self.store = GifStore(manifest_data=["url_a,cat,nsfw", "url_b,cat", "url_c,dog",
+                                             "url_d,puppy,nsfw"])
+
+    def test_blocked(self):
+        """ GIFs with blocked tags should never be chosen """
+        query = TagFilter(blocked=["nsfw"]).query("cat")
+        self.assertEqual(self.store.get_count(query), 1)
+        self.assertEqual({self.store.get_gif(query) for _ in range(20)}, {"url_b"})
+
+    def test_allowed(self):
+        """ GIFs without any allowed tags should never be chosen """
+        tag_filter = TagFilter(allowed=["dog", "puppy"], blocked=["nsfw"])
+        self.assertEqual(self.store.get_count(tag_filter.query("all")), 1)
+        self.assertEqual(self.store.get_count(tag_filter.query("cat")), 0)
+        self.assertEqual(self.store.get_count(TagFilter(allowed=["dog", "puppy"]).query("all")), 2)
+
+    def test_malformed(self):
+        """ Malformed queries and filters should be rejected, rather than escaping the filter """
+        with self.assertRaises(QueryError):
+            TagFilter(blocked=["nsfw"]).query("nsfw)|(cat")
+        with self.assertRaises(QueryError):
+            TagFilter(blocked=['"quoted"'])
+        self.assertFalse(TagFilter())
+
+    def test_quoted(self):
+        """ Tags containing operators, and the tag "all", should be filtered on as plain tags """
+        self.store.load_manifest("url_e,thumbs-up,cat\nurl_f,all,cat\n")
+        tag_filter = TagFilter(allowed=["cat"], blocked=["thumbs-up", "all", "nsfw"])
+        self.assertEqual(tag_filter.suffix, '+(cat)-"all"-nsfw-"thumbs-up"')
+        self.assertEqual(self.store.get_count(tag_filter.query("all")), 1)
+
+
+class TestCompileChannels(unittest.TestCase):
+    def test_compile(self):
+        """ Channels should override the defaults, and share matchers for the same triggers """
+        defaults = ChannelSettings(TriggerMatcher(["gif"]), ["heart"])
+        channels = compile_channels(ConfigObj(CHANNELS)["channels"], defaults)
+
+        self.assertEqual(channels["C_SAFE"].query("cat"), "(cat)-nsfw")
+        self.assertIs(channels["C_SAFE"].matcher, defaults.matcher)
+        self.assertEqual(channels["C_SAFE"].reactions, ["heart"])
+
+        self.assertEqual(channels["C_DOGS"].query("all"), "(all)+(dog|puppy)")
+        self.assertEqual(channels["C_DOGS"].reactions, ["dog"])
+
+        self.assertTrue(channels["C_WORDS"].matcher.matches("fetch!"))
+        self.assertFalse(channels["C_WORDS"].matcher.matches("gif"))
+        self.assertIs(channels["C_WORDS"].matcher, channels["C_SAME"].matcher)
+        self.assertEqual(channels["C_WORDS"].query("cat"), "cat")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``TriggerCoalescer`` class.
+"""
+
+import threading
+import unittest
+
+from gif_bot.coalescer import TriggerCoalescer
+
+
+class FakeClock:
+    """ A clock that only moves when told to """
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class TestTriggerCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.coalescer = TriggerCoalescer(10., max_channels=2, clock=self.clock)
+
+    def test_burst(self):
+        """ Only the first trigger in a window should start a burst """
+        first, is_new = self.coalescer.join("a")
+        self.assertTrue(is_new)
+        self.clock.now = 5.
+        burst, is_new = self.coalescer.join("a")
+        self.assertFalse(is_new)
+        self.assertIs(burst, first)
+        self.assertIsNone(burst.success)
+        self.assertTrue(self.coalescer.join("b")[1])
+
+        # The window is timed from the start of the burst, so busy channels still get GIFs
+        self.clock.now = 10.
+        self.assertTrue(self.coalescer.join("a")[1])
+        self.assertEqual(self.coalescer.metrics(), {"channels": 2, "coalesced": 1})
+
+    def test_posted(self):
+        """ Triggers in a burst should share whether its GIF was posted """
+        burst, _ = self.coalescer.join("a")
+        self.coalescer.posted(burst, False)
+        self.assertFalse(self.coalescer.join("a")[0].success)
+
+    def test_posted_after_window(self):
+        """ A burst's result shouldn't be given to a later burst in the same channel """
+        first, _ = self.coalescer.join("a")
+        self.clock.now = 10.
+        second, is_new = self.coalescer.join("a")
+        self.assertTrue(is_new)
+
+        self.coalescer.posted(first, False)
+        self.assertFalse(first.wait(timeout=0.01))
+        self.assertIsNone(second.success)
+        self.coalescer.posted(second, True)
+        self.assertTrue(second.wait(timeout=0.01))
+
+    def test_wait(self):
+        """ Triggers in a burst should wait until its GIF has been posted """
+        first, _ = self.coalescer.join("a")
+        burst, _ = self.coalescer.join("a")
+        self.assertFalse(burst.wait(timeout=0.01))
+        timer = threading.Timer(0.05, self.coalescer.posted, (first, True))
+        timer.start()
+        self.assertTrue(burst.wait())
+        timer.join()
+
+    def test_eviction(self):
+        """ The least recently active channels should be forgotten first """
+        self.coalescer.join("a")
+        self.coalescer.join("b")
+        self.coalescer.join("a")
+        self.coalescer.join("c")
+        self.assertEqual(len(self.coalescer), 2)
+        self.assertFalse(self.coalescer.join("a")[1])
+        self.assertTrue(self.coalescer.join("b")[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``CommandRegistry`` class.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from gif_bot.commands import CommandRegistry, Invocation, Tokens, first_word
+
+
+class TestCommandRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = CommandRegistry()
+        self.request = MagicMock()
+        self.compare = MagicMock()
+        self.remove = MagicMock()
+        self.registry.register("request", self.request, "request cat", "Request a cat GIF",
+                               max_args=1, examples=[("request cat+dog", "Combine tags")])
+        self.registry.register("compare", self.compare, "compare cat dog", "Compare counts",
+                               min_args=1, max_args=None)
+        self.registry.register("remove", self.remove, "remove url", min_args=1, max_args=1,
+                               strict=True, admin=True)
+
+    def test_tokens(self):
+        tokens = Tokens("  @Bot   Request  Cat ", lower=True)
+        self.assertEqual(tokens.get(0), "@bot")
+        self.assertListEqual(tokens.slice(1, 2), ["request"])
+        self.assertListEqual(tokens.slice(1), ["request", "cat"])
+        self.assertIsNone(tokens.get(3))
+        self.assertEqual(first_word("@bot request cat"), "@bot")
+        self.assertEqual(first_word(""), "")
+
+    def test_tokens_lazy(self):
+        """ Only the words that are asked for should be split from the message """
+        tokens = Tokens("request cat" + " word" * 1000)
+        self.assertEqual(tokens.get(1), "cat")
+        self.assertEqual(len(tokens._tokens), 2)
+
+    def test_dispatch(self):
+        self.assertTrue(self.registry.dispatch(Tokens("request cat please"), "C1", "ts"))
+        self.request.assert_called_once_with(Invocation("C1", "ts", ["cat"], False))
+
+        self.assertTrue(self.registry.dispatch(Tokens("@bot compare a b c"), "C1", "ts", start=1))
+        self.compare.assert_called_once_with(Invocation("C1", "ts", ["a", "b", "c"], False))
+
+    def test_invalid(self):
+        self.assertFalse(self.registry.dispatch(Tokens(""), "C1", "ts"))
+        self.assertFalse(self.registry.dispatch(Tokens("unknown cat"), "C1", "ts"))
+        self.assertFalse(self.registry.dispatch(Tokens("compare"), "C1", "ts"))
+        self.compare.assert_not_called()
+
+    def test_admin(self):
+        self.assertFalse(self.registry.dispatch(Tokens("remove url"), "D1", "ts"))
+        self.assertFalse(self.registry.dispatch(Tokens("remove url extra"), "D1", "ts",
+                                                admin=True))
+        self.remove.assert_not_called()
+        self.assertTrue(self.registry.dispatch(Tokens("remove url"), "D1", "ts", admin=True))
+        self.remove.assert_called_once_with(Invocation("D1", "ts", ["url"], True))
+
+    def test_help_text(self):
+        self.assertEqual(self.registry.help_text(),
+                         "  `request cat` : Request a cat GIF\n"
+                         "  `request cat+dog` : Combine tags\n"
+                         "  `compare cat dog` : Compare counts")
+        self.assertTrue(self.registry.help_text(admin=True).endswith("\n  `remove url`"))
+
+        self.registry.register("about", MagicMock(), description="About me")
+        self.assertTrue(self.registry.help_text().endswith("\n  `about` : About me"))
+        with self.assertRaises(ValueError):
+            self.registry.register("about", MagicMock())
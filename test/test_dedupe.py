@@ -0,0 +1,149 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the GIF deduplication pipeline.
+"""
+
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from gif_bot.gif_store import GifStore
+
+try:
+    import numpy
+    from PIL import Image
+    from gif_bot.dedupe import _main, cache_name, dedupe, find_duplicates, hash_files, locate_gif
+except ImportError:
+    numpy = None
+
+
+def write_gif(filename, seed, size=64, frames=3, noise=0):
+    """ Writes an animated GIF of random blocks, optionally with some noise added to each pixel """
+    rng = random.Random(seed)
+    images = []
+    for _ in range(frames):
+        blocks = Image.new("L", (8, 8))
+        blocks.putdata([rng.randrange(256) for _ in range(64)])
+        image = blocks.resize((size, size), Image.BILINEAR)
+        if noise:
+            pixels = numpy.asarray(image, dtype=numpy.int16) + \
+                numpy.random.default_rng(seed).integers(-noise, noise + 1, (size, size))
+            image = Image.fromarray(pixels.clip(0, 255).astype(numpy.uint8))
+        images.append(image)
+    images[0].save(filename, save_all=True, append_images=images[1:], duration=100, loop=0)
+
+
+@unittest.skipIf(numpy is None, "numpy and Pillow are needed for deduplication")
+class TestDedupe(unittest.TestCase):
+    def test_find_duplicates(self):
+        hashes = [0, 0b111, None, 0xF << 60, (0xF << 60) | 0b1, 0xFFFF, 0b1111111]
+        self.assertListEqual(find_duplicates(hashes, threshold=3), [[0, 1], [3, 4]])
+        self.assertListEqual(find_duplicates(hashes, threshold=7), [[0, 1, 3, 4, 6]])
+        self.assertListEqual(find_duplicates(hashes, threshold=0), [])
+        # A chain of near matches shouldn't merge GIFs that are further apart than the threshold
+        chain = [0, 0b111, 0b111111, 0b111111111]
+        self.assertListEqual(find_duplicates(chain, threshold=3), [[0, 1], [2, 3]])
+        with self.assertRaises(ValueError):
+            find_duplicates(hashes, threshold=64)
+
+    def test_find_duplicates_random(self):
+        """ The multi-index lookup should find the same pairs as comparing every pair """
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(300)]
+        hashes += [value ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))
+                   for value in hashes[:50]]
+        hashes += [value ^ (0b111 << rng.randrange(60)) for value in hashes[50:100]]
+        # Larger thresholds also look for hashes that are close (rather than equal) in a block
+        for threshold in (4, 12):
+            groups = find_duplicates(hashes, threshold=threshold)
+            expected = {(i, j) for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+                        if bin(hashes[i] ^ hashes[j]).count("1") <= threshold}
+            found = {(i, j) for group in groups for i in group for j in group if i < j}
+            self.assertSetEqual(found, expected)
+
+    def test_hash(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("a.gif", "b.gif", "c.gif")]
+            write_gif(paths[0], seed=1)
+            write_gif(paths[1], seed=1, size=48, noise=8)
+            write_gif(paths[2], seed=2)
+            missing = os.path.join(directory, "missing.gif")
+            hashes = hash_files(paths + [missing, None])
+
+        self.assertLessEqual(bin(hashes[0] ^ hashes[1]).count("1"), 6)
+        self.assertGreater(bin(hashes[0] ^ hashes[2]).count("1"), 6)
+        self.assertListEqual(hashes[3:], [None, None])
+
+    def test_locate_gif(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "a.gif")
+            url = "https://example.com/a.gif"
+            for filename in (path, os.path.join(directory, cache_name(url))):
+                with open(filename, "w"):
+                    pass
+            self.assertEqual(locate_gif(path), path)
+            self.assertEqual(locate_gif("file://" + path), path)
+            self.assertEqual(locate_gif(url, directory), os.path.join(directory, cache_name(url)))
+            self.assertIsNone(locate_gif(url))
+            self.assertIsNone(locate_gif("https://example.com/b.gif", directory))
+
+    def test_dedupe(self):
+        with tempfile.TemporaryDirectory() as directory:
+            urls = ["https://a.example.com/cat.gif", "https://b.example.com/cat.gif",
+                    "https://a.example.com/dog.gif", "https://c.example.com/unknown.gif"]
+            write_gif(os.path.join(directory, cache_name(urls[0])), seed=1)
+            write_gif(os.path.join(directory, cache_name(urls[1])), seed=1, noise=4)
+            write_gif(os.path.join(directory, cache_name(urls[2])), seed=2)
+            store = GifStore(manifest_data="{},cat\n{},cute,weight=2\n{},dog\n{},mystery\n"
+                             .format(*urls))
+            self.assertListEqual(dedupe(store, directory, workers=2), [urls[:2]])
+
+        self.assertDictEqual({element.url: element.tags for element in store.elements},
+                             {urls[0]: {"cat", "cute"}, urls[2]: {"dog"}, urls[3]: {"mystery"}})
+
+    def test_main_journal(self):
+        """ Overwriting a manifest should replay and compact its journal, rather than losing it """
+        with tempfile.TemporaryDirectory() as directory:
+            manifest_loc = os.path.join(directory, "manifest.csv")
+            journal_loc = os.path.join(directory, "manifest.journal")
+            with open(manifest_loc, "w") as manifest_file:
+                manifest_file.write("url_a,cat\n")
+            with open(journal_loc, "w") as journal_file:
+                journal_file.write("+,url_b,dog\n")
+
+            with patch("sys.argv", ["dedupe", manifest_loc, "--workers", "1"]), \
+                    self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+                _main()
+            with patch("sys.argv", ["dedupe", manifest_loc, "--workers", "1",
+                                    "--journal", journal_loc]), redirect_stdout(io.StringIO()):
+                _main()
+
+            with open(manifest_loc, newline="") as manifest_file:
+                store = GifStore(manifest_data=manifest_file)
+            self.assertSetEqual({element.url for element in store.elements}, {"url_a", "url_b"})
+            self.assertEqual(os.path.getsize(journal_loc), 0)
@@ -0,0 +1,118 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``ApiDispatcher`` class.
+"""
+
+import random
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from slackclient import SlackClient
+
+from gif_bot.dispatcher import ApiDispatcher, PooledSlackRequest, install_connection_pool
+
+
+class Recorder:
+    """ Records API calls, with a random delay to shake out any ordering problems """
+    def __init__(self, max_delay=0.):
+        self.calls = []
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, method, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(random.uniform(0, self.max_delay))
+        with self.lock:
+            self.active -= 1
+            self.calls.append((method, kwargs))
+        if kwargs.get("fail"):
+            raise RuntimeError("failed")
+        return {"ok": True, "method": method}
+
+
+class TestApiDispatcher(unittest.TestCase):
+    def test_inline(self):
+        recorder = Recorder()
+        dispatcher = ApiDispatcher(recorder)
+        future = dispatcher.submit("chat.postMessage", "C1", channel="C1")
+        self.assertTrue(future.done())
+        self.assertEqual(future.result()["method"], "chat.postMessage")
+        with self.assertRaises(RuntimeError):
+            dispatcher.submit("chat.postMessage", "C1", fail=True)
+        self.assertEqual(dispatcher.metrics()["failed"], 1)
+
+    def test_per_key_ordering(self):
+        recorder = Recorder(max_delay=0.002)
+        dispatcher = ApiDispatcher(recorder, workers=4)
+        for i in range(50):
+            for channel in ("C1", "C2", "C3"):
+                dispatcher.submit("chat.postMessage", channel, channel=channel, index=i)
+        dispatcher.flush()
+
+        for channel in ("C1", "C2", "C3"):
+            indices = [kwargs["index"] for _, kwargs in recorder.calls
+                       if kwargs["channel"] == channel]
+            self.assertListEqual(indices, list(range(50)))
+        self.assertGreater(recorder.max_active, 1)
+        dispatcher.close()
+
+    def test_errors_and_metrics(self):
+        on_error = MagicMock()
+        dispatcher = ApiDispatcher(Recorder(), workers=2, on_error=on_error)
+        future = dispatcher.submit("reactions.add", "C1", fail=True)
+        dispatcher.submit("reactions.add", "C1")
+        dispatcher.flush()
+
+        self.assertIsInstance(future.exception(), RuntimeError)
+        on_error.assert_called_once()
+        metrics = dispatcher.metrics()
+        self.assertEqual(metrics["submitted"], 2)
+        self.assertEqual(metrics["completed"], 2)
+        self.assertEqual(metrics["failed"], 1)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertGreaterEqual(metrics["max_queue_depth"], 1)
+
+    def test_close(self):
+        recorder = Recorder(max_delay=0.001)
+        dispatcher = ApiDispatcher(recorder, workers=2)
+        for i in range(20):
+            dispatcher.submit("chat.postMessage", i)
+        dispatcher.close()
+        self.assertEqual(len(recorder.calls), 20)
+
+        # Once closed, calls are made immediately
+        self.assertTrue(dispatcher.submit("chat.postMessage", 0).done())
+
+    def test_install_connection_pool(self):
+        client = SlackClient("token")
+        self.assertTrue(install_connection_pool(client, 4))
+        self.assertIsInstance(client.server.api_requester, PooledSlackRequest)
+        self.assertFalse(install_connection_pool(MagicMock(), 4))
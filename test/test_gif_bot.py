@@ -25,10 +25,16 @@
 Tests for the ``GifBot`` class.
 """
 
+import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 
 from gif_bot.gif_bot import GifBot
+from gif_bot.snapshot import SnapshotStore
 
 api_collector = MagicMock()
 
@@ -50,6 +56,21 @@ def mock_client(_):
     return MagicMock(api_call=mock_api_call)
 
 
+def write_config(directory, extra_settings):
+    """ Writes a copy of the test config file with some extra settings """
+    with open("test.config") as config_file:
+        config = config_file.read().replace("test.manifest", os.path.abspath("test.manifest"))
+    config_loc = os.path.join(directory, "test.config")
+    with open(config_loc, "w") as config_file:
+        config_file.write(config + "\n" + extra_settings)
+    return config_loc
+
+
+class StringContaining(str):
+    def __eq__(self, other):
+        return self in other
+
+
 def Any(cls):
     class Any(cls):
         def __eq__(self, other):
@@ -119,6 +140,75 @@ class TestGifBot(unittest.TestCase):
         api_collector.assert_any_call("reactions.add", name="test_reaction",
                                       channel="test_channel", timestamp="test_ts")
 
+    def test_handle_trigger_burst(self, *args):
+        """ A burst of triggers in a channel should get one GIF, but a reaction each """
+        with tempfile.TemporaryDirectory() as directory:
+            bot = GifBot(write_config(directory, "trigger_window = 60\n"), MagicMock())
+        for time_stamp in ("ts_1", "ts_2", "ts_3"):
+            bot.handle_message({
+                "user": "test_user_id",
+                "text": "Something something test_trigger",
+                "channel": "test_channel",
+                "ts": time_stamp
+            })
+        posts = [call for call in api_collector.call_args_list if call[0][0] == "chat.postMessage"]
+        self.assertEqual(len(posts), 1)
+        for time_stamp in ("ts_1", "ts_2", "ts_3"):
+            api_collector.assert_any_call("reactions.add", name="test_reaction",
+                                          channel="test_channel", timestamp=time_stamp)
+
+    def test_handle_trigger_burst_error(self, *args):
+        """ If the burst's GIF can't be posted, the rest of the burst shouldn't wait for it """
+        with tempfile.TemporaryDirectory() as directory:
+            bot = GifBot(write_config(directory, "trigger_window = 60\n"), MagicMock())
+        with patch.object(bot, "post_gif", side_effect=GifBot.SlackApiError("failed")):
+            with self.assertRaises(GifBot.SlackApiError):
+                bot.handle_burst("test_channel", "ts_1")
+        started = time.monotonic()
+        bot.handle_burst("test_channel", "ts_2")
+        self.assertLess(time.monotonic() - started, 1.)
+        api_collector.assert_any_call("reactions.add", name="broken_heart",
+                                      channel="test_channel", timestamp="ts_2")
+
+    def test_channel_settings(self, *args):
+        """ Channels can have their own triggers, reactions and tag filters """
+        with tempfile.TemporaryDirectory() as directory:
+            bot = GifBot(write_config(directory, "[channels]\n"
+                                                 "    [[safe_channel]]\n"
+                                                 "        triggers = other_trigger\n"
+                                                 "        reactions = other_reaction\n"
+                                                 "        blocked_tags = tag_a1\n"), MagicMock())
+        self.assertTrue(bot.is_trigger("test_trigger", "test_channel"))
+        self.assertFalse(bot.is_trigger("test_trigger", "safe_channel"))
+
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "Something something other_trigger",
+            "channel": "safe_channel",
+            "ts": "test_ts"
+        })
+        api_collector.assert_any_call("chat.postMessage", text=StringContaining("url_b"),
+                                      channel="safe_channel", as_user=True)
+        api_collector.assert_any_call("reactions.add", name="other_reaction",
+                                      channel="safe_channel", timestamp="test_ts")
+
+        api_collector.reset_mock()
+        self.assertFalse(bot.post_gif("safe_channel", "tag_a2"))
+
+        # Counts and statuses only include the GIFs that can be posted in the channel
+        bot.handle_compare("safe_channel", ["tag_a2", "tag_b1"])
+        api_collector.assert_any_call("chat.postMessage", text=StringContaining("tag_a2 : 0\n"),
+                                      channel="safe_channel", as_user=True)
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "@test_bot_name status",
+            "channel": "safe_channel",
+            "ts": "test_ts"
+        })
+        status = api_collector.call_args[1]["text"]
+        self.assertTrue(status.startswith("We have 1 gifs"))
+        self.assertNotIn("tag_a", status)
+
     def test_handle_request_success(self, *args):
         """ The bot should post a gif and a happy reaction when they can fulfill a request """
 
@@ -150,6 +240,192 @@ class TestGifBot(unittest.TestCase):
         api_collector.assert_any_call("reactions.add", name="broken_heart",
                                       channel="test_channel", timestamp="test_ts")
 
+    def test_handle_request_query(self, *args):
+        """ Requests can combine tags, and malformed queries should be explained """
+
+        bot = GifBot("test.config", MagicMock())
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "@test_bot_name request tag_a1|tag_b1-tag_b2",
+            "channel": "test_channel",
+            "ts": "test_ts"
+        })
+        api_collector.assert_any_call("chat.postMessage", text=Any(str),
+                                      channel="test_channel", as_user=True)
+        api_collector.assert_any_call("reactions.add", name="test_reaction",
+                                      channel="test_channel", timestamp="test_ts")
+
+        api_collector.reset_mock()
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "@test_bot_name request tag_a1+",
+            "channel": "test_channel",
+            "ts": "test_ts"
+        })
+        api_collector.assert_any_call("chat.postMessage",
+                                      text="Sorry, I don't understand `tag_a1+`: Expected a tag "
+                                           "at the end :weary:",
+                                      channel="test_channel", as_user=True)
+        api_collector.assert_any_call("reactions.add", name="broken_heart",
+                                      channel="test_channel", timestamp="test_ts")
+
+    def test_help(self, *args):
+        """ The help text should list the commands available to whoever asks for it """
+        bot = GifBot("test.config", MagicMock())
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "@test_bot_name HELP",
+            "channel": "test_channel",
+            "ts": "test_ts"
+        })
+        text = api_collector.call_args[1]["text"]
+        self.assertTrue(text.startswith("Hi! I know the following commands:\n"))
+        self.assertIn("`request cat` : Request a cat GIF", text)
+        self.assertNotIn("`save`", text)
+
+        api_collector.reset_mock()
+        bot.handle_message({
+            "user": "test_owner_id",
+            "text": "unknown command",
+            "channel": "Dtest_channel",
+            "ts": "test_ts"
+        })
+        text = api_collector.call_args[1]["text"]
+        self.assertTrue(text.startswith("Sorry, I don't understand that command.\n"))
+        self.assertIn("`save` : Save any changes to the manifest", text)
+
+    def test_greeting_templates(self, *args):
+        """ Greeting templates should be checked when the bot starts, and can post blocks """
+        with tempfile.TemporaryDirectory() as directory:
+            config_loc = write_config(directory, 'greeting_templates = "{user}, {url}"\n')
+            with self.assertRaises(GifBot.BotConfigError):
+                GifBot(config_loc, MagicMock())
+
+            config_loc = write_config(directory, 'greeting_templates = "{url} for you, {noun}"\n'
+                                                 'gif_blocks = true\n')
+            bot = GifBot(config_loc, MagicMock())
+        self.assertEqual(len(bot.templates), 6)
+        self.assertTrue(bot.post_gif("test_channel", "tag_a1"))
+        kwargs = api_collector.call_args[1]
+        self.assertIn("blocks", kwargs)
+        self.assertIn('"alt_text": "tag_a1 GIF"', kwargs["blocks"])
+
+    def test_link_check(self, *args):
+        """ GIFs whose links are found to be broken shouldn't be posted """
+        with tempfile.TemporaryDirectory() as directory:
+            config_loc = write_config(directory, "link_check_interval = 3600\n"
+                                                 "link_cache_loc = {}\n".format(
+                                                     os.path.join(directory, "links.json")))
+            bot = GifBot(config_loc, MagicMock())
+            for _ in range(100):
+                if bot.link_checker.last_report is not None:
+                    break
+                time.sleep(0.05)
+            bot.stop()
+            self.assertTrue(os.path.exists(os.path.join(directory, "links.json")))
+
+        # The test manifest's URLs aren't real, so they're all broken
+        self.assertIs(bot.store.unavailable, bot.link_health.dead)
+        self.assertEqual(len(bot.link_health.dead), 2)
+        self.assertFalse(bot.post_gif("test_channel", "tag_a1"))
+
+        # Statuses are forgotten once their GIFs are removed, or are missing from a reload
+        bot.handle_message({
+            "user": "test_owner_id",
+            "text": "remove url_a",
+            "channel": "Dtest_channel",
+            "ts": "test_ts"
+        })
+        self.assertSetEqual(bot.link_health.dead, {"url_b"})
+        bot.link_health.record("url_gone", False)
+        with bot.store_lock:
+            bot._swap_reloaded(bot.load_store())  # pylint: disable=protected-access
+        self.assertSetEqual(set(bot.link_health.statuses), {"url_b"})
+        self.assertSetEqual(bot.link_health.dead, {"url_b"})
+
+    def test_rate_limit_policy(self, *args):
+        """ Rate limits should only be waited for when API calls are made in the background """
+        bot = GifBot("test.config", MagicMock())
+        self.assertEqual(bot.rate_limit_policy, "drop")
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(GifBot.BotConfigError):
+                GifBot(write_config(directory, "rate_limit_policy = wait\n"), MagicMock())
+            bot = GifBot(write_config(directory, "api_workers = 1\n"), MagicMock())
+            self.assertEqual(bot.rate_limit_policy, "wait")
+            bot.stop()
+
+    def test_rate_limited_triggers(self, *args):
+        """ Only GIFs posted for triggers should be dropped when rate limited, never replies """
+        bot = GifBot("test.config", MagicMock())
+        clock = [0.]
+        bot.rate_limiter._clock = lambda: clock[0]  # pylint: disable=protected-access
+        bot.rate_limiter._sleep = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+        for i in range(6):
+            bot.handle_message({
+                "user": "test_user_id",
+                "text": "Something something test_trigger",
+                "channel": "test_channel",
+                "ts": "ts_{}".format(i)
+            })
+        bot.handle_message({
+            "user": "test_user_id",
+            "text": "@test_bot_name help",
+            "channel": "test_channel",
+            "ts": "ts_help"
+        })
+
+        posts = [call[1]["text"] for call in api_collector.call_args_list
+                 if call[0][0] == "chat.postMessage"]
+        self.assertEqual(len(posts), 4)
+        self.assertTrue(posts[-1].startswith("Hi! I know the following commands:\n"))
+        reactions = [call[1]["name"] for call in api_collector.call_args_list
+                     if call[0][0] == "reactions.add"]
+        self.assertListEqual(reactions, ["test_reaction"] * 3 + ["broken_heart"] * 3)
+        self.assertEqual(bot.log.warning.call_count, 3)
+
+    def test_reactions_after_gifs(self, *args):
+        """ A trigger's reaction shouldn't be added before its GIF has been posted """
+        with tempfile.TemporaryDirectory() as directory:
+            bot = GifBot(write_config(directory, "api_workers = 4\n"), MagicMock())
+        calls = []
+
+        def record(method, *args, **kwargs):
+            if method == "chat.postMessage":
+                time.sleep(0.01)
+            calls.append(method)
+
+        api_collector.side_effect = record
+        try:
+            for i in range(5):
+                bot.handle_message({
+                    "user": "test_user_id",
+                    "text": "Something something test_trigger",
+                    "channel": "test_channel",
+                    "ts": "ts_{}".format(i)
+                })
+            bot.dispatcher.flush()
+        finally:
+            api_collector.side_effect = None
+        self.assertListEqual(calls, ["chat.postMessage", "reactions.add"] * 5)
+        bot.stop()
+
+    def test_metrics_port_in_use(self, *args):
+        """ A metrics port that can't be listened on should be a configuration error """
+        with socket.socket() as sock, tempfile.TemporaryDirectory() as directory:
+            sock.bind(("127.0.0.1", 0))
+            sock.listen()
+            config_loc = write_config(directory, "metrics_port = {}\n".format(
+                sock.getsockname()[1]))
+            with self.assertRaises(GifBot.BotConfigError):
+                GifBot(config_loc, MagicMock())
+
+    def test_metrics_disabled(self, *args):
+        """ Without a metrics port, nothing should be instrumented """
+        bot = GifBot("test.config", MagicMock())
+        self.assertIsNone(bot.metrics)
+        self.assertNotIn("handle_message", vars(bot))
+        self.assertNotIn("choose_gif", vars(bot))
+
     def test_admin(self, *args):
         """ Test that basic admin commands work """
         bot = GifBot("test.config", MagicMock())
@@ -177,6 +453,18 @@ class TestGifBot(unittest.TestCase):
         self.assertNotIn("tag", bot.store.tags)
         self.assertEqual(len(bot.store.elements), 2)
 
+        bot.handle_message({
+            "user": "test_owner_id",
+            "text": "add url tag weight=-1",
+            "channel": "Dtest_channel",
+            "ts": "test_ts"
+        })
+
+        self.assertEqual(len(bot.store.elements), 2)
+        api_collector.assert_any_call("chat.postMessage", text="Sorry, `weight=-1` isn't a valid "
+                                      "weight (expected a number of at least 0) :weary:",
+                                      channel="Dtest_channel", as_user=True)
+
     def test_admin_access(self, *args):
         """ Test that basic admin commands work only for the owner """
         bot = GifBot("test.config", MagicMock())
@@ -193,3 +481,94 @@ class TestGifBot(unittest.TestCase):
 
         self.assertNotIn("tag", bot.store.tags)
         self.assertEqual(len(bot.store.elements), 2)
+
+    def test_admin_reload(self, *args):
+        """ Reloading the manifest should happen in the background """
+        bot = GifBot("test.config", MagicMock())
+        bot.store.add_gif("unsaved_url", {"tag"})
+
+        bot.handle_message({
+            "user": "test_owner_id",
+            "text": "reload",
+            "channel": "Dtest_channel",
+            "ts": "test_ts"
+        })
+        bot.reloader.close()
+
+        self.assertNotIn("tag", bot.store.tags)
+        self.assertEqual(len(bot.store.elements), 2)
+        api_collector.assert_any_call("chat.postMessage", text="Reloading the manifest...",
+                                      channel="Dtest_channel", as_user=True)
+        api_collector.assert_any_call("chat.postMessage", text="Manifest reloaded",
+                                      channel="Dtest_channel", as_user=True)
+
+    def test_changes_during_reload(self, *args):
+        """ Changes made while the manifest is reloading shouldn't wait, or be lost """
+        with tempfile.TemporaryDirectory() as directory:
+            config_loc = write_config(directory, "journal_loc = {}\n".format(
+                os.path.join(directory, "manifest.journal")))
+            bot = GifBot(config_loc, MagicMock())
+            loading, release = threading.Event(), threading.Event()
+
+            def slow_load():
+                store = bot.load_store()
+                loading.set()
+                release.wait(5)
+                return store
+
+            bot.reloader._load = slow_load  # pylint: disable=protected-access
+            future = bot.reloader.reload()
+            self.assertTrue(loading.wait(5))
+            bot.handle_message({
+                "user": "test_owner_id",
+                "text": "add url tag",
+                "channel": "Dtest_channel",
+                "ts": "test_ts"
+            })
+            self.assertIn("tag", bot.store.tags)
+
+            release.set()
+            self.assertIs(future.result(5), bot.store)
+            self.assertIn("tag", bot.store.tags)
+            self.assertEqual(len(bot.store.elements), 3)
+            bot.stop()
+
+    def test_snapshot(self, *args):
+        """ An up-to-date snapshot should be loaded instead of the manifest, until it is changed """
+        bot = GifBot("test.config", MagicMock())
+        with tempfile.TemporaryDirectory() as directory:
+            bot.snapshot_loc = os.path.join(directory, "manifest.snap")
+            self.assertNotIsInstance(bot.load_store(), SnapshotStore)
+            snapshot = bot.store = bot.load_store()
+            self.assertIsInstance(bot.store, SnapshotStore)
+            self.assertEqual(len(bot.store.elements), 2)
+
+            bot.handle_message({
+                "user": "test_owner_id",
+                "text": "add url tag",
+                "channel": "Dtest_channel",
+                "ts": "test_ts"
+            })
+
+            self.assertNotIsInstance(bot.store, SnapshotStore)
+            self.assertIn("tag", bot.store.tags)
+            self.assertEqual(len(bot.store.elements), 3)
+            self.assertTrue(snapshot._mmap.closed)  # pylint: disable=protected-access
+
+    def test_snapshot_readers(self, *args):
+        """ A replaced snapshot should only be closed once nothing is reading it """
+        bot = GifBot("test.config", MagicMock())
+        with tempfile.TemporaryDirectory() as directory:
+            bot.snapshot_loc = os.path.join(directory, "manifest.snap")
+            bot.load_store()
+            snapshot = bot.store = bot.load_store()
+
+            with bot.reading_store() as store:
+                swap = threading.Thread(target=bot._swap_store, args=(bot.load_store(),))
+                swap.start()
+                swap.join(0.1)
+                self.assertTrue(swap.is_alive())
+                self.assertEqual(len(store.elements), 2)
+            swap.join()
+            self.assertIsNot(bot.store, snapshot)
+            self.assertTrue(snapshot._mmap.closed)  # pylint: disable=protected-access
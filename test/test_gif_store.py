@@ -24,16 +24,24 @@
 Tests for the ``GifStore`` class.
 """
 
+import os
+import tempfile
+import threading
 import unittest
+from unittest.mock import patch
 
-from gif_bot.gif_store import GifStore
+from gif_bot.channels import TagFilter
+from gif_bot.gif_store import GifStore, read_manifest
 
 
 class TestGifStore(unittest.TestCase):
+    compact = False
+
     def setUp(self):
         self.adjectives = ["TestAdjective1", "TestAdjective2"]
         self.data = "url_a,tag_a1,tag_a2\nurl_b,tag_b1,tag_b2\nurl_bb,tag_b1,tag_b3\n"
-        self.store = GifStore(adjectives=self.adjectives, manifest_data=self.data)
+        self.store = GifStore(adjectives=self.adjectives, manifest_data=self.data,
+                              compact=self.compact)
 
     def test_add_new_gif(self):
         self.assertEqual(len(self.store.elements), 3)
@@ -85,3 +93,188 @@ class TestGifStore(unittest.TestCase):
 
     def test_get_gif_failure(self):
         self.assertIsNone(self.store.get_gif("tag_d1"))
+
+    def test_get_count_multiple_tags(self):
+        self.assertEqual(self.store.get_count("tag_b1+tag_b3"), 1)
+        self.assertEqual(self.store.get_count("tag_a1+tag_b1"), 0)
+
+    def test_get_gif_multiple_tags(self):
+        self.assertEqual(self.store.get_gif("tag_b1+tag_b3"), "url_bb")
+        self.assertIsNone(self.store.get_gif("tag_a1+tag_b1"))
+
+    def test_tag_counts_after_adding_tags(self):
+        self.store.add_gif("url_a", {"tag_b1"})
+        self.assertEqual(self.store.tags["tag_b1"], 3)
+        self.assertEqual(self.store.get_gif("tag_a1+tag_b1"), "url_a")
+
+    def test_remove_missing_gif(self):
+        self.store.remove_gif("url_z")
+        self.assertEqual(len(self.store.elements), 3)
+
+    def test_readd_removed_gif(self):
+        self.store.remove_gif("url_a")
+        self.store.add_gif("url_a", {"tag_a3"})
+
+        self.assertEqual(len(self.store.elements), 3)
+        self.assertNotIn("tag_a1", self.store.tags)
+        self.assertEqual(self.store.get_gif("tag_a3"), "url_a")
+
+    def test_compaction(self):
+        for i in range(200):
+            self.store.add_gif("url_{}".format(i), {"tag_many", "tag_{}".format(i % 2)})
+        for i in range(190):
+            self.store.remove_gif("url_{}".format(i))
+
+        self.assertLess(len(self.store.storage), 203)
+        self.assertEqual(len(self.store.elements), 13)
+        self.assertEqual(self.store.get_count("tag_many"), 10)
+        self.assertEqual(self.store.get_count("tag_many+tag_1"), 5)
+        self.assertSetEqual({e.url for e in self.store.elements},
+                            {"url_a", "url_b", "url_bb"} |
+                            {"url_{}".format(i) for i in range(190, 200)})
+        for _ in range(20):
+            self.assertIn(self.store.get_gif("tag_many+tag_0"),
+                          {"url_190", "url_192", "url_194", "url_196", "url_198"})
+
+    def test_concurrent_changes(self):
+        """ GIFs should be chosen safely while other threads add, remove and compact them """
+        errors = []
+
+        def _change(offset):
+            try:
+                for i in range(500):
+                    url = "url_{}_{}".format(offset, i)
+                    self.store.add_gif(url, {"tag_many", "weight=2"})
+                    self.store.remove_gif(url)
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        def _choose():
+            try:
+                for _ in range(2000):
+                    url = self.store.get_gif("tag_many|tag_a1")
+                    self.assertTrue(url == "url_a" or url.startswith("url_"))
+                    self.store.get_count("tag_many")
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        threads = [threading.Thread(target=_change, args=(offset,)) for offset in range(4)] + \
+            [threading.Thread(target=_choose) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.store.get_count("tag_many"), 0)
+        self.assertEqual({e.url for e in self.store.elements}, {"url_a", "url_b", "url_bb"})
+
+    def test_get_info(self):
+        info = self.store.get_info(max_tags=2).split("\n")
+        self.assertEqual(info[0], "We have 3 gifs, including...")
+        self.assertRegex(info[1], r"^  2 TestAdjective\d tag_b1 gifs!$")
+        self.assertRegex(info[2], r"^  1 TestAdjective\d tag_\w\d gif!$")
+        self.assertEqual(info[3], "... and many more!")
+        self.assertEqual(len(self.store.get_info(max_tags=5).split("\n")), 6)
+
+        self.store.add_gif("url_c", {"tag_a1", "tag_c1"})
+        self.store.add_gif("url_d", {"tag_a1"})
+        info = self.store.get_info(max_tags=0).split("\n")
+        self.assertEqual(len(info), 7)
+        self.assertRegex(info[1], r"^  3 TestAdjective\d tag_a1 gifs!$")
+
+    def test_get_info_restricted(self):
+        """ Restricted statuses should only describe the GIFs that are allowed """
+        restrict = TagFilter(blocked=["tag_b2"]).query
+        info = self.store.get_info(max_tags=1, restrict=restrict).split("\n")
+        self.assertEqual(info[0], "We have 2 gifs, including...")
+        self.assertRegex(info[1], r"^  1 TestAdjective\d tag_\w\d gif!$")
+        self.assertEqual(info[2], "... and many more!")
+
+        info = self.store.get_info(max_tags=0, restrict=restrict)
+        self.assertEqual(len(info.split("\n")), 5)
+        self.assertNotIn("tag_b2", info)
+
+    def test_load_from_iterable(self):
+        lines = (line for line in ["url_c,tag_c1", "url_d", "url_e,tag_c1,tag_e1"])
+        store = GifStore(manifest_data=lines, compact=self.compact)
+        self.assertEqual(len(store.elements), 2)
+        self.assertEqual(store.tags["tag_c1"], 2)
+
+    def test_csv_quoting(self):
+        pairs = list(read_manifest(['"https://example.com/a,b.gif",tag_1,"tag, 2"', "",
+                                    "url_c,tag_c1\r\n"]))
+        self.assertListEqual(pairs, [("https://example.com/a,b.gif", {"tag_1", "tag, 2"}),
+                                     ("url_c", {"tag_c1"})])
+
+    def test_save_manifest(self):
+        self.store.add_gif("https://example.com/a,b.gif", {"tag, 1"})
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "manifest.csv")
+            self.store.save_manifest(filename)
+            with open(filename, newline="") as manifest_file:
+                store = GifStore(manifest_data=manifest_file, compact=self.compact)
+
+        self.assertSetEqual({(e.url, frozenset(e.tags)) for e in store.elements},
+                            {(e.url, frozenset(e.tags)) for e in self.store.elements})
+
+    def test_merge_gifs(self):
+        """ Merging copies of a GIF should keep one copy, with all of their tags """
+        self.store.merge_gifs("url_b", ["url_bb", "url_missing", "url_b"])
+        elements = {e.url: e.tags for e in self.store.elements}
+        self.assertDictEqual(elements, {"url_a": {"tag_a1", "tag_a2"},
+                                        "url_b": {"tag_b1", "tag_b2", "tag_b3"}})
+        self.assertEqual(self.store.get_count("tag_b3"), 1)
+
+    def test_unavailable(self):
+        """ Broken GIFs should never be chosen, even when they're the only matches """
+        store = GifStore(manifest_data="url_a,tag\nurl_b,tag\nurl_c,other\n",
+                         compact=self.compact)
+        store.unavailable = {"url_a", "url_c"}
+        for _ in range(20):
+            self.assertEqual(store.get_gif("tag"), "url_b")
+            self.assertEqual(store.get_gif("tag", exclude={"url_b"}), "url_b")
+        self.assertIsNone(store.get_gif("other"))
+        self.assertEqual(store.get_count("other"), 1)
+
+
+class TestCompactGifStore(TestGifStore):
+    """ Runs all of the ``GifStore`` tests against the compact storage backend """
+    compact = True
+
+    @patch("gif_bot.storage.REPACK_MIN_STALE", 8)
+    def test_stale_tags(self):
+        """ Tags rewritten by adding to GIFs should be repacked, rather than growing forever """
+        storage = self.store.storage
+        for i in range(50):
+            self.store.add_gif("url_a", {"tag_{}".format(i)})
+            self.store.add_gif("url_b", {"tag_{}".format(i)})
+        tag_ids = storage._tag_ids  # pylint: disable=protected-access
+        self.assertLessEqual(storage.stale * 2, len(tag_ids))
+        self.assertLess(len(tag_ids), 3 * 55)
+        self.assertEqual(len(self.store.storage.tags(0)), 52)
+        self.assertSetEqual(self.store.storage.tags(2), {"tag_b1", "tag_b3"})
+        self.assertEqual(self.store.get_count("tag_49"), 2)
+
+    def test_string_table(self):
+        """ Tags that were only used by removed GIFs should be dropped from the string table """
+        for i in range(100):
+            self.store.add_gif("url_{}".format(i), {"tag_many", "tag_only_{}".format(i)})
+        for i in range(100):
+            self.store.remove_gif("url_{}".format(i))
+        self.store.compact()
+
+        self.assertEqual(len(self.store.storage.strings), 5)
+        self.assertEqual(self.store.get_count("tag_b1"), 2)
+        self.assertEqual(self.store.get_count("tag_many"), 0)
+        elements = {e.url: e.tags for e in self.store.elements}
+        self.assertDictEqual(elements, {"url_a": {"tag_a1", "tag_a2"},
+                                        "url_b": {"tag_b1", "tag_b2"},
+                                        "url_bb": {"tag_b1", "tag_b3"}})
+
+    def test_elements(self):
+        self.store.add_gif("url_a", {"tag_a3"})
+        elements = {e.url: e.tags for e in self.store.elements}
+        self.assertDictEqual(elements, {"url_a": {"tag_a1", "tag_a2", "tag_a3"},
+                                        "url_b": {"tag_b1", "tag_b2"},
+                                        "url_bb": {"tag_b1", "tag_b3"}})
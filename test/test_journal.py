@@ -0,0 +1,131 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``Journal`` class.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from gif_bot.gif_store import GifStore
+from gif_bot.journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifest_loc = os.path.join(self.directory.name, "manifest.csv")
+        self.journal_loc = os.path.join(self.directory.name, "manifest.journal")
+        with open(self.manifest_loc, "w") as manifest_file:
+            manifest_file.write("url_a,tag_a1,tag_a2\nurl_b,tag_b1\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self):
+        with open(self.manifest_loc, newline="") as manifest_file:
+            store = GifStore(manifest_data=manifest_file)
+        journal = Journal(self.journal_loc, self.manifest_loc)
+        store.attach_journal(journal)
+        return store, journal
+
+    @staticmethod
+    def contents(store):
+        return {e.url: e.tags for e in store.elements}
+
+    def test_replay(self):
+        store, journal = self.load()
+        store.add_gif("url_c", {"tag_c1"})
+        store.add_gif("url_a", {"tag_a3"})
+        store.remove_gif("url_b")
+        store.add_gif("url_a", {"tag_a1"})  # Not a change, so not recorded
+        journal.close()
+        self.assertEqual(journal.records, 3)
+
+        restored, _ = self.load()
+        self.assertDictEqual(self.contents(restored), self.contents(store))
+        self.assertDictEqual(self.contents(restored), {"url_a": {"tag_a1", "tag_a2", "tag_a3"},
+                                                       "url_c": {"tag_c1"}})
+
+    def test_partial_record_ignored(self):
+        store, journal = self.load()
+        store.add_gif("url_c", {"tag_c1"})
+        journal.close()
+        with open(self.journal_loc, "a") as journal_file:
+            journal_file.write("+,url_d,tag_")
+
+        restored, _ = self.load()
+        self.assertNotIn("url_d", self.contents(restored))
+        self.assertIn("url_c", self.contents(restored))
+
+    def test_compact(self):
+        store, journal = self.load()
+        store.add_gif("url_c", {"tag_c1"})
+        store.remove_gif("url_a")
+        journal.compact(store)
+
+        self.assertEqual(os.path.getsize(self.journal_loc), 0)
+        self.assertListEqual(sorted(os.listdir(self.directory.name)),
+                             ["manifest.csv", "manifest.journal"])
+        restored, _ = self.load()
+        self.assertDictEqual(self.contents(restored), {"url_b": {"tag_b1"}, "url_c": {"tag_c1"}})
+
+    def test_replay_is_idempotent(self):
+        """ Replaying a journal over a manifest that already contains its changes is harmless """
+        store, journal = self.load()
+        store.remove_gif("url_a")
+        store.add_gif("url_a", {"tag_a3"})
+        store.add_gif("url_c", {"tag_c1"})
+        store.save_manifest(self.manifest_loc)
+        journal.close()
+
+        restored, _ = self.load()
+        self.assertDictEqual(self.contents(restored), self.contents(store))
+
+    @patch("gif_bot.journal.COMPACTION_MIN_RECORDS", 4)
+    def test_automatic_compaction(self):
+        store, journal = self.load()
+        for i in range(4):
+            store.add_gif("url_{}".format(i), {"tag"})
+        self.assertEqual(journal.records, 0)
+        with open(self.manifest_loc) as manifest_file:
+            self.assertEqual(len(manifest_file.readlines()), 6)
+
+    @patch("gif_bot.journal.COMPACTION_MIN_RECORDS", 4)
+    def test_no_compaction_while_loading(self):
+        """ The journal shouldn't be compacted while another store is being loaded from it """
+        store, journal = self.load()
+        with journal.loading():
+            for i in range(4):
+                store.add_gif("url_{}".format(i), {"tag"})
+            journal.compact(store)
+            self.assertEqual(journal.records, 4)
+
+        # A store loaded meanwhile sees every change, and compaction resumes afterwards
+        restored, _ = self.load()
+        self.assertDictEqual(self.contents(restored), self.contents(store))
+        store.add_gif("url_4", {"tag"})
+        self.assertEqual(journal.records, 0)
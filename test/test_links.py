@@ -0,0 +1,131 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``LinkChecker`` and ``LinkHealth`` classes.
+"""
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_http import FakeGifServer
+from gif_bot.links import LinkChecker, LinkHealth
+
+
+class TestLinkChecker(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeGifServer().start()
+        self.now = 1000.
+        self.health = LinkHealth(ttl=100., dead_ttl=10., clock=lambda: self.now)
+        self.checker = LinkChecker(self.health, concurrency=4)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_check(self):
+        self.server.dead.add("/dead.gif")
+        urls = [self.server.url(path) for path in ("/a.gif", "/dead.gif", "/nohead/b.gif")]
+        report = self.checker.check(urls)
+
+        self.assertEqual(report.checked, 3)
+        self.assertEqual(report.dead, 1)
+        self.assertGreater(report.urls_per_second, 0)
+        self.assertSetEqual(self.health.dead, {self.server.url("/dead.gif")})
+        # Only the server that doesn't allow HEAD requests should have been asked for a GIF
+        self.assertEqual(self.server.counts["GET"], 1)
+
+    def test_unreachable(self):
+        """ Invalid URLs are broken, but hosts that can't be reached may only be down for now """
+        report = self.checker.check(["http://127.0.0.1:1/a.gif", "not a url"])
+        self.assertEqual((report.dead, report.failed), (1, 1))
+        self.assertSetEqual(self.health.dead, {"not a url"})
+
+    def test_transient_failures(self):
+        """ Server errors should leave links as they were """
+        url = self.server.url("/a.gif")
+        self.checker.check([url])
+        self.server.failing.add("/a.gif")
+        self.now += 100.
+        report = self.checker.check([url])
+        self.assertEqual(report.failed, 1)
+        self.assertSetEqual(self.health.dead, set())
+        self.assertTrue(self.health.statuses[url].alive)
+
+    def test_outage(self):
+        """ No links should be marked broken in a round where most of the checks fail """
+        self.server.dead.update("/{}.gif".format(i) for i in range(2))
+        self.server.failing.update("/{}.gif".format(i) for i in range(2, 12))
+        urls = [self.server.url("/{}.gif".format(i)) for i in range(16)]
+        report = self.checker.check(urls)
+        self.assertEqual((report.checked, report.dead, report.failed), (16, 2, 10))
+        self.assertSetEqual(self.health.dead, set())
+
+        # Once the hosts recover, the broken links are found
+        self.server.failing.clear()
+        self.assertEqual(self.checker.check(urls).checked, 12)
+        self.assertSetEqual(self.health.dead, set(urls[:2]))
+
+    def test_connection_reuse(self):
+        urls = [self.server.url("/{}.gif".format(i)) for i in range(100)]
+        self.assertEqual(self.checker.check(urls).checked, 100)
+        self.assertLessEqual(self.server.counts["connections"], 4)
+
+    def test_recheck(self):
+        """ Links should only be checked again once they're due, and can recover """
+        alive, dead = self.server.url("/alive.gif"), self.server.url("/dead.gif")
+        self.server.dead.add("/dead.gif")
+        self.checker.check([alive, dead])
+        self.assertEqual(self.checker.check([alive, dead]).checked, 0)
+
+        self.server.dead.clear()
+        self.now += 10.
+        self.assertEqual(self.checker.check([alive, dead]).checked, 1)
+        self.assertSetEqual(self.health.dead, set())
+
+        # Unchanged GIFs should be confirmed by their ETag
+        self.now += 100.
+        self.assertEqual(self.checker.check([alive, dead]).checked, 2)
+        self.assertEqual(self.server.counts["not_modified"], 2)
+
+    def test_prune(self):
+        """ Statuses should be forgotten once their URLs aren't in the store """
+        for url in ("url_a", "url_b", "url_c"):
+            self.health.record(url, url != "url_a")
+        self.health.forget("url_c")
+        self.assertSetEqual(set(self.health.statuses), {"url_a", "url_b"})
+        self.assertEqual(self.health.prune({"url_b", "url_d"}), 1)
+        self.assertSetEqual(set(self.health.statuses), {"url_b"})
+        self.assertSetEqual(self.health.dead, set())
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_loc = os.path.join(directory, "links.json")
+            self.server.dead.add("/dead.gif")
+            health = LinkHealth(cache_loc, clock=lambda: self.now)
+            LinkChecker(health).check([self.server.url("/a.gif"), self.server.url("/dead.gif")])
+            health.save()
+
+            cached = LinkHealth(cache_loc, clock=lambda: self.now)
+            self.assertSetEqual(cached.dead, {self.server.url("/dead.gif")})
+            self.assertDictEqual(cached.statuses, health.statuses)
+            self.assertListEqual(list(cached.due([self.server.url("/a.gif")])), [])
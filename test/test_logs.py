@@ -0,0 +1,117 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the logging helpers.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from logging import INFO, WARNING, FileHandler, LogRecord, getLogger
+
+from gif_bot.gif_bot import GifBot
+from gif_bot.logs import BackgroundHandler, CorrelationFilter, InfoSampler, JsonFormatter, \
+    correlation, current_correlation_id
+
+
+def make_record(message, level=INFO):
+    return LogRecord("test", level, __file__, 1, message, (), None, "test_function")
+
+
+class TestLogs(unittest.TestCase):
+    def test_correlation(self):
+        """ Records should be stamped with the correlation ID of the surrounding context """
+        stamp = CorrelationFilter()
+        with correlation("C1:123.456"):
+            self.assertEqual(current_correlation_id(), "C1:123.456")
+            record = make_record("inside")
+            stamp.filter(record)
+        self.assertIsNone(current_correlation_id())
+
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["correlation_id"], "C1:123.456")
+        self.assertEqual(entry["message"], "inside")
+        self.assertEqual(entry["function"], "test_function")
+        self.assertEqual(entry["level"], "INFO")
+
+    def test_sampling(self):
+        """ INFO records should be sampled by request, and anything more severe always kept """
+        sampler = InfoSampler(0.25)
+        self.assertTrue(all(sampler.filter(make_record("warning", WARNING)) for _ in range(100)))
+
+        kept = 0
+        for request in range(1000):
+            with correlation("C1:{}".format(request)):
+                first = sampler.filter(make_record("first"))
+                self.assertEqual(sampler.filter(make_record("second")), first)
+                kept += first
+        self.assertLess(abs(kept - 250), 60)
+        self.assertFalse(InfoSampler(0.).filter(make_record("none")))
+
+    def test_background(self):
+        """ Records should be written by the background thread, in order """
+        with tempfile.TemporaryDirectory() as directory:
+            log_loc = os.path.join(directory, "test.log")
+            log = getLogger("test_background")
+            handler = BackgroundHandler(FileHandler(log_loc))
+            log.addHandler(handler)
+            thread = handler.listener._thread  # pylint: disable=protected-access
+            try:
+                for i in range(100):
+                    log.warning("record %d", i)
+                handler.flush()
+                with open(log_loc) as log_file:
+                    self.assertEqual(log_file.read().splitlines(),
+                                     ["record {}".format(i) for i in range(100)])
+                # Flushing shouldn't stop the listener, so other threads can keep logging
+                self.assertIs(handler.listener._thread, thread)  # pylint: disable=protected-access
+            finally:
+                log.removeHandler(handler)
+                handler.close()
+
+    def test_init_log(self):
+        """ Initialising the same log twice should only add one handler """
+        with tempfile.TemporaryDirectory() as directory:
+            log_loc = os.path.join(directory, "test.log")
+            log = GifBot._init_log(log_loc, background=True, structured=True)
+            try:
+                GifBot._init_log(log_loc, background=True, structured=True)
+                handlers = [handler for handler in log.handlers
+                            if getattr(handler, "log_key", (None,))[0] == log_loc]
+                self.assertEqual(len(handlers), 1)
+
+                # Changing the settings replaces the handler
+                GifBot._init_log(log_loc)
+                handlers = [handler for handler in log.handlers
+                            if getattr(handler, "log_key", (None,))[0] == log_loc]
+                self.assertEqual(len(handlers), 1)
+                self.assertNotIsInstance(handlers[0], BackgroundHandler)
+            finally:
+                for handler in handlers:
+                    log.removeHandler(handler)
+                    handler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
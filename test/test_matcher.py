@@ -0,0 +1,84 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``TriggerMatcher`` class.
+"""
+
+import unittest
+
+from gif_bot.matcher import TriggerMatcher
+
+
+class TestTriggerMatcher(unittest.TestCase):
+    def setUp(self):
+        self.triggers = ["help", "halp", "Helpful", "assistance", ":sos:", "a.b"]
+
+    def test_substring_matches(self):
+        matcher = TriggerMatcher(self.triggers)
+        self.assertTrue(matcher.matches("Please HELP me"))
+        self.assertTrue(matcher.matches("unhelpful"))
+        self.assertTrue(matcher.matches("halp"))
+        self.assertTrue(matcher.matches("x:sos:x"))
+        self.assertTrue(matcher.matches("a.b"))
+        self.assertFalse(matcher.matches("axb"))
+        self.assertFalse(matcher.matches("hel p"))
+        self.assertFalse(matcher.matches(""))
+
+    def test_word_boundary_matches(self):
+        matcher = TriggerMatcher(self.triggers, word_boundary=True)
+        self.assertTrue(matcher.matches("help!"))
+        self.assertTrue(matcher.matches("very helpful"))
+        self.assertTrue(matcher.matches("send an :sos: now"))
+        self.assertFalse(matcher.matches("unhelpful"))
+        self.assertFalse(matcher.matches("helper"))
+
+    def test_find(self):
+        matcher = TriggerMatcher(self.triggers)
+        self.assertEqual(matcher.find("I need ASSISTANCE"), "assistance")
+        self.assertEqual(matcher.find("so helpful"), "helpful")
+        self.assertIsNone(matcher.find("nothing to see here"))
+
+    def test_agrees_with_substring_search(self):
+        matcher = TriggerMatcher(self.triggers)
+        messages = ["", "h", "he", "hel", "help", "halpelp", "assist", "a.", ".b", "sos", ":sos"]
+        for message in messages:
+            self.assertEqual(matcher.matches(message),
+                             any(t.lower() in message.lower() for t in self.triggers), message)
+
+    def test_no_triggers(self):
+        matcher = TriggerMatcher([])
+        self.assertFalse(matcher.matches("help"))
+        self.assertIsNone(matcher.find("help"))
+
+    def test_large_trigger_set(self):
+        """ Large trigger sets are matched with the compiled regex, not substring searches """
+        triggers = ["trigger{}".format(i) for i in range(200)] + self.triggers
+        matcher = TriggerMatcher(triggers)
+        self.assertFalse(matcher._use_substrings)
+
+        messages = ["", "trigger", "TRIGGER19", "xtrigger199x", "trigger 1", "unhelpful", "a.b"]
+        for message in messages:
+            self.assertEqual(matcher.matches(message),
+                             any(t.lower() in message.lower() for t in triggers), message)
+        self.assertEqual(matcher.find("see trigger150 and help"), "trigger150")
@@ -0,0 +1,130 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the bot's metrics.
+"""
+
+import unittest
+import urllib.error
+import urllib.request
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from gif_bot.gif_store import GifStore
+from gif_bot.metrics import (HANDLERS, Histogram, Metrics, MetricsServer, instrument_api_call,
+                             instrument_bot)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1., 2., 4.))
+        for value in (0.5, 1.5, 1.5, 3., 10.):
+            histogram.observe(value)
+        self.assertListEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.total, 16.5)
+        self.assertEqual(histogram.quantile(0.5), 2.)
+        self.assertEqual(histogram.quantile(1.), float("inf"))
+
+    def test_render(self):
+        self.metrics.inc("requests_total", method="a")
+        self.metrics.inc("requests_total", 2, method="a")
+        self.metrics.observe("latency_seconds", 0.003, handler='say "hi"')
+        self.metrics.collect("queue", lambda: {"depth": 3})
+        text = self.metrics.render()
+
+        self.assertIn('# TYPE requests_total counter\nrequests_total{method="a"} 3\n', text)
+        self.assertIn('# TYPE latency_seconds histogram\n', text)
+        self.assertIn('latency_seconds_bucket{handler="say \\"hi\\"",le="0.0025"} 0\n', text)
+        self.assertIn('latency_seconds_bucket{handler="say \\"hi\\"",le="0.005"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{handler="say \\"hi\\"",le="+Inf"} 1\n', text)
+        self.assertIn('latency_seconds_count{handler="say \\"hi\\""} 1\n', text)
+        self.assertIn('# TYPE queue_depth gauge\nqueue_depth 3\n', text)
+
+    def test_timed(self):
+        def handler(fail):
+            if fail:
+                raise ValueError()
+            return "done"
+
+        timed = self.metrics.timed("handler_seconds", handler, handler="handler")
+        self.assertEqual(timed(False), "done")
+        with self.assertRaises(ValueError):
+            timed(True)
+        self.assertEqual(self.metrics.histogram("handler_seconds", handler="handler").count, 2)
+        self.assertEqual(self.metrics.counter("handler_errors_total", handler="handler"), 1)
+
+    def test_api_call(self):
+        def call(method, **kwargs):
+            if method == "broken":
+                raise IOError()
+            return {"ok": method != "failing", "error": "invalid_auth"}
+
+        call = instrument_api_call(self.metrics, call)
+        call("chat.postMessage", channel="C1")
+        call("failing")
+        with self.assertRaises(IOError):
+            call("broken")
+
+        self.assertEqual(self.metrics.histogram("gif_bot_slack_api_seconds",
+                                                method="chat.postMessage").count, 1)
+        self.assertEqual(self.metrics.counter("gif_bot_slack_api_errors_total",
+                                              method="chat.postMessage", error="invalid_auth"), 0)
+        self.assertEqual(self.metrics.counter("gif_bot_slack_api_errors_total",
+                                              method="failing", error="invalid_auth"), 1)
+        self.assertEqual(self.metrics.counter("gif_bot_slack_api_errors_total",
+                                              method="broken", error="exception"), 1)
+
+    def test_instrument_bot(self):
+        store = GifStore(manifest_data="url_a,tag_a\n")
+        bot = SimpleNamespace(dispatcher=SimpleNamespace(metrics=lambda: {"queue_depth": 2}),
+                              rate_limiter=SimpleNamespace(metrics=lambda: {"dropped": 1}),
+                              store=store, reading_store=lambda: nullcontext(store),
+                              choose_gif=lambda channel, query: store.get_gif(query),
+                              **{handler: (lambda *args: None) for handler in HANDLERS})
+        instrument_bot(self.metrics, bot)
+        bot.handle_message({})
+        self.assertEqual(self.metrics.histogram("gif_bot_handler_seconds",
+                                                handler="handle_message").count, 1)
+        self.assertEqual(bot.choose_gif("channel", "tag_a"), "url_a")
+        self.assertEqual(self.metrics.histogram("gif_bot_store_seconds",
+                                                operation="choose_gif").count, 1)
+        text = self.metrics.render()
+        self.assertIn("gif_bot_dispatcher_queue_depth 2\n", text)
+        self.assertIn("gif_bot_rate_limiter_dropped 1\n", text)
+        self.assertIn("gif_bot_store_gifs 1\n", text)
+
+    def test_server(self):
+        self.metrics.inc("requests_total")
+        server = MetricsServer(self.metrics, port=0)
+        try:
+            url = "http://127.0.0.1:{}".format(server.port)
+            with urllib.request.urlopen(url + "/metrics") as response:
+                self.assertIn(b"requests_total 1\n", response.read())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other")
+        finally:
+            server.close()
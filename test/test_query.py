@@ -0,0 +1,149 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the tag query language.
+"""
+
+import unittest
+
+from gif_bot.gif_store import GifStore
+from gif_bot.query import AndPlan, CountCache, OrPlan, QueryError, TagPlan, compile_query, \
+    quote_tag
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        self.store = GifStore(manifest_data="url_cat,cat\nurl_dog,dog\nurl_catdog,cat,dog\n"
+                                            "url_angry,cat,angry\nurl_alpaca,alpaca,angry\n")
+
+    def matches(self, query):
+        return {self.store.storage.url(slot) for slot in compile_query(query).ids(self.store)}
+
+    def test_parse(self):
+        self.assertIsInstance(compile_query("cat"), TagPlan)
+        self.assertIsInstance(compile_query("cat+dog"), AndPlan)
+        self.assertIsInstance(compile_query("cat|dog"), OrPlan)
+        self.assertEqual(repr(compile_query("a|b+c-d")), "(a|(b+c-d))")
+        self.assertEqual(repr(compile_query("a + (b+c) - d")), "(a+b+c-d)")
+        self.assertEqual(repr(compile_query("(a|b)|c")), "(a|b|c)")
+        self.assertEqual(repr(compile_query("-a")), "(all-a)")
+
+    def test_plan_tags(self):
+        self.assertSetEqual(compile_query("(cat|dog)+happy-angry").tags,
+                            {"cat", "dog", "happy", "angry"})
+        self.assertSetEqual(compile_query("-angry").tags, {"all", "angry"})
+
+    def test_parse_errors(self):
+        for query in ("", " ", "cat+", "+cat", "|cat", "(cat", "cat)", "cat()", "cat||dog",
+                      '"cat', '""', '"cat"dog'):
+            with self.assertRaises(QueryError, msg=query):
+                compile_query(query)
+
+    def test_plans_cached(self):
+        self.assertIs(compile_query("cat|alpaca"), compile_query("cat|alpaca"))
+
+    def test_and(self):
+        self.assertSetEqual(self.matches("cat+dog"), {"url_catdog"})
+        self.assertSetEqual(self.matches("cat+missing"), set())
+
+    def test_or(self):
+        self.assertSetEqual(self.matches("dog|alpaca"), {"url_dog", "url_catdog", "url_alpaca"})
+        self.assertSetEqual(self.matches("cat|dog"), {"url_cat", "url_dog", "url_catdog",
+                                                      "url_angry"})
+
+    def test_not(self):
+        self.assertSetEqual(self.matches("cat-angry"), {"url_cat", "url_catdog"})
+        self.assertSetEqual(self.matches("-angry"), {"url_cat", "url_dog", "url_catdog"})
+        self.assertSetEqual(self.matches("(cat|alpaca)-angry-dog"), {"url_cat"})
+
+    def test_quoted_tags(self):
+        """ Tags containing operators can be requested by quoting them """
+        self.store.load_manifest("url_thumbs,thumbs-up,cat\n")
+        self.assertSetEqual(self.matches('"thumbs-up"'), {"url_thumbs"})
+        self.assertSetEqual(self.matches('cat-"thumbs-up"-angry'), {"url_cat", "url_catdog"})
+        self.assertSetEqual(self.matches("\u201cthumbs-up\u201d+cat"), {"url_thumbs"})
+        self.assertSetEqual(self.matches("thumbs-up"), set())
+        self.assertEqual(self.store.get_gif(quote_tag("thumbs-up")), "url_thumbs")
+        self.assertEqual(quote_tag("cat"), "cat")
+        self.assertEqual(quote_tag("all"), '"all"')
+
+    def test_all(self):
+        self.store.remove_gif("url_dog")
+        self.assertSetEqual(self.matches("all"), {"url_cat", "url_catdog", "url_angry",
+                                                  "url_alpaca"})
+        self.assertSetEqual(self.matches("all-cat"), {"url_alpaca"})
+        self.assertEqual(self.store.get_count("all"), 4)
+
+    def test_get_count(self):
+        self.assertEqual(self.store.get_count("cat|alpaca"), 4)
+        self.assertEqual(self.store.get_count("cat-angry"), 2)
+        self.assertEqual(self.store.get_count("missing|dog"), 2)
+
+    def test_get_gif(self):
+        for _ in range(20):
+            self.assertIn(self.store.get_gif("cat-angry|alpaca"),
+                          {"url_cat", "url_catdog", "url_alpaca"})
+            self.assertIn(self.store.get_gif("-cat"), {"url_dog", "url_alpaca"})
+        self.assertEqual(self.store.get_gif("cat+dog"), "url_catdog")
+        self.assertIsNone(self.store.get_gif("dog-cat-dog"))
+        with self.assertRaises(QueryError):
+            self.store.get_gif("cat+")
+
+    def test_get_gif_uniform(self):
+        store = GifStore(manifest_data="".join("url_{0},tag_{1},tag_many\n".format(i, i % 4)
+                                               for i in range(400)))
+        counts = {}
+        for _ in range(1000):
+            url = store.get_gif("tag_many-tag_0-tag_1|tag_1+tag_many")
+            counts[url] = counts.get(url, 0) + 1
+        self.assertTrue(set(counts) <= {"url_{}".format(i) for i in range(400) if i % 4})
+        self.assertGreater(len(counts), 250)
+        self.assertLess(max(counts.values()), 20)
+
+    def test_count_cache(self):
+        cache = self.store.counts
+        self.assertEqual(self.store.get_count("cat-angry"), 2)
+        self.assertEqual(self.store.get_count("dog"), 2)
+        self.assertEqual(self.store.get_count("all"), 5)
+        self.assertEqual(len(cache), 3)
+
+        # Only the counts depending on the changed tags (or on every GIF) are forgotten
+        self.store.add_gif("url_cat", {"angry"})
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(self.store.get_count("cat-angry"), 1)
+        self.assertEqual(self.store.get_count("dog"), 2)
+
+        self.store.remove_gif("url_dog")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(self.store.get_count("dog"), 1)
+        self.assertEqual(self.store.get_count("all"), 4)
+
+    def test_count_cache_eviction(self):
+        cache = CountCache(max_size=2)
+        for query in ("cat", "dog", "cat", "alpaca"):
+            cache.count(query, self.store)
+        self.assertEqual(len(cache), 2)
+        cache.invalidate({"dog"})
+        self.assertEqual(len(cache), 2)
+        cache.invalidate({"cat"})
+        self.assertEqual(len(cache), 1)
@@ -0,0 +1,191 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``RateLimiter`` class.
+"""
+
+import threading
+import time
+import unittest
+
+from benchmarks.fake_slack import FakeSlackClient
+from gif_bot.dispatcher import ApiDispatcher, RateLimitedResponse
+from gif_bot.rate_limit import Limit, MethodLimits, RateLimiter, TokenBucket
+
+LIMITS = {"chat.postMessage": MethodLimits(workspace=Limit(100., 100), channel=Limit(1., 2))}
+
+
+class FakeClock:
+    """ A clock that only moves forwards when something sleeps """
+    def __init__(self):
+        self.now = 0.
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSlackApi:
+    """
+    A fake Slack Web API that allows each channel bursts of ``burst`` calls, refilled at ``rate``
+    calls per second
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, channel=None, **kwargs):
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(channel, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1.:
+                self.rate_limited += 1
+                return {"ok": False, "error": "ratelimited",
+                        "retry_after": (1. - tokens) / self.rate}
+            self.buckets[channel] = (tokens - 1., now)
+        return None
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self, policy):
+        return RateLimiter(policy, LIMITS, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(Limit(2., 2), now=0.)
+        self.assertEqual(bucket.wait_time(0.), 0.)
+        bucket.take(0.)
+        bucket.take(0.)
+        self.assertAlmostEqual(bucket.wait_time(0.), 0.5)
+        self.assertAlmostEqual(bucket.wait_time(0.25), 0.25)
+        self.assertEqual(bucket.wait_time(10.), 0.)
+        self.assertEqual(bucket.tokens, 2.)
+
+    def test_wait_policy(self):
+        limiter = self.limiter("wait")
+        for _ in range(4):
+            self.assertTrue(limiter.acquire("chat.postMessage", "C1"))
+        self.assertListEqual(self.clock.sleeps, [1., 1.])
+        self.assertEqual(limiter.metrics()["limited"], 2)
+
+    def test_drop_policy(self):
+        limiter = self.limiter("drop")
+        results = [limiter.acquire("chat.postMessage", "C1") for _ in range(4)]
+        self.assertListEqual(results, [True, True, False, False])
+        # Other channels have their own buckets
+        self.assertTrue(limiter.acquire("chat.postMessage", "C2"))
+        self.assertListEqual(self.clock.sleeps, [])
+
+    def test_undroppable(self):
+        """ Calls that can't be dropped should wait, whatever the policy """
+        limiter = self.limiter("drop")
+        results = [limiter.acquire("chat.postMessage", "C1", droppable=False) for _ in range(4)]
+        self.assertListEqual(results, [True] * 4)
+        self.assertListEqual(self.clock.sleeps, [1., 1.])
+        self.assertEqual(limiter.metrics()["dropped"], 0)
+
+    def test_coalesce_policy(self):
+        limiter = self.limiter("coalesce")
+        results = [limiter.acquire("chat.postMessage", "C1") for _ in range(6)]
+        self.assertListEqual(results, [True, True, True, False, False, False])
+        self.assertEqual(limiter.metrics()["dropped"], 3)
+
+        # Once the bucket refills, calls are allowed through again
+        self.clock.now += 10.
+        self.assertTrue(limiter.acquire("chat.postMessage", "C1"))
+        self.assertTrue(limiter.acquire("chat.postMessage", "C1"))
+        self.assertTrue(limiter.acquire("chat.postMessage", "C1"))
+
+    def test_unlimited_methods(self):
+        limiter = self.limiter("drop")
+        self.assertTrue(all(limiter.acquire("users.list") for _ in range(100)))
+
+    def test_back_off(self):
+        limiter = self.limiter("wait")
+        limiter.back_off("reactions.add", 3.)
+        self.assertTrue(limiter.acquire("reactions.add", "C1"))
+        self.assertListEqual(self.clock.sleeps, [3.])
+
+    def test_wrap_retries_after_rate_limit(self):
+        responses = [{"ok": False, "error": "ratelimited", "retry_after": 2.}, {"ok": True}]
+        limited_call = self.limiter("wait").wrap(lambda method, **kwargs: responses.pop(0))
+        self.assertDictEqual(limited_call("chat.postMessage", channel="C1"), {"ok": True})
+        self.assertListEqual(self.clock.sleeps, [2.])
+
+    def test_wrap_drops(self):
+        calls = []
+        limited_call = self.limiter("drop").wrap(lambda method, **kwargs: calls.append(method))
+        for _ in range(5):
+            response = limited_call("chat.postMessage", channel="C1")
+        self.assertEqual(response["error"], "ratelimited")
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(limited_call("chat.postMessage", droppable=False, channel="C1"))
+        self.assertEqual(len(calls), 3)
+
+    def test_rate_limited_response(self):
+        self.assertDictEqual(RateLimitedResponse("7").json(),
+                             {"ok": False, "error": "ratelimited", "retry_after": 7.})
+        self.assertIsNone(RateLimitedResponse("soon").json()["retry_after"])
+
+
+class TestRateLimiterUnderLoad(unittest.TestCase):
+    def test_simulated_load(self):
+        """ A burst of triggers should be coalesced rather than hammering the Slack API """
+        fake_api = FakeSlackApi(rate=20., burst=2)
+        client = FakeSlackClient("UNUSED", api_handler=fake_api)
+        limits = {"chat.postMessage": MethodLimits(workspace=Limit(100., 20),
+                                                   channel=Limit(20., 2))}
+        limiter = RateLimiter("coalesce", limits)
+        dispatcher = ApiDispatcher(limiter.wrap(client.api_call), workers=4)
+
+        start = time.monotonic()
+        futures = []
+        for i in range(100):
+            channel = "C{}".format(i % 4)
+            futures.append(dispatcher.submit("chat.postMessage", channel, channel=channel))
+        dispatcher.close()
+        elapsed = time.monotonic() - start
+
+        responses = [future.result() for future in futures]
+        self.assertTrue(all(isinstance(response, dict) for response in responses))
+
+        # Each channel gets its burst, plus whatever the bucket refilled while the calls were being
+        # made, and everything else is dropped
+        posted = len(client.calls_to("chat.postMessage")) - fake_api.rate_limited
+        dropped = sum(1 for response in responses if response.get("dropped"))
+        self.assertGreaterEqual(posted, 4 * 2)
+        self.assertLessEqual(posted, 4 * (2 + 1 + 20. * elapsed))
+        self.assertEqual(dropped, limiter.metrics()["dropped"])
+        self.assertEqual(posted + dropped, 100)
+        self.assertLessEqual(fake_api.rate_limited, 4)
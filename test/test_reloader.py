@@ -0,0 +1,161 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``StoreReloader`` class.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest.mock import MagicMock, patch
+
+from gif_bot.gif_store import GifStore
+from gif_bot.journal import Journal
+from gif_bot.reloader import StoreReloader
+
+
+class TestStoreReloader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifest_loc = os.path.join(self.directory.name, "manifest.csv")
+        self.write_manifest("url_a,tag_a\n")
+        self.store = self.load()
+        self.loading = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.loads = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_manifest(self, text):
+        with open(self.manifest_loc, "w") as manifest_file:
+            manifest_file.write(text)
+
+    def load(self):
+        with open(self.manifest_loc, newline="") as manifest_file:
+            return GifStore(manifest_data=manifest_file)
+
+    def slow_load(self):
+        self.loads += 1
+        self.loading.set()
+        self.release.wait(5)
+        return self.load()
+
+    def swap(self, store):
+        self.store = store
+
+    def make_reloader(self, lock=None):
+        return StoreReloader(self.slow_load, self.swap, self.manifest_loc, MagicMock(), lock=lock)
+
+    def test_old_store_served_during_reload(self):
+        reloader = self.make_reloader()
+        self.release.clear()
+        self.write_manifest("url_b,tag_b\n")
+
+        future = reloader.reload()
+        self.assertTrue(self.loading.wait(5))
+        self.assertEqual(self.store.get_gif("tag_a"), "url_a")
+
+        # Reloads requested while one is in progress share it
+        self.assertIs(reloader.reload(), future)
+
+        self.release.set()
+        new_store = future.result(5)
+        self.assertIs(self.store, new_store)
+        self.assertEqual(self.store.get_gif("tag_b"), "url_b")
+        self.assertEqual(self.loads, 1)
+        reloader.close()
+
+    def test_changes_during_reload(self):
+        """ Changes can be made while a reload is loading, but not while it is swapping stores """
+        lock = threading.RLock()
+        reloader = self.make_reloader(lock)
+        self.release.clear()
+        old_store = self.store
+
+        def _add():
+            with lock:
+                self.store.add_gif("url_new", {"tag_new"})
+
+        future = reloader.reload()
+        self.assertTrue(self.loading.wait(5))
+        adder = threading.Thread(target=_add)
+        adder.start()
+        adder.join(5)
+        self.assertFalse(adder.is_alive())
+        self.assertEqual(old_store.get_gif("tag_new"), "url_new")
+
+        with lock:
+            self.release.set()
+            with self.assertRaises(futures.TimeoutError):
+                future.result(0.1)
+            self.assertIs(self.store, old_store)
+        new_store = future.result(5)
+        self.assertIs(self.store, new_store)
+        reloader.close()
+
+    def test_failed_reload_keeps_store(self):
+        old_store = self.store
+        reloader = StoreReloader(MagicMock(side_effect=IOError), self.swap, self.manifest_loc,
+                                 MagicMock())
+        self.assertIsInstance(reloader.reload().exception(5), IOError)
+        self.assertIs(self.store, old_store)
+        reloader.close()
+
+    def test_watch(self):
+        reloader = self.make_reloader()
+        reloader.watch(0.01)
+        time.sleep(0.05)
+        self.assertEqual(self.loads, 0)
+
+        self.write_manifest("url_c,tag_c\n")
+        os.utime(self.manifest_loc, ns=(0, time.time_ns() + 10 ** 9))
+        deadline = time.monotonic() + 5
+        while self.store.get_gif("tag_c") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.store.get_gif("tag_c"), "url_c")
+        reloader.close()
+
+    @patch("gif_bot.journal.COMPACTION_MIN_RECORDS", 2)
+    def test_compaction_not_reloaded(self):
+        """ Compacting the journal rewrites the manifest, which shouldn't trigger a reload """
+        reloader = self.make_reloader()
+        journal = Journal(os.path.join(self.directory.name, "manifest.journal"), self.manifest_loc)
+        journal.writing_manifest = reloader.writing_manifest
+        self.store.attach_journal(journal)
+        reloader.watch(0.01)
+
+        mtime = os.stat(self.manifest_loc).st_mtime_ns
+        self.store.add_gif("url_b", {"tag_b"})
+        self.store.add_gif("url_c", {"tag_c"})
+        self.assertEqual(journal.records, 0)
+        self.assertNotEqual(os.stat(self.manifest_loc).st_mtime_ns, mtime)
+        time.sleep(0.1)
+        self.assertEqual(self.loads, 0)
+        journal.close()
+        reloader.close()
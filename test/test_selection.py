@@ -0,0 +1,170 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for weighted and no-repeat GIF selection.
+"""
+
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+from gif_bot.gif_store import GifStore
+from gif_bot.query import TagPlan
+from gif_bot.selection import FenwickTree, RecentlyPosted, WeightError, split_weight
+from gif_bot.snapshot import Fingerprint, open_snapshot, write_snapshot
+
+
+class TestFenwickTree(unittest.TestCase):
+    def test_prefix_sums(self):
+        weights = [random.Random(0).uniform(0, 5) for _ in range(100)]
+        built = FenwickTree.from_weights(weights)
+        appended = FenwickTree()
+        for weight in weights:
+            appended.append(weight)
+
+        for tree in (built, appended):
+            self.assertEqual(len(tree), 100)
+            for count in range(101):
+                self.assertAlmostEqual(tree.prefix_sum(count), sum(weights[:count]))
+
+    def test_find(self):
+        tree = FenwickTree.from_weights([1., 0., 2., 3.])
+        self.assertListEqual([tree.find(value) for value in (0., 0.99, 1., 2.99, 3., 5.99)],
+                             [0, 0, 2, 2, 3, 3])
+
+        tree.add(1, 4.)
+        tree.add(3, -3.)
+        self.assertEqual(tree.total(), 7.)
+        self.assertListEqual([tree.find(value) for value in (0.5, 1.5, 5.5, 6.99)], [0, 1, 2, 2])
+
+    def test_empty(self):
+        self.assertIsNone(FenwickTree().sample())
+        self.assertIsNone(FenwickTree.from_weights([0., 0.]).sample())
+
+
+class TestWeightedSelection(unittest.TestCase):
+    def setUp(self):
+        self.store = GifStore(manifest_data="url_a,cat,weight=3\nurl_b,cat\nurl_c,dog,weight=0\n"
+                                            "url_d,dog\n")
+
+    def draw(self, store, query, draws=4000):
+        return Counter(store.get_gif(query) for _ in range(draws))
+
+    def test_split_weight(self):
+        self.assertEqual(split_weight({"cat", "weight=2.5"}), ({"cat"}, 2.5))
+        self.assertEqual(split_weight({"cat", "weight=0"}), ({"cat"}, 0.))
+        for weight in ("weight=x", "weight=-1", "weight=inf", "weight="):
+            with self.assertRaises(WeightError):
+                split_weight({"cat", weight})
+
+    def test_invalid_weights(self):
+        """ Malformed weights should be rejected, rather than being kept as tags """
+        with self.assertRaises(WeightError):
+            self.store.add_gif("url_e", {"cat", "weight=-1"})
+        self.assertNotIn("url_e", {element.url for element in self.store.elements})
+        with self.assertRaisesRegex(WeightError, "url_f"):
+            GifStore(manifest_data="url_a,cat\nurl_f,cat,weight=abc\n")
+
+    def test_weights(self):
+        self.assertNotIn("weight=3", self.store.tags)
+        counts = self.draw(self.store, "cat")
+        self.assertAlmostEqual(counts["url_a"] / 4000, 0.75, delta=0.05)
+        self.assertSetEqual(set(self.draw(self.store, "dog", 100)), {"url_d"})
+        counts = self.draw(self.store, "all")
+        self.assertNotIn("url_c", counts)
+        self.assertAlmostEqual(counts["url_a"] / 4000, 0.6, delta=0.05)
+        counts = self.draw(self.store, "cat|dog")
+        self.assertAlmostEqual(counts["url_a"] / 4000, 0.6, delta=0.05)
+
+    def test_skewed_weights(self):
+        """ Tags whose weights are too skewed for rejection sampling should fall back to a scan """
+        store = GifStore(manifest_data="url_big,cat,weight=1000000\n" +
+                         "".join("url_{},cat,weight=0.5\n".format(i) for i in range(1000)))
+        with patch.object(TagPlan, "ids", autospec=True, side_effect=TagPlan.ids) as ids:
+            counts = self.draw(store, "cat", 100)
+        self.assertGreater(ids.call_count, 50)
+        self.assertGreater(counts["url_big"], 90)
+
+    def test_weight_changes(self):
+        self.store.get_gif("all")  # Builds the weight tree, which must then be kept up to date
+        self.store.add_gif("url_b", {"weight=5"})
+        self.store.remove_gif("url_a")
+        self.store.add_gif("url_e", {"cat", "weight=2"})
+        counts = self.draw(self.store, "all")
+        self.assertSetEqual(set(counts), {"url_b", "url_d", "url_e"})
+        self.assertAlmostEqual(counts["url_b"] / 4000, 0.625, delta=0.05)
+
+        for i in range(100):
+            self.store.add_gif("url_{}".format(i), {"tmp"})
+        for i in range(100):
+            self.store.remove_gif("url_{}".format(i))
+        self.assertAlmostEqual(self.draw(self.store, "all")["url_b"] / 4000, 0.625, delta=0.05)
+
+    def test_elements_keep_weights(self):
+        elements = {e.url: e.tags for e in self.store.elements}
+        self.assertSetEqual(elements["url_a"], {"cat", "weight=3"})
+        self.assertSetEqual(elements["url_b"], {"cat"})
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "manifest.snap")
+            write_snapshot(self.store, filename, Fingerprint(0, 0, 0))
+            snapshot = open_snapshot(filename)
+            self.assertDictEqual({e.url: e.tags for e in snapshot.elements}, elements)
+            self.assertAlmostEqual(self.draw(snapshot, "all")["url_a"] / 4000, 0.6, delta=0.05)
+            self.assertAlmostEqual(self.draw(snapshot, "cat")["url_a"] / 4000, 0.75, delta=0.05)
+            snapshot.close()
+
+
+class TestRecentlyPosted(unittest.TestCase):
+    def setUp(self):
+        self.store = GifStore(manifest_data="".join("url_{},cat\n".format(i) for i in range(10)))
+
+    def test_no_repeats(self):
+        recent = RecentlyPosted(fraction=1.)
+        for _ in range(3):
+            urls = [recent.choose(self.store, "channel", "cat") for _ in range(10)]
+            self.assertEqual(len(set(urls)), 10)
+
+    def test_fraction(self):
+        recent = RecentlyPosted(fraction=0.5)
+        urls = [recent.choose(self.store, "channel", "cat") for _ in range(200)]
+        for i in range(len(urls) - 5):
+            self.assertEqual(len(set(urls[i:i + 5])), 5)
+
+    def test_channels_independent(self):
+        recent = RecentlyPosted(fraction=1., max_windows=1)
+        recent.choose(self.store, "channel_1", "cat")
+        recent.choose(self.store, "channel_2", "cat")
+        self.assertEqual(len(recent._windows), 1)
+
+    def test_excluded_only_matches(self):
+        # Once everything has been shown, the GIF is repeated rather than nothing being posted
+        store = GifStore(manifest_data="url_a,cat\n")
+        recent = RecentlyPosted(fraction=1.)
+        self.assertEqual(recent.choose(store, "channel", "cat"), "url_a")
+        self.assertEqual(recent.choose(store, "channel", "cat"), "url_a")
+        self.assertEqual(store.get_gif("cat", exclude={"url_a"}), "url_a")
+        self.assertIsNone(recent.choose(store, "channel", "dog"))
@@ -0,0 +1,130 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``SnapshotStore`` class.
+"""
+
+import os
+import tempfile
+import unittest
+
+from gif_bot.gif_store import GifStore
+from gif_bot.snapshot import Fingerprint, open_snapshot, source_fingerprint, write_snapshot
+
+
+class TestSnapshotStore(unittest.TestCase):
+    fingerprint = Fingerprint(1, 2, 3)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "manifest.snap")
+        self.source = GifStore(manifest_data="url_a,tag_a1,tag_a2\nurl_b,tag_b1,tag_b2\n"
+                                             "url_bb,tag_b1,tag_b3\nurl_c,tag_ü\n")
+        self.source.remove_gif("url_c")  # Tombstoned elements shouldn't be written out
+        self.store = self.snapshot(self.source)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def snapshot(self, store):
+        write_snapshot(store, self.filename, self.fingerprint)
+        return open_snapshot(self.filename, self.fingerprint, adjectives=["TestAdjective"])
+
+    @staticmethod
+    def contents(store):
+        return {e.url: e.tags for e in store.elements}
+
+    def test_contents(self):
+        self.assertEqual(len(self.store.elements), 3)
+        self.assertDictEqual(self.contents(self.store), self.contents(self.source))
+        self.assertDictEqual(dict(self.store.tags.items()), dict(self.source.tags.items()))
+        self.assertSetEqual(self.store.get_tags(), self.source.get_tags())
+
+    def test_get_count(self):
+        self.assertEqual(self.store.get_count("tag_b1"), 2)
+        self.assertEqual(self.store.get_count("tag_b1+tag_b3"), 1)
+        self.assertEqual(self.store.get_count("tag_a1+tag_b1"), 0)
+        self.assertEqual(self.store.get_count("tag_ü"), 0)
+
+    def test_get_gif(self):
+        self.assertEqual(self.store.get_gif("tag_a1"), "url_a")
+        self.assertEqual(self.store.get_gif("tag_b1+tag_b3"), "url_bb")
+        self.assertIsNone(self.store.get_gif("tag_a1+tag_b1"))
+        self.assertIsNone(self.store.get_gif("tag_d1"))
+        self.assertIn(self.store.get_gif("all"), {"url_a", "url_b", "url_bb"})
+
+    def test_get_info(self):
+        self.assertEqual(self.store.get_info(max_tags=10).count("TestAdjective"), 5)
+        info = self.store.get_info(max_tags=10, restrict=lambda query: "(" + query + ")-tag_a1")
+        self.assertEqual(info.count("TestAdjective"), 3)
+        self.assertNotIn("tag_a2", info)
+
+    def test_unicode_tags(self):
+        store = self.snapshot(GifStore(manifest_data="url_ü,tag_ü,tag_z\nurl_y,tag_y\n"))
+        self.assertEqual(store.get_gif("tag_ü"), "url_ü")
+        self.assertIn("tag_z", store.tags)
+        self.assertNotIn("tag_x", store.tags)
+        store.close()
+
+    def test_empty_store(self):
+        store = self.snapshot(GifStore())
+        self.assertEqual(len(store.elements), 0)
+        self.assertIsNone(store.get_gif("all"))
+        self.assertIsNone(store.get_gif("tag_a1"))
+        store.close()
+
+    def test_stale_snapshot(self):
+        self.assertIsNone(open_snapshot(self.filename, Fingerprint(1, 2, 4)))
+        self.assertIsNone(open_snapshot(os.path.join(self.directory.name, "missing.snap")))
+
+    def test_invalid_snapshot(self):
+        for data in (b"", b"GIFSNAP", b"NOTASNAPSHOT" * 100):
+            with open(self.filename, "wb") as snapshot_file:
+                snapshot_file.write(data)
+            self.assertIsNone(open_snapshot(self.filename))
+
+    def test_to_gif_store(self):
+        store = self.store.to_gif_store(compact=True)
+        store.add_gif("url_d", {"tag_d1"})
+        self.assertEqual(store.get_gif("tag_d1"), "url_d")
+        self.assertEqual(store.get_count("tag_b1"), 2)
+
+    def test_save_manifest(self):
+        filename = os.path.join(self.directory.name, "manifest.csv")
+        self.store.save_manifest(filename)
+        with open(filename, newline="") as manifest_file:
+            store = GifStore(manifest_data=manifest_file)
+        self.assertDictEqual(self.contents(store), self.contents(self.source))
+
+    def test_source_fingerprint(self):
+        manifest_loc = os.path.join(self.directory.name, "manifest.csv")
+        journal_loc = os.path.join(self.directory.name, "manifest.journal")
+        with open(manifest_loc, "w") as manifest_file:
+            manifest_file.write("url_a,tag_a1\n")
+        fingerprint = source_fingerprint(manifest_loc, journal_loc)
+        self.assertEqual(fingerprint.journal_size, 0)
+
+        with open(journal_loc, "w") as journal_file:
+            journal_file.write("+,url_b,tag_b1\n")
+        self.assertNotEqual(source_fingerprint(manifest_loc, journal_loc), fingerprint)
@@ -0,0 +1,128 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``Supervisor`` class.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from gif_bot.snapshot import ensure_snapshot, open_snapshot, source_fingerprint
+from gif_bot.supervisor import Supervisor
+
+
+def crash_twice(config_filename, log_filename):
+    """ A worker that crashes the first two times it is run """
+    with open(log_filename, "a") as log_file:
+        log_file.write("started\n")
+    with open(log_filename) as log_file:
+        runs = len(log_file.readlines())
+    sys.exit(1 if runs <= 2 else 0)
+
+
+def run_forever(config_filename, log_filename):
+    """ A worker that never exits by itself """
+    with open(log_filename, "a") as log_file:
+        log_file.write("started\n")
+    while True:
+        time.sleep(1)
+
+
+def crash_or_run_forever(config_filename, log_filename):
+    if "crash" in config_filename:
+        crash_twice(config_filename, log_filename)
+    else:
+        run_forever(config_filename, log_filename)
+
+
+@patch("gif_bot.supervisor.RESTART_DELAY", 0.01)
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.context = multiprocessing.get_context("fork")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def supervisor(self, config_filenames, target):
+        return Supervisor(config_filenames, log_dir=self.directory.name, target=target,
+                          context=self.context)
+
+    def runs(self, name):
+        try:
+            with open(os.path.join(self.directory.name, name + ".log")) as log_file:
+                return len(log_file.readlines())
+        except FileNotFoundError:
+            return 0
+
+    def poll_until(self, supervisor, condition, timeout=10.):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            supervisor.poll(timeout=0.05)
+
+    def test_restart_crashed_worker(self):
+        supervisor = self.supervisor(["crash.config"], crash_twice)
+        while supervisor.poll(timeout=0.05):
+            pass
+        self.assertEqual(self.runs("crash"), 3)
+        self.assertEqual(supervisor.workers[0].restarts, 2)
+
+    def test_workers_independent(self):
+        supervisor = self.supervisor(["crash.config", "ok.config"], crash_or_run_forever)
+        try:
+            self.poll_until(supervisor, lambda: supervisor.workers[1].process is not None)
+            pid = supervisor.workers[1].process.pid
+            self.poll_until(supervisor, lambda: supervisor.workers[0].start_at is None)
+            self.assertEqual(self.runs("crash"), 3)
+            self.assertEqual(supervisor.workers[1].process.pid, pid)
+            self.assertEqual(supervisor.workers[1].restarts, 0)
+        finally:
+            supervisor.stop()
+        self.assertIsNone(supervisor.workers[1].process)
+        self.assertFalse(supervisor.poll(timeout=0.05))
+
+    def test_shared_snapshot(self):
+        manifest_loc = os.path.join(self.directory.name, "manifest.csv")
+        snapshot_loc = os.path.join(self.directory.name, "manifest.snap")
+        with open(manifest_loc, "w") as manifest_file:
+            manifest_file.write("url_a,tag_a1\nurl_b,tag_b1\n")
+        config_filenames = []
+        for name in ("workspace_1", "workspace_2"):
+            config_filenames.append(os.path.join(self.directory.name, name + ".config"))
+            with open(config_filenames[-1], "w") as config_file:
+                config_file.write("manifest_loc = {}\nsnapshot_loc = {}\n".format(manifest_loc,
+                                                                                 snapshot_loc))
+
+        supervisor = self.supervisor(config_filenames, run_forever)
+        with patch("gif_bot.supervisor.ensure_snapshot", wraps=ensure_snapshot) as ensure:
+            supervisor.prepare_snapshots()
+        self.assertEqual(ensure.call_count, 1)
+        snapshot = open_snapshot(snapshot_loc, source_fingerprint(manifest_loc))
+        self.assertEqual(len(snapshot.elements), 2)
+        snapshot.close()
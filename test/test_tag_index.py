@@ -0,0 +1,107 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Tests for the ``TagIndex`` class.
+"""
+
+import random
+import unittest
+
+from gif_bot.tag_index import TagIndex
+
+
+class TestTagIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TagIndex()
+        self.index.add(0, {"cat", "cute"})
+        self.index.add(1, {"dog", "cute"})
+        self.index.add(2, {"cat", "dog"})
+        self.index.add(3, {"cat", "dog", "cute"})
+
+    def test_counts(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index["cat"], 3)
+        self.assertEqual(self.index.count(["cat"]), 3)
+        self.assertEqual(self.index.count(["cat", "dog"]), 2)
+        self.assertEqual(self.index.count(["cat", "dog", "cute"]), 1)
+        self.assertEqual(self.index.count(["cat", "alpaca"]), 0)
+
+    def test_intersect(self):
+        self.assertListEqual(list(self.index.intersect(["cat", "cute"])), [0, 3])
+        self.assertListEqual(list(self.index.intersect(["alpaca"])), [])
+
+    def test_out_of_order_add(self):
+        self.index.add(10, {"cat"})
+        self.index.add(5, {"cat"})
+        self.index.add(5, {"cat"})
+        self.assertListEqual(list(self.index.intersect(["cat"])), [0, 2, 3, 5, 10])
+
+    def test_discard(self):
+        self.index.discard(3, {"cat", "dog", "cute"})
+        self.index.discard(0, {"cat", "cute"})
+        self.assertEqual(self.index.count(["cat", "dog"]), 1)
+        self.assertEqual(self.index["cute"], 1)
+
+        self.index.discard(1, {"dog", "cute"})
+        self.assertNotIn("cute", self.index)
+
+    def test_choose(self):
+        seen = {self.index.choose(["cat", "dog"]) for _ in range(200)}
+        self.assertSetEqual(seen, {2, 3})
+        self.assertIsNone(self.index.choose(["cat", "alpaca"]))
+
+    def test_choose_sparse_intersection(self):
+        index = TagIndex()
+        index.add(0, {"rare", "common"})
+        for element_id in range(1, 1000):
+            index.add(element_id, {"common", "other"})
+        index.add(1000, {"rare"})
+        for _ in range(20):
+            self.assertEqual(index.choose(["rare", "common"]), 0)
+
+    def test_histogram(self):
+        self.index.add(4, {"alpaca"})
+        histogram = self.index.histogram
+        self.assertDictEqual(dict(histogram.top(3)), {"cat": 3, "dog": 3, "cute": 3})
+        self.assertEqual(histogram.top(4)[3], ("alpaca", 1))
+
+        self.index.discard(3, {"cat", "dog", "cute"})
+        self.index.add(5, {"cute"})
+        self.index.discard(4, {"alpaca"})
+        self.assertEqual(histogram.top(1), [("cute", 3)])
+        self.assertDictEqual(dict(histogram.top(10)), {"cute": 3, "cat": 2, "dog": 2})
+
+    def test_histogram_random_changes(self):
+        rng = random.Random(0)
+        histogram = self.index.histogram
+        for _ in range(2000):
+            element_id, tags = rng.randrange(50), {str(rng.randrange(20)) for _ in range(3)}
+            if rng.random() < 0.6:
+                self.index.add(element_id, tags)
+            else:
+                self.index.discard(element_id, tags)
+            ranked = histogram.top(len(self.index))
+            self.assertListEqual([count for _, count in ranked],
+                                 sorted((count for _, count in ranked), reverse=True))
+            self.assertDictEqual(dict(ranked), dict(self.index.items()))
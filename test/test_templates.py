@@ -0,0 +1,77 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``GreetingTemplates`` and ``StatusTemplates`` classes.
+"""
+
+import json
+import unittest
+
+from gif_bot.templates import GreetingTemplates, StatusTemplates, TemplateError, validate_template
+
+
+class TestGreetingTemplates(unittest.TestCase):
+    def test_render(self):
+        templates = GreetingTemplates(["Hi, {}!", "Hello!"], ["friend", "pal"])
+        self.assertEqual(len(templates), 4)
+        rendered = {templates.render("URL") for _ in range(200)}
+        self.assertSetEqual(rendered, {"Hi, friend! URL", "Hi, pal! URL", "Hello! URL"})
+
+    def test_templates(self):
+        templates = GreetingTemplates([], ["pal"], ["{url} is for you, {noun}", "For {0}:"])
+        rendered = {templates.render("URL") for _ in range(100)}
+        self.assertSetEqual(rendered, {"URL is for you, pal", "For pal: URL"})
+
+    def test_empty(self):
+        self.assertEqual(GreetingTemplates([], []).render("URL"), "URL")
+
+    def test_status(self):
+        templates = StatusTemplates(["nice", "great"])
+        self.assertEqual(len(templates), 2)
+        rendered = {templates.render("cat", 2) for _ in range(100)}
+        self.assertSetEqual(rendered, {"  2 nice cat gifs!", "  2 great cat gifs!"})
+        self.assertEqual(StatusTemplates([]).render("cat", 1), "  1 cat gif!")
+
+    def test_validate(self):
+        validate_template("Here {}, {noun} {url} {{literal}}")
+        validate_template("Here {0}, {0} {noun} {url}")
+        for template in ("{1}", "{name}", "{noun.upper}", "unbalanced {", "Hi {} and {}",
+                         "{0} {}", "{url:{noun}}"):
+            with self.assertRaises(TemplateError):
+                validate_template(template)
+        with self.assertRaises(TemplateError):
+            GreetingTemplates(["Hi, {}!"], ["pal"], ["Hi, {user}!"])
+
+    def test_blocks(self):
+        templates = GreetingTemplates(["Hi, {}!"], ["pal"], ["{url}"], blocks=True)
+        results = {templates.render_blocks("URL", "cat GIF") for _ in range(100)}
+        self.assertEqual(len(results), 2)
+        for text, blocks in results:
+            blocks = json.loads(blocks)
+            self.assertDictEqual(blocks[-1],
+                                 {"type": "image", "image_url": "URL", "alt_text": "cat GIF"})
+            if text == "Hi, pal! URL":
+                self.assertEqual(blocks[0]["text"]["text"], "Hi, pal!")
+            else:
+                self.assertEqual(text, "URL")
+                self.assertEqual(len(blocks), 1)
@@ -0,0 +1,123 @@
+# MIT License
+#
+# Copyright (c) 2018 Matthew Bedder (matthew@bedder.co.uk)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests for the ``UserDirectory`` class.
+"""
+
+import os
+import tempfile
+import unittest
+
+from gif_bot.users import UserDirectory, UserLookupError
+
+
+class FakeUsersApi:
+    """ Serves ``users.list`` in pages, like the Slack API """
+    def __init__(self, num_users, rate_limited_pages=()):
+        self.members = [{"name": "user_{}".format(i), "id": "U{}".format(i)}
+                        for i in range(num_users)]
+        self.rate_limited_pages = set(rate_limited_pages)
+        self.calls = []
+
+    def __call__(self, method, limit, cursor=None):
+        self.calls.append(cursor)
+        start = int(cursor or 0)
+        if start in self.rate_limited_pages:
+            self.rate_limited_pages.remove(start)
+            return {"ok": False, "error": "ratelimited", "retry_after": 2.}
+        end = start + limit
+        return {"ok": True, "members": self.members[start:end],
+                "response_metadata": {"next_cursor": str(end) if end < len(self.members) else ""}}
+
+
+class TestUserDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_loc = os.path.join(self.directory.name, "users.json")
+        self.now = 1000.
+        self.sleeps = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def users(self, api, **kwargs):
+        return UserDirectory(api, page_size=10, clock=lambda: self.now, sleep=self.sleeps.append,
+                             **kwargs)
+
+    def test_pagination(self):
+        api = FakeUsersApi(45)
+        users = self.users(api)
+        self.assertEqual(users.resolve(["user_0", "user_44", "missing"]), ("U0", "U44", None))
+        self.assertListEqual(api.calls, [None, "10", "20", "30", "40"])
+
+    def test_rate_limited(self):
+        api = FakeUsersApi(25, rate_limited_pages={10})
+        self.assertEqual(self.users(api).resolve(["user_24"]), ("U24",))
+        self.assertListEqual(self.sleeps, [2.])
+
+    def test_error(self):
+        users = self.users(lambda method, **kwargs: {"ok": False, "error": "invalid_auth"})
+        with self.assertRaises(UserLookupError):
+            users.resolve(["user_0"])
+
+    def test_cache(self):
+        api = FakeUsersApi(15)
+        self.users(api, cache_loc=self.cache_loc).resolve(["user_0"])
+        self.assertEqual(len(api.calls), 2)
+
+        # Restarting within the TTL uses the cache...
+        self.now += 100
+        api = FakeUsersApi(15)
+        self.assertEqual(self.users(api, cache_loc=self.cache_loc, ttl=200).resolve(["user_14"]),
+                         ("U14",))
+        self.assertListEqual(api.calls, [])
+
+        # ... but not after it has expired
+        self.now += 100
+        users = self.users(api, cache_loc=self.cache_loc, ttl=200)
+        self.assertDictEqual(users.ids, {})
+        users.resolve(["user_14"])
+        self.assertEqual(len(api.calls), 2)
+
+    def test_refresh_on_miss(self):
+        api = FakeUsersApi(5)
+        users = self.users(api, cache_loc=self.cache_loc)
+        users.resolve(["user_0"])
+        api.members.append({"name": "new_user", "id": "U_new"})
+
+        # Misses don't refresh the directory again straight away...
+        self.now += 1
+        self.assertEqual(users.resolve(["new_user"]), (None,))
+        self.assertEqual(len(api.calls), 1)
+
+        self.now += 100
+        self.assertEqual(users.resolve(["new_user"]), ("U_new",))
+        self.assertEqual(len(api.calls), 2)
+        self.assertEqual(self.users(api, cache_loc=self.cache_loc).resolve(["new_user"]),
+                         ("U_new",))
+
+    def test_invalid_cache(self):
+        with open(self.cache_loc, "w") as cache_file:
+            cache_file.write("{not json")
+        api = FakeUsersApi(5)
+        self.assertEqual(self.users(api, cache_loc=self.cache_loc).resolve(["user_1"]), ("U1",))